@@ -4,20 +4,32 @@ import os
 from datetime import datetime, timedelta
 from functools import wraps
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 import jwt
 from flask_api import FlaskAPI
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_mail import Mail, Message
-from flask import request, jsonify, make_response, redirect, current_app
+from flask import request, make_response, redirect, current_app, g, Response, \
+    stream_with_context, abort
 
 
 # local import
 from instance.config import app_config
+from app.passwords import PasswordHasher, PasswordHasherBusy
+from app.mailer import MailQueue
+from app.pool import PooledSQLAlchemy, bind_engines, pool_stats, pool_samples
+from app.instrumentation import instrument_queries
+from app.metrics import metrics, instrument_requests
+from app.response_cache import ResponseCache
+from app.replicas import replicas
+from app.shards import shards, ShardMoving
+from app.serializers import json_response, use_json_backend
 
 # initialize sql-alchemy
-db = SQLAlchemy()
+db = PooledSQLAlchemy()
 mail = Mail()
+mail_queue = MailQueue(mail)
+hasher = PasswordHasher()
+response_cache = ResponseCache()
 
 
 def create_app(config_name):
@@ -25,12 +37,41 @@ def create_app(config_name):
     from app.models import Shoppinglist
     from app.models import User
     from app.models import Shoppingitem
+    from app.models import TOKEN_EXPIRED_MESSAGE
+    from app.search import search_shoppinglists, search_shoppingitems
+    from app.pagination import keyset_page, decode_cursor, trim_page
+    from app.repository import item_page, create_item
+    from app.conditional import make_etag, listing_validators, not_modified, with_validators
+    from app.token_cache import TokenCache, Principal
+    from app.batch import validate_operations
+    from app.export import export, FORMATS as EXPORT_FORMATS
+    from app.importer import import_rows, read_rows, FORMATS as IMPORT_FORMATS
+    from app.serializers import USER, SHOPPINGLIST, SHOPPINGLIST_SUMMARY, \
+        SHOPPINGITEM, SHOPPINGITEM_SUMMARY
     app = FlaskAPI(__name__, instance_relative_config=True)
     app.config.from_object(app_config[config_name])
     app.config.from_pyfile('config.py')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
     mail.init_app(app)
+    hasher.init_app(app)
+    response_cache.init_app(app)
+    replicas.init_app(app)
+    shards.init_app(app)
+    use_json_backend(app.config['JSON_BACKEND'])
+    instrument_queries(app)
+    metrics.init_app(app)
+    instrument_requests(app)
+
+    def db_pool_samples():
+        """Pool metrics of this app's engines"""
+        with app.app_context():
+            return pool_samples(bind_engines(db, app))
+    metrics.set_collector('db_pool', db_pool_samples)
+    token_cache = TokenCache(maxsize=app.config['AUTH_CACHE_SIZE'],
+                             ttl=app.config['AUTH_CACHE_TTL'])
+    # app.rebalance drops the cached shards of the users it moves
+    app.extensions['token_cache'] = token_cache
 
     def authentication(funct):
         """ Handles authentication of requests using JWT tokens"""
@@ -42,22 +83,41 @@ def create_app(config_name):
                 # Get the access token from the header
                 auth_header = request.headers.get('Authorization')
                 access_token = auth_header.split(" ")[1]
+                cached = token_cache.get(access_token)
+                if cached:
+                    # token was verified recently, skip decoding and lookup
+                    g.current_user = cached[1]
+                    replicas.identify(cached[1].id)
+                    shards.identify(cached[1].id, cached[1].shard)
+                    return funct(cached[1].id, *args, **kwargs)
                 # decode the token and get the User ID
-                user_id = User.decode_token(access_token)
-                if not isinstance(user_id, str):
+                payload = User.decode_token_claims(access_token)
+                if isinstance(payload, dict):
                     #  the user is authenticated
+                    user_id = payload['sub']
+                    replicas.identify(user_id)
+                    shard, moving = shards.identify(user_id)
+                    user = User.query.get(user_id)
+                    g.current_user = None
+                    if user:
+                        g.current_user = Principal(id=user.id, email=user.email, shard=shard)
+                        # a user being moved looks their shard up on every request
+                        if not moving:
+                            token_cache.set(access_token, payload, g.current_user)
                     return funct(user_id, *args, **kwargs)
-                # user_id is a string, so the payload is an error message
-                message = user_id
+                # payload is a string, so it is an error message
+                message = payload
+                metrics.inc('jwt_decode_failures_total', (
+                    ('reason', 'expired' if message == TOKEN_EXPIRED_MESSAGE else 'invalid'),))
                 response = {
                     'message': message
                 }
-                return make_response(jsonify(response)), 408
+                return json_response(response, 408)
 
             response = {
                 'message': "Token is missing. Please place token in authorization header."
             }
-            return make_response(jsonify(response)), 401
+            return json_response(response, 401)
 
         return check
 
@@ -68,7 +128,7 @@ def create_app(config_name):
             "status": 404,
             "message": "The requested {} is not found ".format(request.url)
         }
-        return make_response(jsonify(response)), 404
+        return json_response(response, 404)
 
     @app.errorhandler(405)
     def handle_405(error):
@@ -77,7 +137,27 @@ def create_app(config_name):
             "status": 405,
             "message": "Method not allowed on {} ".format(request.url)
         }
-        return make_response(jsonify(response)), 405
+        return json_response(response, 405)
+
+    @app.errorhandler(PasswordHasherBusy)
+    def handle_hasher_busy(error):
+        """Handles a full password hashing queue"""
+        response = json_response({
+            "status": 503,
+            "message": str(error)
+        }, 503)
+        response.headers['Retry-After'] = '1'
+        return response
+
+    @app.errorhandler(ShardMoving)
+    def handle_shard_moving(error):
+        """Handles writes of a user whose lists are being moved"""
+        response = json_response({
+            "status": 503,
+            "message": str(error)
+        }, 503)
+        response.headers['Retry-After'] = '5'
+        return response
 
     @app.errorhandler(500)
     def handle_500(error):
@@ -86,13 +166,24 @@ def create_app(config_name):
             "status": 500,
             "message": "There is an error at this endpoint {}".format(request.url)
         }
-        return make_response(jsonify(response)), 500
+        return json_response(response, 500)
 
     @app.route('/')
     def dummy_index():
         """Index page"""
         return redirect('http://docs.shoppinglistapi3.apiary.io/')
 
+    @app.route('/metrics/pool', methods=['GET'])
+    def dummy_pool_metrics():
+        """Connection pool metrics of this process, by bind"""
+        return json_response(dict((bind, pool_stats(engine))
+                                  for bind, engine in bind_engines(db, app)))
+
+    @app.route('/metrics', methods=['GET'])
+    def dummy_metrics():
+        """Prometheus metrics of every worker"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
     @app.route('/auth/register/', methods=['POST', 'GET'])
     def dummy_register():
         """Handles registration of users"""
@@ -105,12 +196,12 @@ def create_app(config_name):
                 response = {
                     'message': 'Please provide a valid email address.'
                 }
-                return make_response(jsonify(response)), 403
+                return json_response(response, 403)
             elif len(password) < 6:
                 response = {
                     'message': 'Your password should be atleast 6 characters long.'
                 }
-                return make_response(jsonify(response)), 403
+                return json_response(response, 403)
 
             # Query to see if a user already exists
             user = User.query.filter_by(email=email).first()
@@ -122,26 +213,30 @@ def create_app(config_name):
                     password = request.data['password']
                     user = User(email=email, password=password)
                     user.save()
+                    # the replicas may not have the user yet, read from the primary
+                    replicas.identify(user.id)
                     response = {
                         'message': 'You have been registered successfully. Please login'
                     }
                     # return the response and a status code 201 (created)
-                    return make_response(jsonify(response)), 201
+                    return json_response(response, 201)
+                except PasswordHasherBusy:
+                    raise
                 except Exception as e:
                     # when there is an error, return error as message
                     response = {
                         'message': str(e)
                     }
-                    return make_response(jsonify(response)), 401
+                    return json_response(response, 401)
 
             # There is a user. Return a message user already exists
             response = {
                 'message': 'User already exists. Please login.'
             }
-            return make_response(jsonify(response)), 202
+            return json_response(response, 202)
 
         # request method GET
-        response = jsonify({"message": "To register,"
+        response = json_response({"message": "To register,"
                                        "send a POST request with email and password"
                                        " to /auth/register/"})
         return make_response(response), 200
@@ -159,13 +254,13 @@ def create_app(config_name):
                 response = {
                     'message': 'Please fill email field.'
                 }
-                return make_response(jsonify(response)), 400
+                return json_response(response, 400)
             elif not password:
                 # check if password is empty, status code bad request 400
                 response = {
                     'message': 'Please fill password field.'
                 }
-                return make_response(jsonify(response)), 400
+                return json_response(response, 400)
             # Query to see if a user already exists
             user = User.query.filter_by(email=email).first()
             # check is user object has sth and password is correct
@@ -174,20 +269,22 @@ def create_app(config_name):
                 access_token = user.generate_token(user.id)
                 # if an access token is generated, success status_code=OK!
                 if access_token:
+                    # keep the first requests with the new token off lagging replicas
+                    replicas.identify(user.id)
                     response = {
                         'message': "You are logged in successfully",
                         'access_token': access_token.decode()
                     }
-                    return make_response(jsonify(response)), 200
+                    return json_response(response, 200)
             else:
                 # User does not exist, status_code=UNAUTHORIZED
                 response = {
                     'message': "Invalid email or password, Please try again"
                 }
-                return make_response(jsonify(response)), 401
+                return json_response(response, 401)
         else:
             # request method GET
-            response = jsonify({"message": "To login,"
+            response = json_response({"message": "To login,"
                                            "send a POST request to /auth/login/"})
             return make_response(response), 200
 
@@ -195,17 +292,13 @@ def create_app(config_name):
     @authentication
     def dummy_user_profile(user_id):
         """ Load the user profile """
-        # Query to see if a user already exists
-        user = User.query.filter_by(id=user_id).first()
+        # the authentication decorator already loaded the user
+        user = g.current_user
         if user:
             # Load the profile
-            response = jsonify({
-                'id': user.id,
-                'email': user.email
-            })
-            return make_response(response), 200
+            return json_response(USER.dump(user))
         # user does not exist, status code= Not found
-        response = jsonify({
+        response = json_response({
             "message": "User does not exist."
         })
         return make_response(response), 404
@@ -248,17 +341,18 @@ def create_app(config_name):
                     )
                     msg = Message(recipients=[email],
                                   html=message, subject=subject)
-                    mail.send(msg)
+                    # delivered in the background, don't wait on SMTP
+                    mail_queue.enqueue(msg)
 
-                    return make_response(jsonify(response)), 200
+                    return json_response(response, 200)
                 response = {
                     'message': 'User does not exist.'
                 }
-                return make_response(jsonify(response)), 404
+                return json_response(response, 404)
             response = {
                 'message': 'Please fill email field.'
             }
-            return make_response(jsonify(response)), 400
+            return json_response(response, 400)
 
     @app.route('/user/reset/password/<email_token>', methods=['PUT'])
     def dummy_reset_password(email_token):
@@ -271,25 +365,28 @@ def create_app(config_name):
             user = User.query.filter_by(email=email).first()
             if request.method == "PUT":
                 password = str(request.data.get('password', '')) \
-                    if request.data.get('password', '') else user.password
-                if len(password) < 6:
+                    if request.data.get('password', '') else None
+                if password is not None and len(password) < 6:
                     response = {
                         'message': 'Your password should be atleast 6 characters long.'
                     }
-                    return make_response(jsonify(response)), 403
-                # Update the profile
+                    return json_response(response, 403)
+                # Update the profile, only rehash a new password
                 user.email = email
-                user.password = Bcrypt().generate_password_hash(password).decode()
+                if password is not None:
+                    user.password = hasher.hash(password)
                 user.save()
-                response = jsonify({
+                response = json_response({
                     'message': "You have successfully changed your password"
                 })
                 return make_response(response), 200
+        except PasswordHasherBusy:
+            raise
         except Exception as e:
             response = {
                 "message": str(e) + " in your token. Use the token provided."
             }
-            return make_response(jsonify(response))
+            return json_response(response)
 
     @app.route('/user', methods=['PUT'])
     @authentication
@@ -302,7 +399,7 @@ def create_app(config_name):
             email = str(request.data.get('email', '')) if str(request.data.get('email', '')) \
                 else user.email
             password = str(request.data.get('password', '')) \
-                if str(request.data.get('password', '')) else user.password
+                if str(request.data.get('password', '')) else None
 
             regex = r"(^[a-zA-Z0-9_.]+@[a-zA-Z0-9-]+\.[a-z]+$)"
             if not re.match(regex, email):
@@ -310,40 +407,57 @@ def create_app(config_name):
                 response = {
                     'message': 'Please provide a valid email address.'
                 }
-                return make_response(jsonify(response)), 403
-            elif len(password) < 6:
+                return json_response(response, 403)
+            elif password is not None and len(password) < 6:
                 response = {
                     'message': 'Your password should be atleast 6 characters long.'
                 }
-                return make_response(jsonify(response)), 403
-            # Update the profile
+                return json_response(response, 403)
+            # Update the profile, only rehash a new password
             user.email = email
-            user.password = Bcrypt().generate_password_hash(password).decode()
+            if password is not None:
+                user.password = hasher.hash(password)
             user.save()
-            response = jsonify({
-                'id': user.id,
-                'email': user.email,
-                'message': "Successfully updated profile"
-            })
-            return make_response(response), 200
+            # cached principals still carry the old email
+            token_cache.invalidate_user(user.id)
+            response = USER.dump(user)
+            response['message'] = "Successfully updated profile"
+            return json_response(response)
         else:
             # user does not exist, status code= Not found
-            response = jsonify({
+            response = json_response({
                 "message": "User does not exist."
             })
             return make_response(response), 404
 
+    def with_summaries(user_id, shoppinglists):
+        """Add the item totals of every serialized list, computed in one query"""
+        summaries = Shoppingitem.summarize(
+            user_id, [shoppinglist['id'] for shoppinglist in shoppinglists])
+        for shoppinglist in shoppinglists:
+            shoppinglist['summary'] = summaries[shoppinglist['id']]
+        return shoppinglists
+
+    def summarized_page(user_id, shoppinglists, etag):
+        """Add the totals to a page of lists, returns the page ETag covering them"""
+        with_summaries(user_id, shoppinglists)
+        totals = [(shoppinglist['id'], sorted(shoppinglist['summary'].items()))
+                  for shoppinglist in shoppinglists]
+        return make_etag(etag, totals)
+
     @app.route('/shoppinglists/', methods=['GET'])
     @authentication
+    @response_cache.cached
     def dummy_shoppinglists_get(user_id):
         """ Handles GET method"""
         if request.method == "GET":
             # GET request
             # initialize search query, limit and page_no
             search_query = request.args.get("q")
+            include_summary = 'summary' in request.args.get('include', '').split(',')
             limit = request.args.get('limit')
             page_no = request.args.get('page')
-            results = []
+            cursor = request.args.get('cursor')
 
             if page_no:
                 try:
@@ -352,12 +466,12 @@ def create_app(config_name):
                         response = {
                             "message": "Page number must be a positive integer"
                         }
-                        return make_response(jsonify(response)), 400
+                        return json_response(response, 400)
                 except Exception:
                     response = {
                         "message": "Invalid page number"
                     }
-                    return make_response(jsonify(response)), 400
+                    return json_response(response, 400)
             else:
                 # default page number if no page is specified
                 page_no = 1
@@ -369,53 +483,81 @@ def create_app(config_name):
                         response = {
                             "message": "Limit value must be a positive integer"
                         }
-                        return make_response(jsonify(response)), 400
+                        return json_response(response, 400)
                 except Exception:
                     response = {
                         "message": "Invalid limit value"
                     }
-                    return make_response(jsonify(response)), 400
+                    return json_response(response, 400)
             else:
                 # default limit value if no limit is specified
                 limit = 4
 
             if search_query:
                 # ?q is supplied sth
-                search_results = Shoppinglist.query.filter(Shoppinglist.name.ilike(
-                    '%' + search_query + '%')).filter_by(created_by=user_id).all()
+                search_results = search_shoppinglists(
+                    user_id, search_query, page_no, limit)
                 if search_results:
                     # search_results contain sth
-                    for shopping in search_results:
-
-                        item = {
-                            'id': shopping.id,
-                            'name': shopping.name,
-                            'date_created': shopping.date_created,
-                            'date_modified': shopping.date_modified,
-                            'created_by': user_id
-                        }
-                        results.append(item)
-                    response = jsonify(results)
-                    return make_response(response), 200
+                    results = SHOPPINGLIST.dump_many(search_results)
+                    if include_summary:
+                        with_summaries(user_id, results)
+                    return json_response(results)
                 # search_results does not contain anything, status code=Not found
                 response = {
                     'message': "Shopping list name does not exist"
                 }
-                return make_response(jsonify(response)), 404
+                return json_response(response, 404)
+            # unchanged lists are answered without fetching the page, the
+            # write counter is read first so a racing write can only make
+            # the ETag newer than the rows
+            version = response_cache.version(user_id)
+            etag, last_modified = listing_validators(
+                Shoppinglist, Shoppinglist.created_by == user_id,
+                Shoppinglist.deleted_at.is_(None))
+            # dates have one second resolution, the counter catches quicker edits
+            etag = make_etag(version, etag)
+            if include_summary:
+                # the totals change with the items, not the lists, so only
+                # the ETag over the page's own totals can validate them
+                last_modified = None
             else:
-                # no search query, return paginated shopping list
-                all_shopping_lists = []
-                shoppinglists = Shoppinglist.query.filter_by(
-                    created_by=user_id).paginate(page_no, limit)
-
-                # shoppinglists contains sth
-                for item in shoppinglists.items:
-                    obj = {
-                        'id': item.id,
-                        'name': item.name,
-                        'date_created': item.date_created
+                unchanged = not_modified(etag, last_modified)
+                if unchanged:
+                    return unchanged
+
+            if cursor is not None:
+                # cursor supplied, return the page after it
+                try:
+                    shoppinglists, next_cursor = keyset_page(
+                        Shoppinglist.get_all_summaries(user_id),
+                        Shoppinglist, cursor, limit)
+                except ValueError:
+                    response = {
+                        "message": "Invalid cursor"
                     }
-                    all_shopping_lists.append(obj)
+                    return json_response(response, 400)
+                all_shopping_lists = SHOPPINGLIST_SUMMARY.dump_rows(shoppinglists)
+                if include_summary:
+                    etag = summarized_page(user_id, all_shopping_lists, etag)
+                    unchanged = not_modified(etag, last_modified)
+                    if unchanged:
+                        return unchanged
+                response = {
+                    'shopping_lists': all_shopping_lists if all_shopping_lists else "You have no shopping lists",
+                    'next_cursor': next_cursor
+                }
+                return with_validators(json_response(response), etag, last_modified)
+            else:
+                # no search query, return paginated shopping list
+                shoppinglists = Shoppinglist.get_all_summaries(
+                    user_id).paginate(page_no, limit)
+                all_shopping_lists = SHOPPINGLIST_SUMMARY.dump_rows(shoppinglists.items)
+                if include_summary:
+                    etag = summarized_page(user_id, all_shopping_lists, etag)
+                    unchanged = not_modified(etag, last_modified)
+                    if unchanged:
+                        return unchanged
                 next_page = 'None'
                 prev_page = 'None'
                 if shoppinglists.has_next:
@@ -429,7 +571,7 @@ def create_app(config_name):
                     'previous_page': prev_page,
                     'next_page': next_page
                 }
-                return make_response(jsonify(response)), 200
+                return with_validators(json_response(response), etag, last_modified)
 
     @app.route('/shoppinglists/', methods=['POST'])
     @authentication
@@ -443,33 +585,22 @@ def create_app(config_name):
                 # there is a name,
                 # Check for special characters
                 if re.match("^[a-zA-Z0-9 _]*$", name):
-                    # check if list exists
-                    if Shoppinglist.query.filter(
-                            func.lower(Shoppinglist.name) == name.lower(),
-                            Shoppinglist.created_by == user_id).first() is not None:
-                        # list exists, status code= Found
-                        response = jsonify({
+                    shoppinglist = Shoppinglist(
+                        name=name, created_by=user_id)
+                    try:
+                        shoppinglist.save()
+                    except IntegrityError:
+                        # unique name index rejected it, status code= Found
+                        db.session.rollback()
+                        response = json_response({
                             'message': "List name already exists. Please use different name"
                         })
                         return make_response(response), 302
-
-                    # list name does not exist, save
-                    shoppinglist = Shoppinglist(
-                        name=name, created_by=user_id)
-                    shoppinglist.save()
-                    response = jsonify({
-                        'id': shoppinglist.id,
-                        'name': shoppinglist.name,
-                        'date_created': shoppinglist.date_created,
-                        'date_modified': shoppinglist.date_modified,
-                        'created_by': user_id
-                    })
-                    response.status_code = 201
-                    return response
+                    return json_response(SHOPPINGLIST.dump(shoppinglist), 201)
 
                 # special characters exists bad request
                 else:
-                    response = jsonify({
+                    response = json_response({
                         'message': "No special characters in name"
                     })
                     return make_response(response), 400
@@ -478,25 +609,74 @@ def create_app(config_name):
             response = {
                 "message": "Please enter a shopping list name"
             }
-            return make_response(jsonify(response)), 400
+            return json_response(response, 400)
+
+    @app.route('/shoppinglists/export', methods=['GET'])
+    @authentication
+    def dummy_export(user_id):
+        """ Endpoint streams every shopping list and item of the user"""
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            response = {
+                'message': 'Export format must be ndjson or csv'
+            }
+            return json_response(response, 400)
+        mimetype, filename = EXPORT_FORMATS[export_format]
+        response = Response(stream_with_context(
+            export(user_id, export_format, app.config['EXPORT_BATCH_SIZE'])),
+                            mimetype=mimetype)
+        response.headers['Content-Disposition'] = 'attachment; filename={}'.format(filename)
+        return response
+
+    @app.route('/shoppinglists/import', methods=['POST'])
+    @authentication
+    def dummy_import(user_id):
+        """ Endpoint imports shopping lists and items from a CSV or NDJSON file"""
+        upload = None
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+        import_format = request.args.get('format')
+        if not import_format:
+            filename = upload.filename if upload and upload.filename else ''
+            import_format = 'ndjson' if filename.endswith(('.ndjson', '.json')) else 'csv'
+        if import_format not in IMPORT_FORMATS:
+            response = {
+                'message': 'Import format must be csv or ndjson'
+            }
+            return json_response(response, 400)
+        try:
+            start_row = int(request.args.get('start_row', 0))
+            if start_row < 0:
+                raise ValueError(start_row)
+        except ValueError:
+            response = {
+                'message': 'Invalid start row'
+            }
+            return json_response(response, 400)
+        # read the upload a line at a time instead of buffering it
+        rows = read_rows(upload.stream if upload else request.stream, import_format)
+        return json_response(import_rows(
+            user_id, rows, app.config['IMPORT_CHUNK_SIZE'], start_row))
 
     @app.route('/shoppinglists/<int:sl_id>', methods=['PUT', 'GET', 'DELETE'])
     @authentication
     def dummy_shoppinglist_edit(user_id, sl_id):
         """Handles shopping list GETTING, DELETE and EDIT"""
+        # the write counter goes in the ETag, read before the row
+        version = response_cache.version(user_id) if request.method == 'GET' else None
         # retrieve a shoppinglist by it's ID
-        shoppinglist = Shoppinglist.query.filter_by(
-            id=sl_id, created_by=user_id).first()
+        shoppinglist = Shoppinglist.find(sl_id, user_id)
         if not shoppinglist:
             # No shopping list ,raise error 404 status code not found
             response = {
                 'message': "No such shoppinglist"
             }
-            return make_response(jsonify(response)), 404
+            return json_response(response, 404)
         if request.method == 'DELETE':
+            name = shoppinglist.name
             shoppinglist.delete()
             return {
-                "message": "Shopping list {} deleted successfully".format(shoppinglist.name)
+                "message": "Shopping list {} deleted successfully".format(name)
             }, 200
         elif request.method == 'PUT':
             name = str(request.data.get('name', ''))
@@ -504,28 +684,19 @@ def create_app(config_name):
                 # there is a name
                 # Check for special characters
                 if re.match("^[a-zA-Z0-9 _]*$", name):
-                    # Check if name exists in db
-                    all_shoppinglist = Shoppinglist.query.filter_by(
-                        created_by=user_id).all()
-                    for same_list_name in all_shoppinglist:
-                        if name.lower() == same_list_name.name.lower():
-                            response = jsonify({
-                                'message': "List name already exists. Please use different name"
-                            })
-                            return make_response(response), 409
                     shoppinglist.name = name
-                    shoppinglist.save()
-                    response = jsonify({
-                        'id': shoppinglist.id,
-                        'name': shoppinglist.name,
-                        'date_created': shoppinglist.date_created,
-                        'date_modified': shoppinglist.date_modified,
-                        'created_by': shoppinglist.created_by
-                    })
-                    response.status_code = 200
-                    return response
+                    try:
+                        shoppinglist.save()
+                    except IntegrityError:
+                        # unique name index rejected it
+                        db.session.rollback()
+                        response = json_response({
+                            'message': "List name already exists. Please use different name"
+                        })
+                        return make_response(response), 409
+                    return json_response(SHOPPINGLIST.dump(shoppinglist))
                 # special characters exists, bad request
-                response = jsonify({
+                response = json_response({
                     'message': "No special characters in name"
                 })
                 return make_response(response), 400
@@ -533,20 +704,36 @@ def create_app(config_name):
             response = {
                 "message": "Please enter a shopping list name"
             }
-            return make_response(jsonify(response)), 400
+            return json_response(response, 400)
         # GET
-        response = jsonify({
-            'id': shoppinglist.id,
-            'name': shoppinglist.name,
-            'date_created': shoppinglist.date_created,
-            'date_modified': shoppinglist.date_modified,
-            'created_by': shoppinglist.created_by
-        })
-        response.status_code = 200
-        return response
+        etag = make_etag(version, shoppinglist.id, shoppinglist.name,
+                         shoppinglist.date_modified)
+        unchanged = not_modified(etag, shoppinglist.date_modified)
+        if unchanged:
+            return unchanged
+        return with_validators(json_response(SHOPPINGLIST.dump(shoppinglist)),
+                               etag, shoppinglist.date_modified)
+
+    @app.route('/shoppinglists/<int:sl_id>/summary', methods=['GET'])
+    @authentication
+    def dummy_shoppinglist_summary(user_id, sl_id):
+        """ Endpoint handles the item totals of a shopping list"""
+        # retrieve a shoppinglist by it's ID
+        shoppinglist = Shoppinglist.find(sl_id, user_id)
+        if not shoppinglist:
+            # No shopping list ,raise error 404 status code not found
+            response = {
+                'message': "No such shoppinglist"
+            }
+            return json_response(response, 404)
+        response = Shoppingitem.summarize(user_id, [sl_id])[sl_id]
+        response['id'] = shoppinglist.id
+        response['name'] = shoppinglist.name
+        return json_response(response)
 
     @app.route('/shoppinglists/<int:sl_id>/items', methods=['GET'])
     @authentication
+    @response_cache.cached
     def dummy_shoppingitems_get(user_id, sl_id):
         """ Endpoint handles getting of shopping items"""
         if request.method == 'GET':
@@ -555,16 +742,10 @@ def create_app(config_name):
             search_query = request.args.get("q")
             limit = request.args.get('limit')
             page_no = request.args.get('page')
-            results = []
-            # retrieve a shoppinglist by it's ID
-            shoppinglist = Shoppinglist.query.filter_by(
-                id=sl_id, created_by=user_id).first()
-            if not shoppinglist:
-                # No shopping list ,raise error 404 status code not found
-                response = {
-                    'message': "No such shoppinglist"
-                }
-                return make_response(jsonify(response)), 404
+            cursor = request.args.get('cursor')
+            no_such_list = {
+                'message': "No such shoppinglist"
+            }
 
             if page_no:
                 try:
@@ -573,12 +754,12 @@ def create_app(config_name):
                         response = {
                             "message": "Page number must be a positive integer"
                         }
-                        return make_response(jsonify(response)), 400
+                        return json_response(response, 400)
                 except Exception:
                     response = {
                         "message": "Invalid page number"
                     }
-                    return make_response(jsonify(response)), 400
+                    return json_response(response, 400)
             else:
                 # default page number if no page is specified
                 page_no = 1
@@ -590,69 +771,82 @@ def create_app(config_name):
                         response = {
                             "message": "Limit value must be a positive integer"
                         }
-                        return make_response(jsonify(response)), 400
+                        return json_response(response, 400)
                 except Exception:
                     response = {
                         "message": "Invalid limit value"
                     }
-                    return make_response(jsonify(response)), 400
+                    return json_response(response, 400)
             else:
                 # default limit value if no limit is specified
                 limit = 7
 
             if search_query:
                 # ?q is supplied sth
-                search_results = Shoppingitem.query.filter(
-                    Shoppingitem.name.ilike('%' + search_query + '%')).filter_by(
-                        in_shoppinglist=sl_id, created_by=user_id).all()
+                if not Shoppinglist.find(sl_id, user_id):
+                    # No shopping list ,raise error 404 status code not found
+                    return json_response(no_such_list, 404)
+                search_results = search_shoppingitems(
+                    user_id, sl_id, search_query, page_no, limit)
                 if search_results:
                     # search_results contain sth
-                    for shoppingitem in search_results:
-
-                        item = {
-                            'id': shoppingitem.id,
-                            'name': shoppingitem.name,
-                            'price': shoppingitem.price,
-                            'quantity': shoppingitem.quantity,
-                            'date_created': shoppingitem.date_created,
-                            'date_modified': shoppingitem.date_modified,
-                            'in_shoppinglist': shoppingitem.in_shoppinglist,
-                            'created_by': user_id
-                        }
-                        results.append(item)
-                    response = jsonify(results)
-                    return make_response(response), 200
+                    return json_response(SHOPPINGITEM.dump_many(search_results))
 
                 # search_results does not contain anything, status code=Not found
                 response = {
                     'message': "Shopping item name does not exist"
                 }
-                return make_response(jsonify(response)), 404
+                return json_response(response, 404)
+
+            # the write counter goes in the ETag, read before the rows
+            version = response_cache.version(user_id)
+            if cursor is not None:
+                # cursor supplied, fetch one extra row to learn if there is a next page
+                try:
+                    items = item_page(user_id, sl_id, limit + 1,
+                                      after_id=decode_cursor(cursor))
+                except ValueError:
+                    response = {
+                        "message": "Invalid cursor"
+                    }
+                    return json_response(response, 400)
+            else:
+                items = item_page(user_id, sl_id, limit, offset=(page_no - 1) * limit)
+            if not items.found:
+                # No shopping list ,raise error 404 status code not found
+                return json_response(no_such_list, 404)
+            if not items.items and page_no > 1 and cursor is None:
+                # past the last page
+                abort(404)
+
+            # the page came with its validators, unchanged items are not serialized
+            etag = make_etag(version, items.total, items.last_id, items.last_modified)
+            last_modified = items.last_modified
+            unchanged = not_modified(etag, last_modified)
+            if unchanged:
+                return unchanged
+
+            if cursor is not None:
+                shoppingitems, next_cursor = trim_page(items.items, limit)
+                all_shopping_items = SHOPPINGITEM_SUMMARY.dump_rows(shoppingitems)
+                response = {
+                    'shopping_items': all_shopping_items if all_shopping_items else "You have no shopping items",
+                    'next_cursor': next_cursor
+                }
+                return with_validators(json_response(response), etag, last_modified)
 
             else:
                 # no search query, return paginated shopping list
-                all_shopping_items = []
-                shoppingitems = Shoppingitem.query.filter_by(
-                    created_by=user_id, in_shoppinglist=sl_id).paginate(page_no, limit)
-
-                # shoppingitems contains sth
-                for item in shoppingitems.items:
-                    obj = {
-                        'id': item.id,
-                        'name': item.name,
-                        'price': item.price,
-                        'quantity': item.quantity
-                    }
-                    all_shopping_items.append(obj)
+                all_shopping_items = SHOPPINGITEM_SUMMARY.dump_rows(items.items)
                 next_page = 'None'
                 prev_page = 'None'
-                if shoppingitems.has_next:
+                if page_no * limit < items.total:
                     next_page = '/shoppinglists/{}/items?limit={}&page={}'.format(
                         int(sl_id),
                         str(limit),
                         str(page_no + 1)
                     )
-                if shoppingitems.has_prev:
+                if page_no > 1:
                     prev_page = '/shoppinglists/{}/items?limit={}&page={}'.format(
                         int(sl_id),
                         str(limit),
@@ -663,7 +857,7 @@ def create_app(config_name):
                     'previous_page': prev_page,
                     'next_page': next_page
                 }
-                return make_response(jsonify(response)), 200
+                return with_validators(json_response(response), etag, last_modified)
 
     @app.route('/shoppinglists/<int:sl_id>/items', methods=['POST'])
     @authentication
@@ -674,16 +868,6 @@ def create_app(config_name):
             price = request.data.get('price')
             quantity = request.data.get('quantity')
 
-            # retrieve a shoppinglist by it's ID
-            shoppinglist = Shoppinglist.query.filter_by(
-                id=sl_id, created_by=user_id).first()
-            if not shoppinglist:
-                # No shopping list ,raise error 404 status code not found
-                response = {
-                    'message': "No such shoppinglist"
-                }
-                return make_response(jsonify(response)), 404
-
             # check if price is empty or not
             if price:
                 try:
@@ -692,17 +876,17 @@ def create_app(config_name):
                         response = {
                             "message": "Price value must be a positive integer"
                         }
-                        return make_response(jsonify(response)), 400
+                        return json_response(response, 400)
                 except Exception:
                     response = {
                         "message": "Invalid price value"
                     }
-                    return make_response(jsonify(response)), 400
+                    return json_response(response, 400)
             else:
                 response = {
                     "message": "Please provide a price value"
                 }
-                return make_response(jsonify(response)), 400
+                return json_response(response, 400)
 
             # check if quantity is empty or not
             if quantity:
@@ -712,51 +896,41 @@ def create_app(config_name):
                         response = {
                             "message": "Quantity value must be a positive integer"
                         }
-                        return make_response(jsonify(response)), 400
+                        return json_response(response, 400)
                 except Exception:
                     response = {
                         "message": "Invalid quantity value"
                     }
-                    return make_response(jsonify(response)), 400
+                    return json_response(response, 400)
             else:
                 response = {
                     "message": "Please provide a quantity value"
                 }
-                return make_response(jsonify(response)), 400
+                return json_response(response, 400)
 
             if name:
                 # there is a name,
                 # Check for special characters
                 if re.match("^[a-zA-Z0-9 _]*$", name):
-                    # check if item exists
-                    all_shoppinglist_items = Shoppingitem.query.filter_by(
-                        in_shoppinglist=sl_id, created_by=user_id).all()
-                    for same_item in all_shoppinglist_items:
-                        if name.lower() == same_item.name.lower():
-                            response = jsonify({
-                                'message': "Item name already exists. Please use different name"
-                            })
-                            return make_response(response), 409
-
-                    # item does not exist, create and save the item
-                    shoppingitem = Shoppingitem(
-                        name=name, price=price, quantity=quantity,
-                        in_shoppinglist=sl_id, created_by=user_id)
-                    shoppingitem.save()
-                    response = jsonify({
-                        "id": shoppingitem.id,
-                        "name": shoppingitem.name,
-                        "price": shoppingitem.price,
-                        "quantity": shoppingitem.quantity,
-                        "date_created": shoppingitem.date_created,
-                        "date_modified": shoppingitem.date_modified,
-                        "in_shoppinglist": sl_id,
-                        "created_by": user_id
-                    })
-                    return make_response(response), 201
+                    try:
+                        # the insert only happens if the user owns the list
+                        shoppingitem = create_item(user_id, sl_id, name, price, quantity)
+                    except IntegrityError:
+                        # unique name index rejected it
+                        response = json_response({
+                            'message': "Item name already exists. Please use different name"
+                        })
+                        return make_response(response), 409
+                    if shoppingitem is None:
+                        # No shopping list ,raise error 404 status code not found
+                        response = {
+                            'message': "No such shoppinglist"
+                        }
+                        return json_response(response, 404)
+                    return json_response(SHOPPINGITEM.dump(shoppingitem), 201)
                 # special characters exists, bad request
                 else:
-                    response = jsonify({
+                    response = json_response({
                         'message': "No special characters in name"
                     })
                     return make_response(response), 400
@@ -765,21 +939,75 @@ def create_app(config_name):
             response = {
                 'message': 'Please provide an item name.'
             }
-            return make_response(jsonify(response)), 400
+            return json_response(response, 400)
+
+    @app.route('/shoppinglists/<int:sl_id>/items/batch', methods=['POST'])
+    @authentication
+    def dummy_shoppingitems_batch(user_id, sl_id):
+        """ Endpoint handles creating, editing and deleting many items at once"""
+        operations = request.data.get('operations') \
+            if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            response = {
+                'message': 'Please provide a list of operations.'
+            }
+            return json_response(response, 400)
+        if len(operations) > app.config['ITEM_BATCH_LIMIT']:
+            response = {
+                'message': 'A batch can have at most {} operations.'.format(
+                    app.config['ITEM_BATCH_LIMIT'])
+            }
+            return json_response(response, 400)
+
+        # retrieve a shoppinglist by it's ID
+        shoppinglist = Shoppinglist.find(sl_id, user_id)
+        if not shoppinglist:
+            # No shopping list ,raise error 404 status code not found
+            response = {
+                'message': "No such shoppinglist"
+            }
+            return json_response(response, 404)
+
+        operations, errors = validate_operations(operations, sl_id, user_id)
+        if errors:
+            # nothing is written unless every operation is valid
+            status = 409 if all(error['message'].startswith('Item name already')
+                                for error in errors) else 400
+            return json_response({'errors': errors}, status)
+        try:
+            creates, updates, deletes = Shoppingitem.bulk_write(
+                sl_id, user_id, operations)
+        except IntegrityError:
+            response = {
+                'message': "Item name already exists. Please use different name"
+            }
+            return json_response(response, 409)
+
+        created = []
+        if creates:
+            created = Shoppingitem.query.filter(
+                Shoppingitem.in_shoppinglist == sl_id,
+                func.lower(Shoppingitem.name).in_(
+                    [item['name'].lower() for item in creates])).all()
+        response = {
+            'created': SHOPPINGITEM.dump_many(created),
+            'updated': [item['id'] for item in updates],
+            'deleted': deletes
+        }
+        return json_response(response, 200)
 
     @app.route('/shoppinglists/<int:sl_id>/items/<int:tid>', methods=['PUT'])
     @authentication
     def dummy_item_edit(user_id, tid, sl_id):
         """Endpoint handles editing a shopping item"""
         # retrieve  item using its ID
-        item = Shoppingitem.query.filter_by(
-            id=tid, in_shoppinglist=sl_id, created_by=user_id).first()
+        item = Shoppingitem.find(tid, sl_id, user_id)
         if not item:
             # if empty raise a 404,Not found error. No item with id=tid
             response = {
                 'message': "No such item"
             }
-            return make_response(jsonify(response)), 404
+            return json_response(response, 404)
         if request.method == 'PUT':
             # obtain new name/price/quatity from request
             name = str(request.data.get('name', '')) if str(request.data.get('name', '')) \
@@ -791,33 +1019,21 @@ def create_app(config_name):
 
             # Check for special characters
             if re.match("^[a-zA-Z0-9 _]*$", name):
-                # Check if name exists in db
-                all_shoppinglist_items = Shoppingitem.query.filter_by(
-                    in_shoppinglist=sl_id, created_by=user_id).all()
-                for same_item in all_shoppinglist_items:
-                    if name.lower() == same_item.name.lower() and tid != same_item.id:
-                        response = jsonify({
-                            'message': "Item name already exists. Please use different name"
-                        })
-                        return make_response(response), 409
-
                 item.name = name
                 item.price = price
                 item.quantity = quantity
-                item.save()
-                response = jsonify({
-                    "id": item.id,
-                    "name": item.name,
-                    "price": item.price,
-                    "quantity": item.quantity,
-                    "date_created": item.date_created,
-                    "date_modified": item.date_modified,
-                    "in_shoppinglist": item.in_shoppinglist,
-                    "created_by": item.created_by
-                })
-                return make_response(response), 200
+                try:
+                    item.save()
+                except IntegrityError:
+                    # unique name index rejected it
+                    db.session.rollback()
+                    response = json_response({
+                        'message': "Item name already exists. Please use different name"
+                    })
+                    return make_response(response), 409
+                return json_response(SHOPPINGITEM.dump(item))
             # special characters exists, bad request
-            response = jsonify({
+            response = json_response({
                 'message': "No special characters in name"
             })
             return make_response(response), 400
@@ -826,36 +1042,33 @@ def create_app(config_name):
     @authentication
     def dummy_item_delete_get(user_id, tid, sl_id):
         """Endpoint handles delete and get a shopping item"""
+        # the write counter goes in the ETag, read before the row
+        version = response_cache.version(user_id) if request.method == 'GET' else None
         # retrieve  item using its ID
-        item = Shoppingitem.query.filter_by(
-            id=tid, in_shoppinglist=sl_id, created_by=user_id).first()
+        item = Shoppingitem.find(tid, sl_id, user_id)
         if not item:
             # if empty raise a 404,Not found error. No item with id=tid
             response = {
                 'message': "No such item"
             }
-            return make_response(jsonify(response)), 404
+            return json_response(response, 404)
 
         # handle DELETE
         elif request.method == 'DELETE':
             item.delete()
-            response = jsonify({
+            response = json_response({
                 'message': "item {} deleted".format(item.name)
             })
             return make_response(response), 200
 
         # handle GET
         elif request.method == 'GET':
-            response = jsonify({
-                "id": item.id,
-                "name": item.name,
-                "price": item.price,
-                "quantity": item.quantity,
-                "date_created": item.date_created,
-                "date_modified": item.date_modified,
-                "in_shoppinglist": item.in_shoppinglist,
-                "created_by": item.created_by
-            })
-            return make_response(response), 200
+            etag = make_etag(version, item.id, item.name, item.price, item.quantity,
+                             item.date_modified)
+            unchanged = not_modified(etag, item.date_modified)
+            if unchanged:
+                return unchanged
+            return with_validators(json_response(SHOPPINGITEM.dump(item)),
+                                   etag, item.date_modified)
 
     return app
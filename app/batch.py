@@ -0,0 +1,100 @@
+""" app/batch.py
+
+Validation of batched shopping item operations. Every operation is checked
+in one pass so a client gets all of its errors at once, and names are checked
+against the shopping list with a single query. Names are checked against
+the state the whole batch leaves behind, so items can swap names.
+"""
+import re
+from sqlalchemy import func, or_
+from app.models import Shoppingitem
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+def parse_number(value, field):
+    """Parse a price or quantity, returns (number, error message)"""
+    try:
+        number = float(value)
+    except Exception:
+        return None, "Invalid {} value".format(field)
+    if number < 1:
+        return None, "{} value must be a positive integer".format(field.capitalize())
+    return number, None
+
+
+def parse_operation(operation):
+    """Validate a single operation, returns (normalized operation, error message)"""
+    if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+        return None, "Operation must be one of create, update or delete"
+    parsed = {'op': operation['op']}
+    if parsed['op'] != 'create':
+        try:
+            parsed['id'] = int(operation.get('id'))
+        except Exception:
+            return None, "Please provide an item id"
+        if parsed['op'] == 'delete':
+            return parsed, None
+
+    if operation.get('name') or parsed['op'] == 'create':
+        name = str(operation.get('name')) if operation.get('name') else None
+        if not name:
+            return None, "Please provide an item name."
+        if not re.match("^[a-zA-Z0-9 _]*$", name):
+            return None, "No special characters in name"
+        parsed['name'] = name
+    for field in ('price', 'quantity'):
+        if operation.get(field) or parsed['op'] == 'create':
+            if not operation.get(field):
+                return None, "Please provide a {} value".format(field)
+            parsed[field], error = parse_number(operation.get(field), field)
+            if error:
+                return None, error
+    return parsed, None
+
+
+def validate_operations(operations, sl_id, user_id):
+    """Validate a batch against the shopping list, returns (operations, errors)"""
+    parsed, errors = [], []
+    for index, operation in enumerate(operations):
+        operation, error = parse_operation(operation)
+        if error:
+            errors.append({'index': index, 'message': error})
+        parsed.append(operation)
+    if errors:
+        return parsed, errors
+
+    ids = set(op['id'] for op in parsed if 'id' in op)
+    names = set(op['name'].lower() for op in parsed if 'name' in op)
+    # one query fetches the items touched by id and the items holding a new name
+    existing = Shoppingitem.query.with_entities(
+        Shoppingitem.id, Shoppingitem.name).filter(
+            Shoppingitem.in_shoppinglist == sl_id,
+            Shoppingitem.created_by == user_id,
+            or_(Shoppingitem.id.in_(ids or [-1]),
+                func.lower(Shoppingitem.name).in_(names or ['']))).all()
+    existing_ids = set(row.id for row in existing)
+    # names that stay taken once the batch is applied
+    released = set(op['id'] for op in parsed
+                   if op['op'] == 'delete' or (op['op'] == 'update' and 'name' in op))
+    taken = dict((row.name.lower(), row.id) for row in existing
+                 if row.id not in released)
+
+    seen, seen_ids = set(), set()
+    for index, operation in enumerate(parsed):
+        if 'id' in operation and operation['id'] not in existing_ids:
+            errors.append({'index': index, 'message': "No such item"})
+        elif operation.get('id') in seen_ids:
+            errors.append({'index': index, 'message':
+                           "Operation repeats item id {}".format(operation['id'])})
+        elif 'name' in operation:
+            name = operation['name'].lower()
+            if name in seen or name in taken:
+                errors.append({
+                    'index': index,
+                    'message': "Item name already exists. Please use different name"
+                })
+            seen.add(name)
+        if 'id' in operation:
+            seen_ids.add(operation['id'])
+    return parsed, errors
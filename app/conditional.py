@@ -0,0 +1,52 @@
+""" app/conditional.py
+
+Conditional GET. Responses carry a weak ETag and a Last-Modified header
+derived from date_modified, and a client whose copy is still current gets a
+304 Not Modified before anything is serialized. Listings take their
+validators from one aggregate over the user's rows rather than from the page,
+so answering a poll costs a single indexed query.
+"""
+import hashlib
+from flask import request, Response
+from sqlalchemy import func
+from app import db
+
+
+def make_etag(*parts):
+    """Opaque entity tag over the given values"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+
+def listing_validators(model, *criteria):
+    """ETag and Last-Modified of every row matching criteria"""
+    count, last_id, last_modified = db.session.query(
+        func.count(model.id), func.max(model.id), func.max(model.date_modified)
+    ).filter(*criteria).one()
+    # a create raises the max id, a delete lowers the count, an edit bumps date_modified
+    return make_etag(count, last_id, last_modified), last_modified
+
+
+def not_modified(etag, last_modified):
+    """Return a 304 response if the client's copy is current, otherwise None"""
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        # HTTP dates have whole second precision
+        fresh = last_modified.replace(microsecond=0) <= \
+            request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    """Attach the ETag and Last-Modified headers to a response"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # responses are per user, clients must revalidate before reuse
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
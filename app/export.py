@@ -0,0 +1,87 @@
+""" app/export.py
+
+Streaming export of every shopping list and item of a user. One ordered
+outer join is read through a server side cursor with yield_per and written
+out a batch at a time, so memory stays flat however many items a user has
+and the first batch is sent as soon as it is fetched.
+"""
+import csv
+from sqlalchemy import and_
+from app import db, serializers
+from app.models import Shoppinglist, Shoppingitem
+from app.serializers import SHOPPINGLIST_EXPORT, SHOPPINGITEM_EXPORT, format_date
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+LIST_COLUMNS = len(SHOPPINGLIST_EXPORT.fields)
+
+CSV_HEADER = ['list_id', 'list_name', 'list_date_created', 'list_date_modified',
+              'item_id', 'item_name', 'price', 'quantity', 'item_date_created',
+              'item_date_modified']
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'shoppinglists.ndjson'),
+    'csv': ('text/csv', 'shoppinglists.csv'),
+}
+
+
+def export_rows(user_id, batch_size):
+    """Every list of a user joined to its items, ordered by list then item"""
+    columns = SHOPPINGLIST_EXPORT.columns(Shoppinglist) + \
+        SHOPPINGITEM_EXPORT.columns(Shoppingitem)
+    return db.session.query(*columns).outerjoin(
+        Shoppingitem, and_(Shoppingitem.in_shoppinglist == Shoppinglist.id,
+                           Shoppingitem.created_by == user_id)
+    ).filter(
+        Shoppinglist.created_by == user_id,
+        Shoppinglist.deleted_at.is_(None)
+    ).order_by(Shoppinglist.id, Shoppingitem.id).yield_per(batch_size)
+
+
+def ndjson_lines(rows, batch_size):
+    """A shoppinglist line per list followed by a shoppingitem line per item"""
+    chunk = []
+    current = None
+    for row in rows:
+        if row[0] != current:
+            current = row[0]
+            shoppinglist = SHOPPINGLIST_EXPORT.dump_row(row[:LIST_COLUMNS])
+            shoppinglist['type'] = 'shoppinglist'
+            chunk.append(serializers.dumps(shoppinglist))
+        if row[LIST_COLUMNS] is not None:
+            item = SHOPPINGITEM_EXPORT.dump_row(row[LIST_COLUMNS:])
+            item['type'] = 'shoppingitem'
+            item['in_shoppinglist'] = current
+            chunk.append(serializers.dumps(item))
+        if len(chunk) >= batch_size:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
+
+
+def csv_lines(rows, batch_size):
+    """A header, then a row per item, lists without items get one empty row"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for row in rows:
+        writer.writerow([format_date(value) if hasattr(value, 'utctimetuple') else value
+                         for value in row])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export(user_id, export_format, batch_size):
+    """Generate the export of a user in export_format, ndjson or csv"""
+    rows = export_rows(user_id, batch_size)
+    if export_format == 'csv':
+        return csv_lines(rows, batch_size)
+    return ndjson_lines(rows, batch_size)
@@ -0,0 +1,216 @@
+""" app/importer.py
+
+Bulk import of shopping lists and items from CSV or NDJSON. The file is read
+a row at a time and written in chunks, each chunk in its own transaction
+with bulk inserts, so a large file never sits in memory and a bad chunk
+only loses itself. Lists and items that already exist are skipped, which
+makes re-running an interrupted import safe; start_row skips the rows an
+earlier run already committed.
+
+CSV files need a list_name column and optionally item_name, price and
+quantity columns, so a CSV export can be imported as is. NDJSON lines hold
+the same keys, or are the type tagged lines written by the NDJSON export.
+"""
+import csv
+import json
+import re
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, response_cache
+from app.batch import parse_number
+from app.models import Shoppinglist, Shoppingitem
+
+FORMATS = ('csv', 'ndjson')
+
+
+def read_csv(lines):
+    """Rows of a CSV file as dicts"""
+    for row in csv.DictReader(lines):
+        yield row
+
+
+def read_ndjson(lines):
+    """Rows of an NDJSON file as dicts, export lines are flattened"""
+    list_names = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            # reported by parse_row
+            yield None
+            continue
+        if not isinstance(row, dict):
+            yield None
+        elif row.get('type') == 'shoppinglist':
+            list_names[row.get('id')] = row.get('name')
+            yield {'list_name': row.get('name')}
+        elif row.get('type') == 'shoppingitem':
+            yield {'list_name': list_names.get(row.get('in_shoppinglist')),
+                   'item_name': row.get('name'), 'price': row.get('price'),
+                   'quantity': row.get('quantity')}
+        else:
+            yield row
+
+
+def decode(lines):
+    """Decode the byte lines of an upload"""
+    for line in lines:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def read_rows(lines, import_format):
+    """Rows of a file in import_format, csv or ndjson"""
+    if import_format == 'csv':
+        return read_csv(decode(lines))
+    return read_ndjson(decode(lines))
+
+
+def parse_name(value, model, missing):
+    """Validate a list or item name, returns (name, error message)"""
+    name = str(value).strip() if value not in (None, '') else None
+    if not name:
+        return None, missing
+    if not re.match("^[a-zA-Z0-9 _]*$", name):
+        return None, "No special characters in name"
+    if len(name) > model.name.type.length:
+        return None, "Name must be at most {} characters".format(model.name.type.length)
+    return name, None
+
+
+def parse_row(row):
+    """Validate a row, returns (list name, item dict or None, error message)"""
+    if row is None:
+        return None, None, "Invalid row"
+    list_name, error = parse_name(row.get('list_name'), Shoppinglist,
+                                  "Please enter a shopping list name")
+    if error:
+        return None, None, error
+    if row.get('item_name') in (None, ''):
+        return list_name, None, None
+    item = {}
+    item['name'], error = parse_name(row.get('item_name'), Shoppingitem,
+                                     "Please provide an item name.")
+    if error:
+        return None, None, error
+    for field in ('price', 'quantity'):
+        if row.get(field) in (None, ''):
+            return None, None, "Please provide a {} value".format(field)
+        item[field], error = parse_number(row.get(field), field)
+        if error:
+            return None, None, error
+    return list_name, item, None
+
+
+def lookup_lists(user_id, names, lists):
+    """Add the ids of the user's lists with the given lower case names to lists"""
+    if not names:
+        return
+    for slist_id, name in db.session.query(Shoppinglist.id, Shoppinglist.name).filter(
+            Shoppinglist.created_by == user_id,
+            Shoppinglist.deleted_at.is_(None),
+            func.lower(Shoppinglist.name).in_(list(names))):
+        lists[name.lower()] = slist_id
+
+
+def import_chunk(user_id, rows, lists):
+    """Validate and write one chunk of (row number, row) pairs in one transaction
+
+    lists maps the lower case names of the user's lists to their ids and is
+    shared between chunks. Returns the chunk's report.
+    """
+    report = {'first_row': rows[0][0], 'last_row': rows[-1][0], 'lists_created': 0,
+              'items_created': 0, 'skipped': 0, 'errors': []}
+    parsed = []
+    for row_no, row in rows:
+        list_name, item, error = parse_row(row)
+        if error:
+            report['errors'].append({'row': row_no, 'message': error})
+        else:
+            parsed.append((list_name, item))
+
+    lookup_lists(user_id, set(name.lower() for name, _ in parsed) - set(lists), lists)
+    new_lists = {}
+    for list_name, item in parsed:
+        if list_name.lower() not in lists:
+            new_lists.setdefault(list_name.lower(), list_name)
+        elif item is None:
+            report['skipped'] += 1
+    try:
+        if new_lists:
+            db.session.bulk_insert_mappings(Shoppinglist, [
+                dict(name=name, created_by=user_id) for name in new_lists.values()])
+            lookup_lists(user_id, set(new_lists), lists)
+
+        items = [(lists[list_name.lower()], item) for list_name, item in parsed if item]
+        existing = set()
+        if items:
+            existing = set(
+                (slist_id, name.lower()) for slist_id, name in db.session.query(
+                    Shoppingitem.in_shoppinglist, Shoppingitem.name).filter(
+                        Shoppingitem.created_by == user_id,
+                        Shoppingitem.in_shoppinglist.in_(
+                            list(set(slist_id for slist_id, _ in items))),
+                        func.lower(Shoppingitem.name).in_(
+                            list(set(item['name'].lower() for _, item in items)))))
+        inserts = []
+        for slist_id, item in items:
+            key = (slist_id, item['name'].lower())
+            if key in existing:
+                report['skipped'] += 1
+                continue
+            existing.add(key)
+            inserts.append(dict(item, in_shoppinglist=slist_id, created_by=user_id))
+        if inserts:
+            db.session.bulk_insert_mappings(Shoppingitem, inserts)
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        for name in new_lists:
+            lists.pop(name, None)
+        report['errors'].append({'row': None, 'message': 'Chunk was not imported: {}'.format(
+            getattr(error, 'orig', error))})
+        report['failed'] = True
+        return report
+    report['lists_created'] = len(new_lists)
+    report['items_created'] = len(inserts)
+    if new_lists or inserts:
+        response_cache.invalidate(user_id)
+    return report
+
+
+def import_rows(user_id, rows, chunk_size, start_row=0, progress=None):
+    """Import rows for a user chunk by chunk, skipping the first start_row rows
+
+    progress, if given, is called with the report of every chunk. Returns
+    the totals, the last row read and the reports of chunks with errors.
+    """
+    result = {'rows': 0, 'last_row': start_row, 'lists_created': 0,
+              'items_created': 0, 'skipped': 0, 'errors': []}
+    lists = {}
+    chunk = []
+
+    def flush():
+        """Write the pending chunk"""
+        report = import_chunk(user_id, chunk, lists)
+        for key in ('lists_created', 'items_created', 'skipped'):
+            result[key] += report[key]
+        result['last_row'] = report['last_row']
+        if report['errors']:
+            result['errors'].append(report)
+        if progress:
+            progress(report)
+
+    for row_no, row in enumerate(rows, 1):
+        result['rows'] = row_no
+        if row_no <= start_row:
+            continue
+        chunk.append((row_no, row))
+        if len(chunk) >= chunk_size:
+            flush()
+            chunk = []
+    if chunk:
+        flush()
+    return result
@@ -0,0 +1,88 @@
+""" app/instrumentation.py
+
+Per request SQL instrumentation. Engine events count the statements each
+request runs and how long they take; the totals are returned in a
+Server-Timing header and a structured log line, and statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged with their parameters.
+"""
+import json
+import time
+from flask import g, request, current_app, has_request_context, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Remember when the statement started"""
+    # on the statement's own context, so a statement that fails and never
+    # reaches after_cursor_execute leaves nothing behind on the connection
+    if context is not None:
+        context.query_start = time.time()
+    else:
+        conn.info['query_start'] = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Add the statement to the request totals and log it if it was slow"""
+    start = context.query_start if context is not None else conn.info.pop('query_start')
+    elapsed = (time.time() - start) * 1000
+    if has_request_context() and 'db_stats' in g:
+        stats = g.db_stats
+        stats['queries'] += 1
+        stats['duration'] += elapsed
+        if elapsed > stats['slowest']:
+            stats['slowest'] = elapsed
+            stats['slowest_statement'] = statement
+    if has_app_context():
+        config = current_app.config
+        if elapsed >= config['SLOW_QUERY_THRESHOLD_MS']:
+            current_app.logger.warning(json.dumps({
+                'event': 'slow_query',
+                'duration_ms': round(elapsed, 2),
+                'statement': statement,
+                'parameters': repr(parameters)
+                              if config['SLOW_QUERY_LOG_PARAMETERS'] else None,
+            }))
+
+
+# every engine reports to whichever request is running on its thread
+event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def start_request():
+    """Start the clock and the query totals of a request"""
+    g.request_start = time.time()
+    g.db_stats = {'queries': 0, 'duration': 0.0, 'slowest': 0.0,
+                  'slowest_statement': None}
+
+
+def finish_request(response):
+    """Report the query totals of a request"""
+    if 'db_stats' not in g:
+        return response
+    stats = g.db_stats
+    total = (time.time() - g.request_start) * 1000
+    response.headers['Server-Timing'] = \
+        'db;dur={:.2f};desc="{} queries", db-slowest;dur={:.2f}, app;dur={:.2f}'.format(
+            stats['duration'], stats['queries'], stats['slowest'], total)
+    if current_app.config['SQL_REQUEST_LOG']:
+        current_app.logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total, 2),
+            'db_queries': stats['queries'],
+            'db_duration_ms': round(stats['duration'], 2),
+            'db_slowest_ms': round(stats['slowest'], 2),
+            'db_slowest_statement': stats['slowest_statement'],
+        }))
+    return response
+
+
+def instrument_queries(app):
+    """Record SQL statistics for every request of an app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
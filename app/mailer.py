@@ -0,0 +1,141 @@
+""" app/mailer.py
+
+Background mail delivery. Requests only enqueue a message; a worker thread
+sends queued messages in batches over a single SMTP connection and retries
+failed deliveries with exponential backoff. The worker is a daemon thread, so
+what is still queued when the process exits is delivered by drain(), which
+runs at exit and from gunicorn's worker_exit hook.
+"""
+import atexit
+import smtplib
+import socket
+import threading
+import time
+try:
+    from queue import Queue, Empty
+except ImportError:  # Python 2
+    from Queue import Queue, Empty
+from flask import current_app
+
+
+def is_transient(error):
+    """Whether a failed delivery is worth retrying, a bad message is dropped
+
+    Lost connections and 4xx replies such as 421 busy are, refused senders,
+    recipients or data with a 5xx reply are not. SMTPException derives from
+    socket.error on Python 3, so SMTP errors are sorted out first.
+    """
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return isinstance(error, smtplib.SMTPServerDisconnected)
+    return isinstance(error, socket.error)
+
+
+class MailQueue(object):
+    """Queue of outbound messages delivered by a background worker thread"""
+
+    def __init__(self, mail):
+        """Initialize with the Flask-Mail instance used to connect"""
+        self.mail = mail
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._drain_at_exit = False
+
+    def enqueue(self, message):
+        """Queue a message for delivery within the current app and return at once"""
+        app = current_app._get_current_object()
+        with self._lock:
+            self._pending += 1
+            self._queue.put((app, message, 0))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+            if not self._drain_at_exit:
+                atexit.register(self.drain, app.config['MAIL_DRAIN_TIMEOUT'])
+                self._drain_at_exit = True
+
+    def flush(self, timeout=None):
+        """Wait until every queued message is delivered or dropped, returns True if so"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            return self._pending == 0
+
+    def drain(self, timeout):
+        """Deliver what is queued before the process exits, returns the messages left"""
+        self.flush(timeout)
+        with self._lock:
+            return self._pending
+
+    def _done(self, count=1):
+        """Mark messages as delivered or dropped"""
+        with self._idle:
+            self._pending -= count
+            if not self._pending:
+                self._idle.notify_all()
+
+    def _work(self):
+        """Deliver batches until the process exits"""
+        while True:
+            batch = [self._queue.get()]
+            app = batch[0][0]
+            try:
+                while len(batch) < app.config['MAIL_BATCH_SIZE']:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            for batch_app in set(item[0] for item in batch):
+                self._deliver(batch_app, [item for item in batch
+                                          if item[0] is batch_app])
+
+    def _deliver(self, app, batch):
+        """Send a batch of messages over one connection"""
+        with app.app_context():
+            try:
+                with self.mail.connect() as connection:
+                    while batch:
+                        try:
+                            connection.send(batch[0][1])
+                        except Exception as e:
+                            if is_transient(e):
+                                raise
+                            app.logger.error(
+                                "Dropping undeliverable mail to %s: %s",
+                                batch[0][1].recipients, e)
+                        batch.pop(0)
+                        self._done()
+            except Exception as e:
+                if is_transient(e):
+                    for item in batch:
+                        self._retry(app, item, e)
+                    return
+                # a broken mail setup must not kill the worker or hang flush()
+                app.logger.exception("Dropping %s mails that could not be sent",
+                                     len(batch))
+                self._done(len(batch))
+
+    def _retry(self, app, item, error):
+        """Queue a failed message again after an exponential backoff"""
+        _, message, attempts = item
+        attempts += 1
+        if attempts > app.config['MAIL_MAX_RETRIES']:
+            app.logger.error("Giving up on mail to %s after %s attempts: %s",
+                             message.recipients, attempts, error)
+            self._done()
+            return
+        delay = app.config['MAIL_RETRY_BACKOFF'] * 2 ** (attempts - 1)
+        app.logger.warning("Mail to %s failed, retrying in %ss: %s",
+                           message.recipients, delay, error)
+        timer = threading.Timer(delay, self._queue.put,
+                                args=((app, message, attempts),))
+        timer.daemon = True
+        timer.start()
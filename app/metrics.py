@@ -0,0 +1,288 @@
+""" app/metrics.py
+
+Prometheus metrics. Every thread counts into its own shard, so recording a
+sample never takes a lock; shards are summed when the metrics are scraped.
+The shards of threads that have exited are folded into one retired total
+whenever a new thread starts counting or the metrics are scraped.
+
+Under gunicorn each worker periodically writes its totals to METRICS_DIR and
+a scrape of any worker sums the files of every worker. When a worker exits
+its counters are added to metrics_dead.json and its file is removed, so
+totals never go back, recycled workers leave no files behind and a reused
+pid starts from zero. Its gauges are dropped.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from flask import g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   float('inf'))
+
+
+def format_le(bound):
+    """Format a histogram bucket bound"""
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def format_labels(labels):
+    """Format label pairs as {name="value",...}"""
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels) + '}'
+
+
+def process_alive(pid):
+    """Check whether a process is still running"""
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class Metrics(object):
+    """Registry of counters, gauges and histograms"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+        self._collectors = {}
+        self._kinds = {}
+        self._help = {}
+        self.directory = None
+        self.flush_interval = 5
+        self._flusher_pid = None
+
+    def init_app(self, app):
+        """Read the multiprocess settings from the app config"""
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+
+    def describe(self, name, kind, help_text):
+        """Declare a metric's type and help text"""
+        self._kinds[name] = kind
+        self._help[name] = help_text
+
+    def set_collector(self, key, collector):
+        """Register a callable returning (name, labels, value) samples at scrape time"""
+        self._collectors[key] = collector
+
+    def _shard(self):
+        """The calling thread's counters"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_dead_threads()
+                self._shards[threading.current_thread()] = shard
+        return shard
+
+    def _retire_dead_threads(self):
+        """Fold the shards of exited threads into the retired totals, under the lock"""
+        for thread, shard in list(self._shards.items()):
+            if not thread.is_alive():
+                del self._shards[thread]
+                for key, value in shard.items():
+                    self._retired[key] = self._retired.get(key, 0) + value
+
+    def inc(self, name, labels=(), value=1):
+        """Add value to a counter or gauge"""
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def dec(self, name, labels=(), value=1):
+        """Subtract value from a gauge"""
+        self.inc(name, labels, -value)
+
+    def observe(self, name, value, labels=(), buckets=DEFAULT_BUCKETS):
+        """Record a value in a histogram"""
+        shard = self._shard()
+        for bound in buckets:
+            if value <= bound:
+                key = (name + '_bucket', labels + (('le', format_le(bound)),))
+                shard[key] = shard.get(key, 0) + 1
+        for key, amount in (((name + '_sum', labels), value),
+                            ((name + '_count', labels), 1)):
+            shard[key] = shard.get(key, 0) + amount
+
+    def kind(self, sample_name):
+        """The declared type of the metric a sample belongs to"""
+        for suffix in ('_bucket', '_sum', '_count'):
+            if sample_name.endswith(suffix) and \
+                    self._kinds.get(sample_name[:-len(suffix)]) == 'histogram':
+                return 'histogram'
+        return self._kinds.get(sample_name, 'counter')
+
+    def samples(self):
+        """Totals of this process as [name, labels, value] lists"""
+        with self._lock:
+            self._retire_dead_threads()
+            totals = dict(self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            # dict.copy is atomic, the owning thread may keep writing
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0) + value
+        for collector in list(self._collectors.values()):
+            for name, labels, value in collector():
+                totals[(name, labels)] = totals.get((name, labels), 0) + value
+        return [[name, list(labels), value]
+                for (name, labels), value in totals.items()]
+
+    def _path(self, pid):
+        """File holding the totals of a worker"""
+        return os.path.join(self.directory, 'metrics_{}.json'.format(pid))
+
+    def flush(self):
+        """Write this process's totals to the metrics directory"""
+        path = self._path(os.getpid())
+        with open(path + '.tmp', 'w') as output:
+            json.dump({'pid': os.getpid(), 'samples': self.samples()}, output)
+        os.rename(path + '.tmp', path)
+
+    def start_flusher(self):
+        """Flush this worker's totals in the background, once per process"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def run():
+            """Flush until the process exits"""
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+        flusher = threading.Thread(target=run)
+        flusher.daemon = True
+        flusher.start()
+
+    def mark_process_dead(self, pid):
+        """Add an exited worker's counters to the dead total and remove its file
+
+        Runs in the gunicorn master, the only writer of the dead total.
+        """
+        path = self._path(pid)
+        if not self.directory or not os.path.exists(path):
+            return
+        with open(path) as source:
+            samples = json.load(source)['samples']
+        dead_path = self._path('dead')
+        totals = {}
+        if os.path.exists(dead_path):
+            with open(dead_path) as source:
+                samples = json.load(source)['samples'] + samples
+        for name, labels, value in samples:
+            if self.kind(name) != 'gauge':
+                key = (name, tuple(tuple(pair) for pair in labels))
+                totals[key] = totals.get(key, 0) + value
+        samples = [[name, list(labels), value] for (name, labels), value in totals.items()]
+        with open(dead_path + '.tmp', 'w') as output:
+            json.dump({'pid': None, 'dead': True, 'samples': samples}, output)
+        os.rename(dead_path + '.tmp', dead_path)
+        os.remove(path)
+
+    def collect(self):
+        """Totals of every worker, or of this process when not under gunicorn"""
+        if not self.directory:
+            return self.samples()
+        self.flush()
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            with open(path) as source:
+                data = json.load(source)
+            live = not data.get('dead') and process_alive(data['pid'])
+            for name, labels, value in data['samples']:
+                if self.kind(name) == 'gauge' and not live:
+                    continue
+                key = (name, tuple(tuple(pair) for pair in labels))
+                totals[key] = totals.get(key, 0) + value
+        return [[name, list(labels), value] for (name, labels), value in totals.items()]
+
+    def render(self):
+        """Render every metric in the Prometheus text format"""
+        families = {}
+        for name, labels, value in self.collect():
+            family = name
+            if self.kind(name) == 'histogram':
+                family = name.rsplit('_', 1)[0]
+            families.setdefault(family, []).append((name, labels, value))
+        lines = []
+        for family in sorted(families):
+            if family in self._help:
+                lines.append('# HELP {} {}'.format(family, self._help[family]))
+            lines.append('# TYPE {} {}'.format(family, self._kinds.get(family, 'counter')))
+            for name, labels, value in sorted(families[family], key=sort_key):
+                lines.append('{}{} {}'.format(name, format_labels(labels), repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+
+def instrument_requests(app):
+    """Count, time and track in-flight requests of an app"""
+
+    def start():
+        """Mark a request as in flight"""
+        metrics.start_flusher()
+        metrics.inc('http_requests_in_flight')
+        g.metrics_start = time.time()
+
+    def finish(response):
+        """Record the status and latency of a request"""
+        if 'metrics_start' in g:
+            endpoint = request.endpoint or 'none'
+            metrics.inc('http_requests_total', (
+                ('endpoint', endpoint), ('method', request.method),
+                ('status', str(response.status_code))))
+            metrics.observe('http_request_duration_seconds',
+                            time.time() - g.metrics_start,
+                            (('endpoint', endpoint), ('method', request.method)))
+        return response
+
+    def teardown(exc):
+        """The request is no longer in flight, even if it failed"""
+        if g.pop('metrics_start', None) is not None:
+            metrics.dec('http_requests_in_flight')
+
+    app.before_request(start)
+    app.after_request(finish)
+    app.teardown_request(teardown)
+
+
+def sort_key(sample):
+    """Order samples by name and labels, histogram buckets by bound"""
+    name, labels, _ = sample
+    pairs = []
+    for label, value in labels:
+        if label == 'le':
+            value = float('inf') if value == '+Inf' else float(value)
+        pairs.append((label, value))
+    return name, pairs
+
+
+metrics = Metrics()
+metrics.describe('http_requests_total', 'counter',
+                 'Requests handled, by endpoint, method and status code.')
+metrics.describe('http_request_duration_seconds', 'histogram',
+                 'Request latency, by endpoint and method.')
+metrics.describe('http_requests_in_flight', 'gauge',
+                 'Requests being handled right now.')
+metrics.describe('password_hash_duration_seconds', 'histogram',
+                 'Time spent hashing or verifying a password, by operation.')
+metrics.describe('jwt_decode_failures_total', 'counter',
+                 'Access tokens rejected, by reason.')
+metrics.describe('response_cache_requests_total', 'counter',
+                 'Listing requests looked up in the response cache, by result.')
+metrics.describe('db_pool_size', 'gauge', 'Connections the pool keeps open.')
+metrics.describe('db_pool_checked_out', 'gauge', 'Connections in use.')
+metrics.describe('db_pool_overflow', 'gauge', 'Connections open beyond the pool size.')
+metrics.describe('db_pool_checkouts_total', 'counter', 'Connections checked out of the pool.')
+metrics.describe('db_pool_checkout_timeouts_total', 'counter',
+                 'Checkouts that gave up waiting for a connection.')
+metrics.describe('db_pool_checkout_wait_seconds_total', 'counter',
+                 'Time spent waiting for a connection.')
@@ -2,10 +2,14 @@
 import os
 from datetime import datetime, timedelta
 import jwt
-from app import db
-from flask_bcrypt import Bcrypt
+from flask import current_app
+from app import db, hasher, response_cache
+from app.shards import shards
+from app.serializers import SHOPPINGLIST_SUMMARY, SHOPPINGITEM_SUMMARY
 
 SECRET_KEY = os.getenv('SECRET')
+TOKEN_EXPIRED_MESSAGE = "Timed out. Please login to get a new token"
+TOKEN_INVALID_MESSAGE = "Invalid token. Please register or login"
 
 
 class User(db.Model):
@@ -16,23 +20,38 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(60), nullable=False, unique=True)
     password = db.Column(db.String(70), nullable=False)
+    # shard holding the user's lists and items, see app.shards
+    shard = db.Column(db.String(64))
+    # set while app.rebalance moves the lists, writes are turned away meanwhile
+    shard_moving = db.Column(db.Boolean, nullable=False, default=False,
+                             server_default=db.false())
+    # counts the writes of the user's lists and items, see app.response_cache
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # the database deletes a user's rows through ON DELETE CASCADE,
+    # children are never loaded just to be deleted one by one
     shoppinglists = db.relationship(
-        'Shoppinglist', order_by='Shoppinglist.id', cascade="all, delete-orphan")
+        'Shoppinglist', order_by='Shoppinglist.id', cascade="all, delete-orphan",
+        passive_deletes=True)
     shoppingitems = db.relationship(
-        'Shoppingitem', order_by='Shoppingitem.id', cascade='all, delete-orphan')
+        'Shoppingitem', order_by='Shoppingitem.id', cascade='all, delete-orphan',
+        passive_deletes=True)
 
     def __init__(self, email, password):
         """Initialize the user with an email and password."""
         self.email = email
-        self.password = Bcrypt().generate_password_hash(password).decode()
+        self.password = hasher.hash(password)
 
     def password_is_valid(self, password):
         """ Check password against it's hash to validate user's password"""
-        return Bcrypt().check_password_hash(self.password, password)
+        return hasher.verify(self.password, password)
 
     def save(self):
         """ Save a user to a db"""
         db.session.add(self)
+        if self.id is None and shards.enabled:
+            # the ring places a new user once, app.rebalance moves them later
+            db.session.flush()
+            self.shard = shards.shard_for(self.id)
         db.session.commit()
 
     def generate_token(self, user_id):
@@ -59,15 +78,22 @@ class User(db.Model):
     @staticmethod
     def decode_token(token):
         """ Handles the decoding of a token from the Authorization header"""
+        payload = User.decode_token_claims(token)
+        if isinstance(payload, dict):
+            return payload['sub']
+        return payload
+
+    @staticmethod
+    def decode_token_claims(token):
+        """ Decode a token into all of its claims, or an error message"""
         try:
             # Decode token with our secret key
-            payload = jwt.decode(token, SECRET_KEY)
-            return payload['sub']
+            return jwt.decode(token, SECRET_KEY)
         except jwt.ExpiredSignatureError:
             # token has expired
-            return "Timed out. Please login to get a new token"
+            return TOKEN_EXPIRED_MESSAGE
         except jwt.InvalidTokenError:
-            return "Invalid token. Please register or login"
+            return TOKEN_INVALID_MESSAGE
 
 
 class Shoppinglist(db.Model):
@@ -79,9 +105,27 @@ class Shoppinglist(db.Model):
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(db.DateTime, default=db.func.current_timestamp(
     ), onupdate=db.func.current_timestamp())
-    created_by = db.Column(db.Integer, db.ForeignKey(User.id))
+    created_by = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='CASCADE'))
+    # set when the list is soft deleted, the purge worker removes it later
+    deleted_at = db.Column(db.DateTime, nullable=True)
     shoppingitems = db.relationship(
-        'Shoppingitem', order_by='Shoppingitem.id', cascade='all, delete-orphan')
+        'Shoppingitem', order_by='Shoppingitem.id', cascade='all, delete-orphan',
+        passive_deletes=True)
+
+    # Every list query is scoped by its owner and skips deleted lists, list
+    # names are unique per owner regardless of case among the live lists
+    __table_args__ = (
+        db.Index('ix_shoppinglists_created_by_id', 'created_by', 'id',
+                 postgresql_where=deleted_at.is_(None),
+                 sqlite_where=deleted_at.is_(None)),
+        db.Index('uq_shoppinglists_created_by_lower_name',
+                 created_by, db.func.lower(name), unique=True,
+                 postgresql_where=deleted_at.is_(None),
+                 sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_shoppinglists_deleted_at', deleted_at,
+                 postgresql_where=deleted_at.isnot(None),
+                 sqlite_where=deleted_at.isnot(None)),
+    )
 
     def __init__(self, name, created_by):
         """" Initialize with name and creator"""
@@ -92,16 +136,38 @@ class Shoppinglist(db.Model):
         """Save a shopping list"""
         db.session.add(self)
         db.session.commit()
+        response_cache.invalidate(self.created_by)
 
     @staticmethod
     def get_all(user_id):
         """Get all shopping lists belonging to user who created them"""
-        return Shoppinglist.query.filter_by(created_by=user_id)
+        return Shoppinglist.query.filter_by(created_by=user_id, deleted_at=None)
+
+    @staticmethod
+    def find(sl_id, user_id):
+        """Get one of the user's shopping lists, None if missing or deleted"""
+        return Shoppinglist.get_all(user_id).filter_by(id=sl_id).first()
+
+    @staticmethod
+    def get_all_summaries(user_id):
+        """Select only the columns list listings show, no entities are loaded"""
+        return Shoppinglist.get_all(user_id).with_entities(
+            *SHOPPINGLIST_SUMMARY.columns(Shoppinglist))
 
     def delete(self):
-        """Delete a shopping list"""
-        db.session.delete(self)
+        """Delete a shopping list, its items go with it in the same statement
+
+        With SOFT_DELETE the list is only marked deleted, which hides it and
+        its items, and the purge worker removes the rows in the background.
+        """
+        # read before the commit expires it
+        user_id = self.created_by
+        if current_app.config['SOFT_DELETE']:
+            self.deleted_at = db.func.current_timestamp()
+        else:
+            db.session.delete(self)
         db.session.commit()
+        response_cache.invalidate(user_id)
 
     def __repr__(self):
         return "<Shoppinglist: {}>".format(self.name)
@@ -119,8 +185,18 @@ class Shoppingitem(db.Model):
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(db.DateTime, default=db.func.current_timestamp(
     ), onupdate=db.func.current_timestamp())
-    created_by = db.Column(db.Integer, db.ForeignKey(User.id))
-    in_shoppinglist = db.Column(db.Integer, db.ForeignKey(Shoppinglist.id))
+    created_by = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='CASCADE'))
+    in_shoppinglist = db.Column(db.Integer,
+                                db.ForeignKey(Shoppinglist.id, ondelete='CASCADE'))
+
+    # Every item query is scoped by its owner and shopping list and item
+    # names are unique per shopping list regardless of case
+    __table_args__ = (
+        db.Index('ix_shoppingitems_created_by_in_shoppinglist_id',
+                 'created_by', 'in_shoppinglist', 'id'),
+        db.Index('uq_shoppingitems_in_shoppinglist_lower_name',
+                 in_shoppinglist, db.func.lower(name), unique=True),
+    )
 
     def __init__(self, name, price, quantity, in_shoppinglist, created_by):
         """Initialize a shopping item with a name, shopping list and user"""
@@ -134,16 +210,94 @@ class Shoppingitem(db.Model):
         """Add and save a shopping item"""
         db.session.add(self)
         db.session.commit()
+        response_cache.invalidate(self.created_by)
+
+    @staticmethod
+    def in_live_list():
+        """Criterion matching items whose shopping list is not deleted"""
+        return db.session.query(Shoppinglist.id).filter(
+            Shoppinglist.id == Shoppingitem.in_shoppinglist,
+            Shoppinglist.deleted_at.is_(None)).exists()
 
     @staticmethod
     def get_all_items(slist_id, user_id):
         """Get all shopping items belonging to a shopping list and creator"""
-        return Shoppingitem.query.filter_by(in_shoppinglist=slist_id, created_by=user_id)
+        return Shoppingitem.query.filter_by(
+            in_shoppinglist=slist_id, created_by=user_id).filter(
+                Shoppingitem.in_live_list())
+
+    @staticmethod
+    def find(item_id, slist_id, user_id):
+        """Get one item of the user's shopping list, None if missing or deleted"""
+        return Shoppingitem.get_all_items(slist_id, user_id).filter_by(id=item_id).first()
+
+    @staticmethod
+    def get_all_item_summaries(slist_id, user_id):
+        """Select only the columns item listings show, no entities are loaded"""
+        return Shoppingitem.get_all_items(slist_id, user_id).with_entities(
+            *SHOPPINGITEM_SUMMARY.columns(Shoppingitem))
 
     def delete(self):
         """Delete a shopping item"""
         db.session.delete(self)
         db.session.commit()
+        response_cache.invalidate(self.created_by)
+
+    @staticmethod
+    def summarize(user_id, slist_ids):
+        """Item count, total quantity and total cost of each list in one grouped query"""
+        summaries = dict((slist_id, {'item_count': 0, 'total_quantity': 0.0,
+                                     'total_cost': 0.0})
+                         for slist_id in slist_ids)
+        if not summaries:
+            return summaries
+        rows = db.session.query(
+            Shoppingitem.in_shoppinglist,
+            db.func.count(Shoppingitem.id),
+            db.func.sum(Shoppingitem.quantity),
+            db.func.sum(Shoppingitem.price * Shoppingitem.quantity)
+        ).filter(
+            Shoppingitem.created_by == user_id,
+            Shoppingitem.in_shoppinglist.in_(list(summaries))
+        ).group_by(Shoppingitem.in_shoppinglist)
+        for slist_id, count, quantity, cost in rows:
+            summaries[slist_id] = {'item_count': count,
+                                   'total_quantity': float(quantity or 0),
+                                   'total_cost': float(cost or 0)}
+        return summaries
+
+    @staticmethod
+    def bulk_write(slist_id, user_id, operations):
+        """Apply validated create, update and delete operations in one transaction"""
+        creates = [dict(name=op['name'], price=op['price'], quantity=op['quantity'],
+                        in_shoppinglist=slist_id, created_by=user_id)
+                   for op in operations if op['op'] == 'create']
+        updates = [dict((key, value) for key, value in op.items() if key != 'op')
+                   for op in operations if op['op'] == 'update']
+        deletes = [op['id'] for op in operations if op['op'] == 'delete']
+        try:
+            if deletes:
+                Shoppingitem.query.filter(
+                    Shoppingitem.id.in_(deletes),
+                    Shoppingitem.in_shoppinglist == slist_id,
+                    Shoppingitem.created_by == user_id).delete(
+                        synchronize_session=False)
+            renames = [op['id'] for op in updates if 'name' in op]
+            if len(renames) > 1:
+                # park renamed items on placeholder names no valid name can
+                # take, so names swapped within the batch never collide row by row
+                db.session.bulk_update_mappings(Shoppingitem, [
+                    dict(id=item_id, name='#{}'.format(item_id)) for item_id in renames])
+            if updates:
+                db.session.bulk_update_mappings(Shoppingitem, updates)
+            if creates:
+                db.session.bulk_insert_mappings(Shoppingitem, creates)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        response_cache.invalidate(user_id)
+        return creates, updates, deletes
 
     def __repr__(self):
         return "<Shoppingitem: {}>".format(self.name)
@@ -0,0 +1,44 @@
+""" app/pagination.py
+
+Keyset pagination. A cursor is an opaque token holding the id of the last row
+of the previous page, so fetching the next page is an indexed range scan with
+no COUNT(*) and no OFFSET.
+"""
+import base64
+
+
+def encode_cursor(last_id):
+    """Encode the id of the last row on a page into an opaque cursor"""
+    return base64.urlsafe_b64encode(
+        'id:{}'.format(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into the id of the last row seen, raises ValueError if invalid"""
+    if not cursor:
+        # an empty cursor starts from the first page
+        return 0
+    try:
+        decoded = base64.urlsafe_b64decode(
+            str(cursor + '=' * (-len(cursor) % 4))).decode()
+    except Exception:
+        raise ValueError('Invalid cursor')
+    prefix, _, last_id = decoded.partition(':')
+    if prefix != 'id' or not last_id.isdigit():
+        raise ValueError('Invalid cursor')
+    return int(last_id)
+
+
+def keyset_page(query, model, cursor, limit):
+    """Fetch the page after the cursor, returns the rows and the next cursor"""
+    rows = query.filter(model.id > decode_cursor(cursor)).order_by(
+        model.id).limit(limit + 1).all()
+    return trim_page(rows, limit)
+
+
+def trim_page(rows, limit):
+    """Split up to limit + 1 rows into the page and the next cursor"""
+    if len(rows) > limit:
+        # the extra row only tells us there is a next page
+        return rows[:limit], encode_cursor(rows[limit - 1].id)
+    return rows, 'None'
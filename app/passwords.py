@@ -0,0 +1,68 @@
+""" app/passwords.py
+
+Password hashing service. One configured bcrypt hasher is shared by every
+request and hashes run on a bounded worker pool, so a storm of logins queues
+behind a fixed number of workers instead of taking every request thread.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask_bcrypt import Bcrypt
+from app.metrics import metrics
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+    pass
+
+
+class PasswordHasher(object):
+    """Hashes and verifies passwords on a bounded pool of worker threads"""
+
+    def __init__(self, app=None):
+        self.bcrypt = Bcrypt()
+        self._pool = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the work factor and the worker pool from the app config"""
+        self.bcrypt.init_app(app)
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        # hashes running plus hashes waiting for a worker
+        self._slots = threading.BoundedSemaphore(
+            workers + app.config['PASSWORD_HASH_QUEUE'])
+
+    def _run(self, funct, *args):
+        """Run funct on the pool and wait for its result"""
+        if not self._slots.acquire(False):
+            raise PasswordHasherBusy(
+                "Too many password requests. Please try again shortly.")
+        try:
+            return self._pool.submit(funct, *args).result()
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _timed(operation, funct, *args):
+        """Call funct, recording how long it took"""
+        start = time.time()
+        try:
+            return funct(*args)
+        finally:
+            metrics.observe('password_hash_duration_seconds', time.time() - start,
+                            (('operation', operation),))
+
+    def hash(self, password):
+        """Hash a password with the configured work factor"""
+        return self._run(self._timed, 'hash',
+                         self.bcrypt.generate_password_hash, password).decode()
+
+    def verify(self, pw_hash, password):
+        """Check a password against its hash"""
+        return self._run(self._timed, 'verify',
+                         self.bcrypt.check_password_hash, pw_hash, password)
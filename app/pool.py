@@ -0,0 +1,156 @@
+""" app/pool.py
+
+Connection pool configuration and metrics. Pool sizes come from the config
+classes, an external pooler such as PgBouncer in transaction mode replaces
+the in-process pool entirely, and every checkout from the in-process pool
+records how long the request waited for a connection. Read replica and shard
+binds get the same pools, each with its own metrics, and the session routes
+to them as app.replicas and app.shards decide.
+"""
+import sqlite3
+import threading
+import time
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+from app.replicas import RoutingSession
+
+POOL_OPTIONS = ('pool_size', 'pool_timeout', 'pool_recycle', 'max_overflow')
+
+
+class PoolMetrics(object):
+    """Counters of connection checkouts from the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero every counter"""
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record(self, wait, timed_out=False):
+        """Record the time a checkout waited for a connection"""
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self):
+        """Return the counters as a dict"""
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'checkout_wait_seconds_total': self.wait_total,
+                'checkout_wait_seconds_max': self.wait_max,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits in its own metrics"""
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        """The pool engine.dispose() swaps in keeps counting where this one stopped"""
+        pool = super(TimedQueuePool, self).recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            conn = super(TimedQueuePool, self)._do_get()
+        except Exception:
+            self.metrics.record(time.time() - start, timed_out=True)
+            raise
+        self.metrics.record(time.time() - start)
+        return conn
+
+
+def enable_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, and their ON DELETE actions, when asked"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+event.listen(Pool, 'connect', enable_foreign_keys)
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose engine pool is configured from the app config"""
+
+    def create_session(self, options):
+        """Sessions that send the reads of GET requests to the read replicas"""
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        """Pick the pool class and options for the configured database"""
+        super(PooledSQLAlchemy, self).apply_driver_hacks(app, info, options)
+        if info.drivername.startswith('sqlite'):
+            # SQLite connections are files, not worth pooling
+            for option in POOL_OPTIONS:
+                options.pop(option, None)
+            return
+        if app.config.get('SQLALCHEMY_EXTERNAL_POOLER'):
+            # PgBouncer owns the connections, hand each one straight back
+            for option in POOL_OPTIONS:
+                options.pop(option, None)
+            options['poolclass'] = NullPool
+            return
+        options.setdefault('poolclass', TimedQueuePool)
+        options['pool_pre_ping'] = app.config.get('SQLALCHEMY_POOL_PRE_PING', True)
+
+
+def bind_engines(db, app):
+    """(bind name, engine) of the primary database and of every bind"""
+    engines = [('primary', db.get_engine(app))]
+    for bind in sorted(app.config.get('SQLALCHEMY_BINDS') or ()):
+        engines.append((bind, db.get_engine(app, bind=bind)))
+    return engines
+
+
+def pool_stats(engine):
+    """Checkout metrics plus the current state of an engine's pool"""
+    pool = engine.pool
+    # pools that are not timed never wait, they report zeros
+    stats = getattr(pool, 'metrics', PoolMetrics()).snapshot()
+    stats['pool_class'] = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+        })
+    return stats
+
+
+def pool_samples(engines):
+    """Pool stats of (bind name, engine) pairs as (name, labels, value) metric samples"""
+    samples = []
+    for bind, engine in engines:
+        stats = pool_stats(engine)
+        labels = (('bind', bind),)
+        samples.extend([
+            ('db_pool_checkouts_total', labels, stats['checkouts']),
+            ('db_pool_checkout_timeouts_total', labels, stats['checkout_timeouts']),
+            ('db_pool_checkout_wait_seconds_total', labels,
+             stats['checkout_wait_seconds_total']),
+        ])
+        for name in ('size', 'checked_out', 'overflow'):
+            if name in stats:
+                samples.append(('db_pool_' + name, labels, stats[name]))
+    return samples
@@ -0,0 +1,75 @@
+""" app/purge.py
+
+Background purge of soft deleted shopping lists. Deleting a list through the
+API only sets its deleted_at; this worker later removes the items of deleted
+lists and then the lists themselves in batches, each batch in its own short
+transaction with a pause between batches, so a list of thousands of items
+never holds long locks or starves the requests sharing the database.
+
+    python manage.py purge            # once
+    python manage.py purge --watch    # keep purging every PURGE_INTERVAL seconds
+"""
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Shoppinglist, Shoppingitem
+from app.shards import shards
+
+
+def purge_batch(query, model, batch_size):
+    """Delete up to batch_size rows whose ids query selects, returns how many"""
+    ids = [row[0] for row in query.limit(batch_size)]
+    if ids:
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(ids)
+
+
+def purge(batch_size, pause=0.0, grace=0, progress=None):
+    """Remove the lists deleted more than grace seconds ago and their items
+
+    Items go first so deleting a list never cascades to more than a batch of
+    rows. pause is the number of seconds to sleep between batches and
+    progress, if given, is called with the running totals after each batch.
+    Returns the number of lists and items removed.
+    """
+    # deleted_at is CURRENT_TIMESTAMP, UTC on SQLite and on a UTC database
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    deleted = db.session.query(Shoppinglist.id).filter(
+        Shoppinglist.deleted_at.isnot(None), Shoppinglist.deleted_at <= cutoff)
+    batches = (
+        ('items', Shoppingitem, db.session.query(Shoppingitem.id).filter(
+            Shoppingitem.in_shoppinglist.in_(deleted.subquery()))),
+        ('lists', Shoppinglist, deleted),
+    )
+    totals = {'lists': 0, 'items': 0}
+    for key, model, query in batches:
+        while True:
+            count = purge_batch(query, model, batch_size)
+            totals[key] += count
+            if progress and count:
+                progress(totals)
+            if count < batch_size:
+                break
+            time.sleep(pause)
+    return totals
+
+
+def purge_all(batch_size, pause=0.0, grace=0, progress=None):
+    """Purge every shard in turn, or the primary without sharding"""
+    totals = {'lists': 0, 'items': 0}
+    for _ in shards.each():
+        for key, count in purge(batch_size, pause, grace, progress).items():
+            totals[key] += count
+    return totals
+
+
+def run(interval, progress=None):
+    """Purge every interval seconds until interrupted, with the app's settings"""
+    config = current_app.config
+    while True:
+        purge_all(config['PURGE_BATCH_SIZE'], config['PURGE_PAUSE_MS'] / 1000.0,
+                  config['PURGE_GRACE_SECONDS'], progress)
+        db.session.remove()
+        time.sleep(interval)
@@ -0,0 +1,237 @@
+""" app/rebalance.py
+
+Shard maintenance. init_shards creates the list and item tables on every
+shard, without the foreign keys to users since users live in the primary
+database, and on PostgreSQL interleaves the id sequences so no two shards
+hand out the same id. rebalance moves every user whose lists sit on a shard
+other than the one the ring places them on, which after adding a shard is
+only the users the new shard takes over.
+
+Requests follow users.shard, not the ring, so users keep their lists while
+the new DATABASE_SHARD_URLS is deployed and until they are moved. A batch of
+users is marked moving, which turns their writes away, and after
+SHARD_MOVE_FENCE_SECONDS, long enough for the shards workers cached with
+access tokens to expire and for writes already under way to finish, each of
+them is moved: their rows on the target are replaced by a
+copy of the ones on the source in one transaction, users.shard is pointed at
+the target, and their rows on the source are deleted. A run cut short at any
+step is finished by the next one, since the copy starts over from the
+source and the rows left behind on a shard the user is no longer recorded on
+are deleted first. Users whose ids are taken on the target stay where they
+are and are reported.
+
+    python manage.py init_shards
+    python manage.py rebalance [--dry-run]
+"""
+import time
+import sqlalchemy as sa
+from app import db, response_cache
+from app.models import User, Shoppinglist, Shoppingitem
+from app.search import search_backend, trigram_ddl, fts5_ddl
+from app.shards import shards
+
+# parents before children
+TABLES = (Shoppinglist.__table__, Shoppingitem.__table__)
+
+
+def shard_tables():
+    """Copies of the sharded tables without their foreign keys to users"""
+    metadata = sa.MetaData()
+    # a stand in so the copies can resolve their foreign keys, never created
+    sa.Table('users', metadata, sa.Column('id', sa.Integer, primary_key=True))
+    copies = []
+    for table in TABLES:
+        copy = table.tometadata(metadata)
+        for constraint in list(copy.foreign_key_constraints):
+            if constraint.referred_table.name == 'users':
+                copy.constraints.discard(constraint)
+                for key in constraint.elements:
+                    key.parent.foreign_keys.discard(key)
+        copies.append(copy)
+    return metadata, copies
+
+
+def create_schema(engine, number, stride):
+    """Create the list and item tables on shard_<number>, returns False if they exist"""
+    if engine.dialect.has_table(engine, TABLES[0].name):
+        return False
+    metadata, copies = shard_tables()
+    metadata.create_all(engine, tables=copies)
+    backend = search_backend(engine)
+    with engine.begin() as connection:
+        if backend == 'trigram':
+            connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in TABLES:
+            ddls = {'trigram': trigram_ddl, 'fts5': fts5_ddl}.get(backend, lambda name: [])
+            for ddl in ddls(table.name):
+                connection.execute(ddl)
+            if engine.dialect.name == 'postgresql':
+                connection.execute(
+                    "ALTER SEQUENCE {}_id_seq INCREMENT BY {} RESTART WITH {}".format(
+                        table.name, stride, number + 1))
+    return True
+
+
+def init_shards(app, progress=None):
+    """Create the schema on every shard that lacks it and record every user's shard"""
+    for bind in shards.ring.nodes:
+        # the number in the bind name, which never changes as shards are added
+        number = int(bind.rsplit('_', 1)[1])
+        created = create_schema(db.get_engine(app, bind=bind), number,
+                                app.config['SHARD_ID_STRIDE'])
+        if progress:
+            progress(bind, created)
+    return place_users(app)
+
+
+def shard_users(engine):
+    """Ids of the users with lists on a shard"""
+    lists = TABLES[0]
+    return [row[0] for row in engine.execute(
+        sa.select([lists.c.created_by]).distinct().order_by(lists.c.created_by))]
+
+
+def place_users(app):
+    """Record the shard of every user who has none
+
+    Users are recorded on the shard holding their lists, users without lists
+    on the shard the ring places them on. Returns the number of users placed
+    and the users whose lists are spread over several shards, who are left
+    for an operator to merge.
+    """
+    users = User.__table__
+    unplaced = set(row[0] for row in db.engine.execute(
+        sa.select([users.c.id]).where(users.c.shard.is_(None))))
+    found = {}
+    for bind in shards.ring.nodes:
+        for user_id in shard_users(db.get_engine(app, bind=bind)):
+            if user_id in unplaced:
+                found.setdefault(user_id, []).append(bind)
+    placed = 0
+    conflicts = []
+    for user_id in sorted(unplaced):
+        binds = found.get(user_id) or [shards.shard_for(user_id)]
+        if len(binds) > 1:
+            conflicts.append(user_id)
+            continue
+        db.engine.execute(users.update().where(users.c.id == user_id).where(
+            users.c.shard.is_(None)).values(shard=binds[0]))
+        placed += 1
+    return placed, conflicts
+
+
+def delete_rows(connection, user_ids):
+    """Delete the lists and items of some users"""
+    for table in reversed(TABLES):
+        connection.execute(table.delete().where(table.c.created_by.in_(user_ids)))
+
+
+def delete_leftovers(app):
+    """Delete the rows a cut short run left on shards users are not recorded on"""
+    users = User.__table__
+    placement = dict(db.engine.execute(
+        sa.select([users.c.id, users.c.shard]).where(users.c.shard.isnot(None))).fetchall())
+    for bind in shards.ring.nodes:
+        engine = db.get_engine(app, bind=bind)
+        stale = [user_id for user_id in shard_users(engine)
+                 if placement.get(user_id) not in (None, bind)]
+        if stale:
+            with engine.begin() as connection:
+                delete_rows(connection, stale)
+
+
+def misplaced_users():
+    """(user id, recorded shard, ring shard) of every user the ring places elsewhere"""
+    users = User.__table__
+    rows = db.engine.execute(sa.select([users.c.id, users.c.shard]).where(
+        users.c.shard.isnot(None)).order_by(users.c.id))
+    return [(user_id, bind, shards.shard_for(user_id)) for user_id, bind in rows
+            if shards.shard_for(user_id) != bind]
+
+
+def set_moving(user_ids, moving):
+    """Mark users as being moved, which turns their writes away, or unmark them"""
+    users = User.__table__
+    db.engine.execute(users.update().where(users.c.id.in_(user_ids)).values(
+        shard_moving=moving))
+
+
+def forget_shards(app, user_ids):
+    """Drop the shards this process cached with the users' access tokens"""
+    token_cache = app.extensions.get('token_cache')
+    if token_cache is not None:
+        for user_id in user_ids:
+            token_cache.invalidate_user(user_id)
+
+
+def move_user(app, user_id, source_bind, target_bind):
+    """Copy a user's lists and items to target, record it, delete them from source
+
+    Returns the number of lists and items moved, or None when some of the
+    ids are already taken on target and nothing was moved.
+    """
+    source = db.get_engine(app, bind=source_bind)
+    rows = []
+    for table in TABLES:
+        rows.append([dict(row) for row in source.execute(
+            table.select().where(table.c.created_by == user_id).order_by(table.c.id))])
+    try:
+        with db.get_engine(app, bind=target_bind).begin() as connection:
+            # whatever an earlier run copied is replaced, never added to
+            delete_rows(connection, [user_id])
+            for table, table_rows in zip(TABLES, rows):
+                if table_rows:
+                    connection.execute(table.insert(), table_rows)
+    except sa.exc.IntegrityError:
+        return None
+    users = User.__table__
+    db.engine.execute(users.update().where(users.c.id == user_id).values(
+        shard=target_bind, shard_moving=False))
+    forget_shards(app, [user_id])
+    response_cache.invalidate(user_id)
+    with source.begin() as connection:
+        delete_rows(connection, [user_id])
+    return len(rows[0]), len(rows[1])
+
+
+def rebalance(app, dry_run=False, progress=None):
+    """Move every user to the shard the ring places them on
+
+    progress, if given, is called with (user id, source, target, result)
+    for every misplaced user. Returns the totals, the number of users whose
+    shard was recorded, and the users that could not be moved because their
+    ids are taken on the target or their lists are spread over several shards.
+    """
+    totals = {'users': 0, 'lists': 0, 'items': 0, 'placed': 0, 'conflicts': []}
+    if dry_run:
+        for user_id, source_bind, target_bind in misplaced_users():
+            if progress:
+                progress(user_id, source_bind, target_bind, None)
+        return totals
+    # only one rebalance runs at a time, so users still marked moving were
+    # left so by a run cut short
+    users = User.__table__
+    db.engine.execute(users.update().where(users.c.shard_moving == sa.true()).values(
+        shard_moving=False))
+    totals['placed'], totals['conflicts'] = place_users(app)
+    delete_leftovers(app)
+    misplaced = misplaced_users()
+    batch_size = app.config['SHARD_MOVE_BATCH']
+    for start in range(0, len(misplaced), batch_size):
+        batch = misplaced[start:start + batch_size]
+        set_moving([user_id for user_id, _, _ in batch], True)
+        forget_shards(app, [user_id for user_id, _, _ in batch])
+        # shards cached before the mark expire and writes that read them finish
+        time.sleep(app.config['SHARD_MOVE_FENCE_SECONDS'])
+        for user_id, source_bind, target_bind in batch:
+            result = move_user(app, user_id, source_bind, target_bind)
+            if result is None:
+                set_moving([user_id], False)
+                totals['conflicts'].append(user_id)
+            else:
+                totals['users'] += 1
+                totals['lists'] += result[0]
+                totals['items'] += result[1]
+            if progress:
+                progress(user_id, source_bind, target_bind, result)
+    return totals
@@ -0,0 +1,118 @@
+""" app/replicas.py
+
+Read replica routing. Every bind named replica_* in SQLALCHEMY_BINDS is a
+read replica of the primary database. GET and HEAD requests read from one of
+them, picked per request, while anything that writes, and any request
+outside a GET, stays on the primary.
+
+Replicas lag behind the primary, so a user who just wrote something must
+see it on their next read. After a successful write, registration or login
+the user gets a marker that lives REPLICA_STICKY_SECONDS, and their reads go
+to the primary while it lasts. The markers are kept in process, or in Redis when
+REPLICA_STICKY_URL (by default RESPONSE_CACHE_URL) is set, so that every
+gunicorn worker sees them. Without either, gunicorn sets
+REPLICA_READS_ENABLED to False when it runs several workers and every read
+stays on the primary.
+"""
+import random
+from flask import g, request, current_app, has_request_context
+from flask_sqlalchemy import SignallingSession
+from app.response_cache import LocalBackend, RedisBackend
+from app.shards import shards
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_binds(app):
+    """Names of the replica binds configured for an app"""
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or ()
+                  if key.startswith('replica'))
+
+
+class ReplicaRouter(object):
+    """Decides per request whether reads may go to a replica"""
+
+    def __init__(self):
+        self.backend = LocalBackend()
+
+    def init_app(self, app):
+        """Pick the marker store and hook into the app's requests"""
+        url = app.config.get('REPLICA_STICKY_URL') or app.config.get('RESPONSE_CACHE_URL')
+        self.backend = RedisBackend.from_url(url) if url else \
+            LocalBackend(app.config['REPLICA_STICKY_SIZE'])
+        if replica_binds(app) and not app.config['REPLICA_READS_ENABLED']:
+            app.logger.warning(
+                'Replica reads are disabled, every read goes to the primary. Set '
+                'REPLICA_STICKY_URL to a Redis server shared by the workers to enable them.')
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        """Send the reads of a GET to a replica unless the user turns out to be sticky"""
+        binds = replica_binds(current_app) \
+            if current_app.config['REPLICA_READS_ENABLED'] else None
+        g.replica_bind = random.choice(binds) \
+            if binds and request.method in READ_METHODS else None
+
+    def identify(self, user_id):
+        """Note the authenticated user, whose own writes pin reads to the primary"""
+        g.replica_user = user_id
+        if g.get('replica_bind') and self.is_sticky(user_id):
+            g.replica_bind = None
+
+    def finish_request(self, response):
+        """Mark a user who wrote something as sticky"""
+        user_id = g.get('replica_user')
+        if user_id is not None and request.method not in READ_METHODS \
+                and response.status_code < 400:
+            self.stick(user_id)
+        return response
+
+    def stick(self, user_id):
+        """Read from the primary for the user's next REPLICA_STICKY_SECONDS"""
+        ttl = current_app.config['REPLICA_STICKY_SECONDS']
+        if ttl <= 0 or not replica_binds(current_app):
+            return
+        try:
+            self.backend.set('sticky:{}'.format(user_id), '1', ttl)
+        except Exception:
+            current_app.logger.exception('Could not pin user %s to the primary', user_id)
+
+    def is_sticky(self, user_id):
+        """Check whether the user wrote something recently"""
+        try:
+            return self.backend.get('sticky:{}'.format(user_id)) is not None
+        except Exception:
+            # when in doubt read from the primary
+            current_app.logger.exception('Could not check if user %s is sticky', user_id)
+            return True
+
+    def bind_key(self):
+        """Replica bind the current request reads from, None for the primary"""
+        if not has_request_context():
+            return None
+        return g.get('replica_bind')
+
+
+replicas = ReplicaRouter()
+
+
+class RoutingSession(SignallingSession):
+    """Session sending list and item statements to their shard and the reads
+    of replica routed requests to their replica"""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        """The shard or replica engine, the usual bind for everything else"""
+        # the replicas copy the primary, which holds no lists or items once
+        # they are sharded, so their reads go to the shard whatever the method
+        bind_key = shards.bind_key(mapper, clause)
+        if bind_key is not None:
+            return self.db.get_engine(self.app, bind=bind_key)
+        bind_key = replicas.bind_key()
+        if bind_key is not None and not self._flushing:
+            return self.db.get_engine(self.app, bind=bind_key)
+        return super(RoutingSession, self).get_bind(mapper, clause)
@@ -0,0 +1,93 @@
+""" app/repository.py
+
+Data access for the item routes. The ownership check rides along with the
+statement that reads or writes the items instead of being a query of its
+own, so a route costs one round trip to the database. A missing or foreign
+list comes back as no row at all, an empty page as the list row alone.
+"""
+from collections import namedtuple
+from sqlalchemy import and_, exists, func, literal, select, true
+from app import db, response_cache
+from app.models import Shoppinglist, Shoppingitem
+from app.serializers import SHOPPINGITEM_SUMMARY
+
+# items holds (id, name, price, quantity, ...) rows in SHOPPINGITEM_SUMMARY
+# order, total, last_id and last_modified are over all of the list's items
+ItemPage = namedtuple('ItemPage', 'found items total last_id last_modified')
+
+
+def item_page(user_id, sl_id, limit, offset=0, after_id=None):
+    """Check ownership and fetch a page of a list's items with their totals
+
+    The totals are window aggregates over the list's items, computed before
+    the page is cut, so they give the count for page links and the
+    conditional GET validators without a second query. after_id starts
+    the page after a keyset cursor instead of at offset.
+    """
+    summary = SHOPPINGITEM_SUMMARY.columns(Shoppingitem)
+    items = db.session.query(
+        *summary + [func.count(Shoppingitem.id).over().label('total'),
+                    func.max(Shoppingitem.id).over().label('last_id'),
+                    func.max(Shoppingitem.date_modified).over().label('last_modified')]
+    ).filter(
+        Shoppingitem.created_by == user_id,
+        Shoppingitem.in_shoppinglist == sl_id
+    ).subquery()
+    page = db.session.query(items)
+    if after_id is not None:
+        page = page.filter(items.c.id > after_id)
+    page = page.order_by(items.c.id).limit(limit).offset(offset).subquery()
+    rows = db.session.query(
+        *[page.c[column.key] for column in summary] +
+        [page.c.total, page.c.last_id, page.c.last_modified,
+         Shoppinglist.id.label('list_id')]
+    ).select_from(Shoppinglist).outerjoin(page, true()).filter(
+        Shoppinglist.id == sl_id,
+        Shoppinglist.created_by == user_id,
+        Shoppinglist.deleted_at.is_(None)
+    ).order_by(page.c.id).all()
+    if not rows:
+        return ItemPage(False, [], 0, None, None)
+    first = rows[0]
+    if first.id is None:
+        # the list row alone, the page is past the last item
+        rows = []
+    return ItemPage(True, rows, first.total or 0, first.last_id, first.last_modified)
+
+
+def create_item(user_id, sl_id, name, price, quantity):
+    """Insert an item if the user owns the list, returns the new row or None
+
+    The ownership check is the WHERE EXISTS of an INSERT ... SELECT, and the
+    row comes back through RETURNING where the database supports it, other
+    databases read it back by its row id.
+    Raises IntegrityError when the list already has an item with the name.
+    """
+    table = Shoppingitem.__table__
+    owned = exists().where(and_(Shoppinglist.id == sl_id,
+                                Shoppinglist.created_by == user_id,
+                                Shoppinglist.deleted_at.is_(None)))
+    values = {'name': name, 'price': price, 'quantity': quantity,
+              'in_shoppinglist': sl_id, 'created_by': user_id}
+    columns = sorted(values)
+    stmt = table.insert().from_select(
+        columns, select([literal(values[key], table.c[key].type) for key in columns])
+        .where(owned))
+    try:
+        # the dialect knows whether RETURNING works once it has connected
+        connection = db.session.connection(mapper=Shoppingitem.__mapper__)
+        if connection.dialect.implicit_returning:
+            row = connection.execute(stmt.returning(*table.columns)).first()
+        else:
+            result = connection.execute(stmt)
+            row = None
+            if result.rowcount:
+                row = connection.execute(
+                    select(table.columns).where(table.c.id == result.lastrowid)).first()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if row is not None:
+        response_cache.invalidate(user_id)
+    return row
@@ -0,0 +1,196 @@
+""" app/response_cache.py
+
+Server side cache of listing responses. Every page is cached under its
+owner's data version, users.data_version, which every write of one of the
+owner's lists or items counts up, so a page cached before the write is never
+looked up again and simply ages out.
+
+The data version doubles as the per user write counter in ETags, so a write
+in the same second as the previous response still changes the tag. It lives
+in the database, so every gunicorn worker agrees on it and each can keep its
+pages in process; RESPONSE_CACHE_URL points at a Redis server to share the
+pages between the workers as well.
+"""
+import calendar
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from flask import g, request, current_app, has_request_context, Response
+from app.metrics import metrics
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LocalBackend(object):
+    """Bounded in-process LRU store"""
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of key or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= now:
+                return None
+            # re-insert to mark it as the most recently used
+            self._entries[key] = entry
+            return value
+
+    def _store(self, key, value, ttl):
+        """Insert an entry, the caller holds the lock"""
+        self._entries.pop(key, None)
+        self._entries[key] = (time.time() + ttl if ttl else None, value)
+        while len(self._entries) > self.maxsize:
+            # evict the least recently used entry
+            self._entries.popitem(last=False)
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds, forever if ttl is None"""
+        with self._lock:
+            self._store(key, value, ttl)
+
+
+class RedisBackend(object):
+    """Store in a Redis compatible server shared by every worker"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        """Connect to the server at url"""
+        if redis is None:
+            raise RuntimeError('RESPONSE_CACHE_URL is set but redis is not installed')
+        return cls(redis.StrictRedis.from_url(url))
+
+    def get(self, key):
+        """Return the value of key or None"""
+        value = self.client.get(key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds, forever if ttl is None"""
+        self.client.set(key, value, ex=int(ttl) if ttl else None)
+
+
+class ResponseCache(object):
+    """Caches successful listing responses per user"""
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+
+    def init_app(self, app):
+        """Pick the backend from the app config"""
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        if not app.config['RESPONSE_CACHE_ENABLED']:
+            self.backend = None
+        elif app.config.get('RESPONSE_CACHE_URL'):
+            self.backend = RedisBackend.from_url(app.config['RESPONSE_CACHE_URL'])
+        else:
+            self.backend = LocalBackend(app.config['RESPONSE_CACHE_SIZE'])
+
+    def version(self, user_id):
+        """Data version of a user's lists and items, read once per request
+
+        Read through the request's session, so it comes from the same
+        database, primary or replica, as the rows it validates.
+        """
+        from app import db
+        from app.models import User
+        versions = g.setdefault('data_versions', {}) if has_request_context() else {}
+        if user_id not in versions:
+            versions[user_id] = db.session.query(User.data_version).filter(
+                User.id == user_id).scalar()
+        return versions[user_id]
+
+    def invalidate(self, user_id):
+        """Count a write of a user's lists or items, call after it is committed"""
+        from app import db
+        from app.models import User
+        users = User.__table__
+        try:
+            # on the primary in a transaction of its own, the write is done
+            with db.engine.begin() as connection:
+                connection.execute(users.update().where(users.c.id == user_id).values(
+                    data_version=users.c.data_version + 1))
+        except Exception:
+            current_app.logger.exception('Could not count a write of user %s', user_id)
+        if has_request_context():
+            g.pop('data_versions', None)
+
+    def page_key(self, user_id):
+        """Key of the page the current request asks for"""
+        query = u'&'.join(u'{}={}'.format(name, value)
+                          for name, value in sorted(request.args.items(multi=True)))
+        digest = hashlib.sha1(u'{}?{}'.format(request.path, query).encode('utf-8'))
+        return 'page:{}:{}:{}'.format(
+            user_id, self.version(user_id), digest.hexdigest())
+
+    def cached(self, funct):
+        """Serve a listing route from the cache, storing its 200 responses"""
+        @wraps(funct)
+        def lookup(user_id, *args, **kwargs):
+            """Replay the cached page or render and cache it"""
+            if self.backend is None:
+                return funct(user_id, *args, **kwargs)
+            try:
+                # the version is read before the page so a concurrent
+                # write can only leave the page under a retired version
+                key = self.page_key(user_id)
+                entry = self.backend.get(key)
+            except Exception:
+                current_app.logger.exception('Response cache lookup failed')
+                return funct(user_id, *args, **kwargs)
+            if entry is not None:
+                metrics.inc('response_cache_requests_total', (('result', 'hit'),))
+                return replay(json.loads(entry))
+
+            metrics.inc('response_cache_requests_total', (('result', 'miss'),))
+            response = current_app.make_response(funct(user_id, *args, **kwargs))
+            # a lagging replica's page would outlive the sticky window by the
+            # whole TTL, only pages read from the primary are stored
+            if response.status_code == 200 and not g.get('replica_bind'):
+                etag, _ = response.get_etag()
+                last_modified = response.last_modified
+                try:
+                    self.backend.set(key, json.dumps({
+                        'body': response.get_data(as_text=True),
+                        'etag': etag,
+                        'last_modified': calendar.timegm(last_modified.utctimetuple())
+                                         if last_modified else None,
+                    }), self.ttl)
+                except Exception:
+                    current_app.logger.exception('Response cache store failed')
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return lookup
+
+
+def replay(entry):
+    """Rebuild a response from a cache entry, honouring conditional headers"""
+    from app.conditional import not_modified, with_validators
+    last_modified = datetime.utcfromtimestamp(entry['last_modified']) \
+        if entry['last_modified'] is not None else None
+    if entry['etag']:
+        unchanged = not_modified(entry['etag'], last_modified)
+        if unchanged:
+            return unchanged
+    response = Response(entry['body'], mimetype='application/json')
+    if entry['etag']:
+        with_validators(response, entry['etag'], last_modified)
+    response.headers['X-Cache'] = 'HIT'
+    return response
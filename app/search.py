@@ -0,0 +1,134 @@
+""" app/search.py
+
+Name search for shopping lists and items. Postgres matches names through
+pg_trgm GIN indexes and ranks them by trigram similarity, SQLite matches them
+through FTS5 tables kept in sync by triggers and ranks them by bm25. Any other
+database falls back to an unindexed ILIKE scan.
+"""
+import re
+import sqlalchemy as sa
+from sqlalchemy import event, DDL
+from app import db
+from app.models import Shoppinglist, Shoppingitem
+
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+
+def trigram_ddl(table):
+    """DDL creating the trigram index backing ILIKE searches on a table"""
+    return [
+        DDL("CREATE INDEX ix_{0}_name_trgm ON {0} USING gin (name gin_trgm_ops)".format(table)),
+    ]
+
+
+def fts5_ddl(table):
+    """DDL creating an external content FTS5 table and the triggers syncing it"""
+    return [
+        DDL("CREATE VIRTUAL TABLE {0}_fts USING fts5("
+            "name, content='{0}', content_rowid='id')".format(table)),
+        DDL("CREATE TRIGGER {0}_fts_ai AFTER INSERT ON {0} BEGIN "
+            "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+            "END".format(table)),
+        DDL("CREATE TRIGGER {0}_fts_ad AFTER DELETE ON {0} BEGIN "
+            "INSERT INTO {0}_fts({0}_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+            "END".format(table)),
+        DDL("CREATE TRIGGER {0}_fts_au AFTER UPDATE OF name ON {0} BEGIN "
+            "INSERT INTO {0}_fts({0}_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+            "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+            "END".format(table)),
+    ]
+
+
+def fts5_available(bind):
+    """Check whether the SQLite library was compiled with FTS5"""
+    if bind.dialect.name != 'sqlite':
+        return False
+    if not hasattr(bind.dialect, 'fts5_available'):
+        options = [row[0] for row in bind.execute('PRAGMA compile_options')]
+        bind.dialect.fts5_available = 'ENABLE_FTS5' in options
+    return bind.dialect.fts5_available
+
+
+def search_backend(bind):
+    """Name the search backend used for a connection or engine"""
+    if bind.dialect.name == 'postgresql':
+        return 'trigram'
+    if fts5_available(bind):
+        return 'fts5'
+    return 'like'
+
+
+def _if_backend(backend):
+    """DDL execution predicate matching a search backend"""
+    def check(ddl, target, bind, **kwargs):
+        """Run the DDL only on the given backend"""
+        return search_backend(bind) == backend
+    return check
+
+
+def _register_ddl():
+    """Create and drop the search structures together with the tables"""
+    event.listen(db.Model.metadata, 'before_create', DDL(
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+            callable_=_if_backend('trigram')))
+    for model in (Shoppinglist, Shoppingitem):
+        table = model.__table__
+        for ddl in trigram_ddl(table.name):
+            event.listen(table, 'after_create',
+                         ddl.execute_if(callable_=_if_backend('trigram')))
+        for ddl in fts5_ddl(table.name):
+            event.listen(table, 'after_create',
+                         ddl.execute_if(callable_=_if_backend('fts5')))
+        event.listen(table, 'before_drop', DDL(
+            "DROP TABLE IF EXISTS {}_fts".format(table.name)).execute_if(
+                callable_=_if_backend('fts5')))
+
+
+_register_ddl()
+
+
+def escape_like(search_query):
+    """Escape LIKE wildcards so the search term matches literally"""
+    return search_query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def fts5_terms(search_query):
+    """Turn a search term into an FTS5 prefix query, one prefix per word"""
+    return ' AND '.join('"{}"*'.format(token)
+                        for token in TOKEN_REGEX.findall(search_query))
+
+
+def ranked(query, model, search_query):
+    """Filter a query down to names matching the search term, best match first"""
+    # the shard or replica the query runs on, which need not match the primary
+    backend = search_backend(db.session.get_bind(mapper=model.__mapper__))
+    if backend == 'fts5':
+        terms = fts5_terms(search_query)
+        if not terms:
+            return query.filter(sa.false())
+        fts = sa.table(model.__tablename__ + '_fts',
+                       sa.column('rowid'), sa.column('rank'))
+        return query.join(fts, fts.c.rowid == model.id).filter(
+            sa.text('{} MATCH :terms'.format(fts.name)).bindparams(terms=terms)
+        ).order_by(fts.c.rank, model.id)
+
+    query = query.filter(model.name.ilike(
+        '%' + escape_like(search_query) + '%', escape='\\'))
+    if backend == 'trigram':
+        return query.order_by(
+            sa.func.similarity(model.name, search_query).desc(), model.id)
+    return query.order_by(model.id)
+
+
+def search_shoppinglists(user_id, search_query, page_no, limit):
+    """Get a page of the user's shopping lists whose name matches the search term"""
+    query = Shoppinglist.get_all(user_id)
+    return ranked(query, Shoppinglist, search_query).limit(
+        limit).offset((page_no - 1) * limit).all()
+
+
+def search_shoppingitems(user_id, sl_id, search_query, page_no, limit):
+    """Get a page of shopping items in a list whose name matches the search term"""
+    query = Shoppingitem.get_all_items(sl_id, user_id)
+    return ranked(query, Shoppingitem, search_query).limit(
+        limit).offset((page_no - 1) * limit).all()
@@ -0,0 +1,129 @@
+""" app/serializers.py
+
+Central JSON serialization. Each model has a precompiled field spec, a
+single attrgetter fetches every field of a row at once and dates are
+formatted the way Flask's jsonify formats them, so responses keep their
+keys, key order and values. Output is compact and encoded with orjson or
+ujson when one is installed, falling back to the standard library.
+"""
+import json
+from operator import attrgetter
+from flask import Response
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+          'Nov', 'Dec')
+
+
+def format_date(value):
+    """Format a datetime as an HTTP date, like jsonify, naive values are UTC"""
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return '{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT'.format(
+        WEEKDAYS[value.weekday()], value.day, MONTHS[value.month - 1], value.year,
+        value.hour, value.minute, value.second)
+
+
+class Serializer(object):
+    """Precompiled field spec of a model, turns rows into dicts"""
+
+    def __init__(self, fields, dates=()):
+        """Initialize with the field names, at least two, and which of them are dates"""
+        self.fields = tuple(fields)
+        self._get = attrgetter(*self.fields)
+        self._dates = tuple(self.fields.index(name) for name in dates)
+
+    def columns(self, model):
+        """The model's columns for the fields, in field order"""
+        return [getattr(model, name) for name in self.fields]
+
+    def dump(self, obj):
+        """Serialize one object, row tuple or DTO"""
+        return self.dump_row(self._get(obj))
+
+    def dump_many(self, objs):
+        """Serialize a page of objects"""
+        return [self.dump(obj) for obj in objs]
+
+    def dump_rows(self, rows):
+        """Serialize rows selected with columns(), reading the tuples positionally"""
+        if not self._dates:
+            fields = self.fields
+            return [dict(zip(fields, row)) for row in rows]
+        return [self.dump_row(row) for row in rows]
+
+    def dump_row(self, values):
+        """Build the dict of a row's values, given in field order"""
+        if self._dates:
+            values = list(values)
+            for index in self._dates:
+                if values[index] is not None:
+                    values[index] = format_date(values[index])
+        return dict(zip(self.fields, values))
+
+
+USER = Serializer(('id', 'email'))
+SHOPPINGLIST = Serializer(
+    ('id', 'name', 'date_created', 'date_modified', 'created_by'),
+    dates=('date_created', 'date_modified'))
+SHOPPINGLIST_SUMMARY = Serializer(
+    ('id', 'name', 'date_created'), dates=('date_created',))
+SHOPPINGITEM = Serializer(
+    ('id', 'name', 'price', 'quantity', 'date_created', 'date_modified',
+     'in_shoppinglist', 'created_by'),
+    dates=('date_created', 'date_modified'))
+SHOPPINGITEM_SUMMARY = Serializer(('id', 'name', 'price', 'quantity'))
+SHOPPINGLIST_EXPORT = Serializer(
+    ('id', 'name', 'date_created', 'date_modified'),
+    dates=('date_created', 'date_modified'))
+SHOPPINGITEM_EXPORT = Serializer(
+    ('id', 'name', 'price', 'quantity', 'date_created', 'date_modified'),
+    dates=('date_created', 'date_modified'))
+
+
+def dumps_orjson(data):
+    """Encode with orjson"""
+    return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+
+
+def dumps_ujson(data):
+    """Encode with ujson"""
+    return ujson.dumps(data, sort_keys=True, escape_forward_slashes=False).encode('utf-8')
+
+
+def dumps_json(data):
+    """Encode with the standard library"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+BACKENDS = {'orjson': dumps_orjson, 'ujson': dumps_ujson, 'json': dumps_json}
+AVAILABLE = {'orjson': orjson is not None, 'ujson': ujson is not None, 'json': True}
+dumps = dumps_json
+
+
+def use_json_backend(name='auto'):
+    """Pick the JSON encoder, auto prefers orjson, then ujson"""
+    global dumps
+    if name == 'auto':
+        name = next(backend for backend in ('orjson', 'ujson', 'json')
+                    if AVAILABLE[backend])
+    if name not in BACKENDS:
+        raise ValueError('Unknown JSON backend {}'.format(name))
+    if not AVAILABLE[name]:
+        raise RuntimeError('JSON_BACKEND is {} but it is not installed'.format(name))
+    dumps = BACKENDS[name]
+    return name
+
+
+def json_response(data, status=200):
+    """Response with data encoded as compact JSON, keys sorted like jsonify"""
+    return Response(dumps(data), status=status, mimetype='application/json')
@@ -0,0 +1,174 @@
+""" app/shards.py
+
+Horizontal sharding of shopping lists and items by user id. Every bind named
+shard_* in SQLALCHEMY_BINDS holds the lists and items of some users, while
+users stay in the primary database, which serves as the directory: users.shard
+records the shard of each user. A consistent hash ring picks it when the user
+registers. Every list and item query is scoped by its owner, so a request
+only ever touches the shard of the user it authenticated; outside a request
+the code picks a shard with using() or for_user(), or walks all of them with
+each().
+
+Adding a shard changes where the ring places users but not where they are
+recorded, so nobody loses sight of their lists. app.rebalance then moves the
+users the ring now places on the new shard and updates their record. Append
+new shards to the end of DATABASE_SHARD_URLS, since a shard's place on the
+ring comes from its bind name.
+"""
+import bisect
+import hashlib
+import threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import select
+from sqlalchemy.sql.util import find_tables
+
+SHARDED_TABLES = frozenset(['shoppinglists', 'shoppingitems'])
+
+
+class ShardMoving(Exception):
+    """Raised for writes of a user whose lists are being moved to another shard"""
+
+
+def shard_binds(app):
+    """Names of the shard binds configured for an app"""
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or ()
+                  if key.startswith('shard'))
+
+
+def ring_hash(value):
+    """Position of a value on the ring, the same in every process"""
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """Consistent hash ring, each node owns many small arcs of the ring"""
+
+    def __init__(self, nodes, vnodes=64):
+        """Initialize with the node names and the points each one gets"""
+        self.nodes = sorted(nodes)
+        points = sorted((ring_hash('{}#{}'.format(node, number)), node)
+                        for node in self.nodes for number in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key):
+        """The node owning a key, the first point clockwise from its hash"""
+        index = bisect.bisect(self._hashes, ring_hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+def table_names(mapper, clause):
+    """Names of the tables a statement or mapper touches"""
+    names = set()
+    if mapper is not None:
+        names.add(mapper.local_table.name)
+    if clause is not None:
+        names.update(table.name for table in find_tables(
+            clause, include_crud=True))
+    return names
+
+
+class ShardRouter(object):
+    """Maps users to shards and tracks the shard the current code works on"""
+
+    def __init__(self):
+        self.ring = None
+        self._local = threading.local()
+
+    def init_app(self, app):
+        """Build the ring from the app's shard binds, no binds turn sharding off"""
+        binds = shard_binds(app)
+        self.ring = HashRing(binds, app.config['SHARD_VNODES']) if binds else None
+
+    @property
+    def enabled(self):
+        """Whether lists and items live on shards"""
+        return self.ring is not None
+
+    def shard_for(self, user_id):
+        """Shard the ring places a user on"""
+        return self.ring.node(user_id)
+
+    def placement(self, user_id):
+        """Shard recorded for a user and whether they are being moved
+
+        Read from the primary, never a replica, since a stale record would
+        show a user the shard their lists just left.
+        """
+        from app import db
+        from app.models import User
+        row = db.session.execute(
+            select([User.shard, User.shard_moving]).where(User.id == user_id),
+            bind=db.engine).first()
+        if row is None or row.shard is None:
+            # registered before sharding was set up, see app.rebalance.place_users
+            return self.shard_for(user_id), False
+        return row.shard, bool(row.shard_moving)
+
+    def identify(self, user_id, bind=None):
+        """Route the current request's list and item queries to the user's shard
+
+        bind is the shard cached with the user's token, which is never one
+        being moved from, otherwise it is looked up. Returns the shard and
+        whether the user is being moved.
+        """
+        if not self.enabled:
+            return None, False
+        from app.replicas import READ_METHODS
+        bind, moving = (bind, False) if bind is not None else self.placement(user_id)
+        if moving and request.method not in READ_METHODS:
+            raise ShardMoving('Your shopping lists are being moved, please retry shortly')
+        g.shard_bind = bind
+        return bind, moving
+
+    @contextmanager
+    def using(self, bind):
+        """Run the block against one shard"""
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(bind)
+        try:
+            yield bind
+        finally:
+            stack.pop()
+
+    def for_user(self, user_id):
+        """Run the block against a user's shard, a no-op without sharding"""
+        if not self.enabled:
+            return self.using(None)
+        bind, moving = self.placement(user_id)
+        if moving:
+            raise ShardMoving('The shopping lists of user {} are being moved'.format(user_id))
+        return self.using(bind)
+
+    def each(self):
+        """Run the loop body once per shard, or once against the primary"""
+        from app import db
+        for bind in self.ring.nodes if self.enabled else [None]:
+            with self.using(bind):
+                try:
+                    yield bind
+                finally:
+                    # rows of different shards can share ids, keep their sessions apart
+                    db.session.remove()
+
+    def current(self):
+        """Shard the running code works on, or None"""
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            return stack[-1]
+        if has_request_context():
+            return g.get('shard_bind')
+        return None
+
+    def bind_key(self, mapper=None, clause=None):
+        """Shard bind for a statement on lists or items, None for the primary"""
+        if not self.enabled or not table_names(mapper, clause) & SHARDED_TABLES:
+            return None
+        bind = self.current()
+        if bind is None:
+            raise RuntimeError('No shard selected for a shopping list or item query')
+        return bind
+
+
+shards = ShardRouter()
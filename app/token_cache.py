@@ -0,0 +1,67 @@
+""" app/token_cache.py
+
+Per process cache of verified access tokens, so an authenticated request
+skips both the HS256 verification and the user lookup, and with sharding the
+lookup of the user's shard as well.
+"""
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+# Lightweight stand in for the User row, exposed to handlers as g.current_user,
+# shard is the shard the user's lists were on when the entry was cached
+Principal = namedtuple('Principal', ['id', 'email', 'shard'])
+Principal.__new__.__defaults__ = (None,)
+
+
+class TokenCache(object):
+    """Bounded LRU cache of verified tokens, each entry expiring no later than its token"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """Initialize with the maximum number of entries and their time to live in seconds"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """Return the cached (claims, principal) of a token or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(token, None)
+            if entry is None:
+                return None
+            expires_at, claims, principal = entry
+            if expires_at <= now:
+                return None
+            # re-insert to mark it as the most recently used
+            self._entries[token] = entry
+            return claims, principal
+
+    def set(self, token, claims, principal):
+        """Cache the claims and principal of a verified token"""
+        if self.maxsize < 1:
+            return
+        expires_at = min(time.time() + self.ttl, claims['exp'])
+        with self._lock:
+            self._entries.pop(token, None)
+            self._entries[token] = (expires_at, claims, principal)
+            while len(self._entries) > self.maxsize:
+                # evict the least recently used token
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user, e.g. after their profile changes"""
+        with self._lock:
+            stale = [token for token, entry in self._entries.items()
+                     if entry[2].id == user_id]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self):
+        """Drop every cached token"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,85 @@
+""" benchmarks/cascade_delete.py
+
+Deletes large shopping lists the way the ORM cascade used to, loading every
+item and deleting them one by one, and the way the models do now, one
+DELETE that the database cascades to the items, and prints the time and
+statements each delete took.
+
+    python -m benchmarks.cascade_delete --lists 5 --items 5000
+"""
+from __future__ import print_function
+import argparse
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import create_app, db
+from app.models import Shoppinglist, Shoppingitem
+from benchmarks.utils import seed
+
+
+class StatementCounter(object):
+    """Counts the statements sent to the database, executemany once per row"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += len(parameters) if executemany else 1
+
+
+def delete_loaded(shoppinglist):
+    """Delete with the items loaded into the session first, like delete-orphan did"""
+    list(shoppinglist.shoppingitems)
+    db.session.delete(shoppinglist)
+    db.session.commit()
+
+
+def delete_cascaded(shoppinglist):
+    """Delete through the model, the database removes the items"""
+    shoppinglist.delete()
+
+
+def report(label, delete, lists, items):
+    """Seed lists of items, delete them all and print the mean cost per list"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    seed(1, lists, items)
+    counter = StatementCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    elapsed = 0.0
+    try:
+        for sl_id in range(1, lists + 1):
+            start = time.time()
+            delete(Shoppinglist.query.get(sl_id))
+            elapsed += time.time() - start
+            db.session.expunge_all()
+    finally:
+        event.remove(Engine, 'before_cursor_execute', counter)
+    left = Shoppingitem.query.count()
+    print('{:<10} {:10.2f} ms/list {:8.0f} statements/list {:6d} items left'.format(
+        label, elapsed / lists * 1000, counter.count / float(lists), left))
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--lists', type=int, default=5)
+    parser.add_argument('--items', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_app(config_name=args.config)
+    # measure the hard delete, not the soft delete's UPDATE
+    app.config['SOFT_DELETE'] = False
+    with app.app_context():
+        try:
+            report('loaded', delete_loaded, args.lists, args.items)
+            report('cascaded', delete_cascaded, args.lists, args.items)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
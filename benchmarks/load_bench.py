@@ -0,0 +1,286 @@
+""" benchmarks/load_bench.py
+
+Load test of the HTTP API. Seeds users, lists and items, then drives every
+route from concurrent clients and reports latency percentiles, throughput and
+SQL queries per request for each route. Results are written as JSON so two
+runs can be compared.
+
+    python -m benchmarks.load_bench --database-url sqlite:////tmp/bench.db \\
+        --users 20 --lists 10 --items 50 --concurrency 8 --iterations 50 \\
+        --output results.json --baseline previous.json
+
+Without --url the app runs in process and SQL queries are counted on every
+engine, replicas and shards included. With --url the requests go to a running
+server, e.g. gunicorn, and only latency and throughput are measured. The
+server's database is neither seeded nor dropped then, seed it first with
+--seed-only:
+
+    python -m benchmarks.load_bench --database-url postgresql://.../db --seed-only
+    python -m benchmarks.load_bench --url http://localhost:8000
+"""
+from __future__ import print_function
+import argparse
+import json
+import sys
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import create_app, db, hasher
+from benchmarks.utils import percentile, seed
+
+PASSWORD = 'password123'
+
+
+class InProcessClient(object):
+    """Sends requests through the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, token=None, data=None):
+        """Send a request, returns the status code and decoded JSON body"""
+        headers = {'Authorization': 'Bearer ' + token} if token else {}
+        res = self.client.open(path, method=method, headers=headers, data=data)
+        try:
+            body = json.loads(res.data.decode())
+        except ValueError:
+            body = None
+        return res.status_code, body
+
+
+class HTTPClient(object):
+    """Sends requests to a running server"""
+
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, token=None, data=None):
+        """Send a request, returns the status code and decoded JSON body"""
+        headers = {'Authorization': 'Bearer ' + token} if token else {}
+        res = self.session.request(method, self.url + path, headers=headers, data=data)
+        try:
+            body = res.json()
+        except ValueError:
+            body = None
+        return res.status_code, body
+
+
+class QueryCounter(object):
+    """Counts the SQL statements executed by the current thread on any engine"""
+
+    def __init__(self):
+        self._local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        """Start counting from zero"""
+        self._local.count = 0
+
+    @property
+    def count(self):
+        """Statements executed since the last reset"""
+        return getattr(self._local, 'count', 0)
+
+
+class Recorder(object):
+    """Collects latency, status and query count samples per route"""
+
+    def __init__(self, client, counter=None):
+        self.client = client
+        self.counter = counter
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def call(self, route, method, path, token=None, data=None):
+        """Send a request and record it under route"""
+        if self.counter:
+            self.counter.reset()
+        start = time.time()
+        status, body = self.client.request(method, path, token, data)
+        elapsed = time.time() - start
+        queries = self.counter.count if self.counter else None
+        with self._lock:
+            sample = self.samples.setdefault(
+                route, {'latencies': [], 'statuses': {}, 'queries': []})
+            sample['latencies'].append(elapsed)
+            sample['statuses'][str(status)] = sample['statuses'].get(str(status), 0) + 1
+            if queries is not None:
+                sample['queries'].append(queries)
+        return status, body
+
+
+def scenario(recorder, worker, args):
+    """One simulated client: register, log in, then exercise every route"""
+    recorder.call('POST /auth/register/', 'POST', '/auth/register/', data={
+        'email': 'load{}@bench.io'.format(worker), 'password': PASSWORD})
+    uid = worker % args.users + 1
+    status, body = recorder.call('POST /auth/login/', 'POST', '/auth/login/', data={
+        'email': 'user{}@bench.io'.format(uid), 'password': PASSWORD})
+    if status != 200:
+        print('client {}: login as user{}@bench.io failed with {}: {}'.format(
+            worker, uid, status, (body or {}).get('message')), file=sys.stderr)
+        return
+    token = body['access_token']
+    first_list = (uid - 1) * args.lists + 1
+    pages = max(1, args.lists // 4)
+
+    recorder.call('POST /shoppinglists/', 'POST', '/shoppinglists/', token,
+                  data={'name': 'load list {}'.format(worker)})
+    for i in range(args.iterations):
+        sl_id = first_list + i % args.lists
+        recorder.call('GET /user', 'GET', '/user', token)
+        recorder.call('GET /shoppinglists/', 'GET',
+                      '/shoppinglists/?limit=4&page={}'.format(i % pages + 1), token)
+        recorder.call('GET /shoppinglists/?q=', 'GET', '/shoppinglists/?q=list', token)
+        recorder.call('GET /shoppinglists/<id>', 'GET',
+                      '/shoppinglists/{}'.format(sl_id), token)
+        recorder.call('GET /shoppinglists/<id>/items', 'GET',
+                      '/shoppinglists/{}/items?limit=7'.format(sl_id), token)
+        recorder.call('GET /shoppinglists/<id>/items?q=', 'GET',
+                      '/shoppinglists/{}/items?q=item'.format(sl_id), token)
+        status, body = recorder.call(
+            'POST /shoppinglists/<id>/items', 'POST',
+            '/shoppinglists/{}/items'.format(sl_id), token,
+            data={'name': 'load {} {}'.format(worker, i), 'price': '20', 'quantity': '2'})
+        if status != 201:
+            continue
+        item_path = '/shoppinglists/{}/items/{}'.format(sl_id, body['id'])
+        recorder.call('GET /shoppinglists/<id>/items/<id>', 'GET', item_path, token)
+        recorder.call('PUT /shoppinglists/<id>/items/<id>', 'PUT', item_path, token,
+                      data={'quantity': '3'})
+        recorder.call('DELETE /shoppinglists/<id>/items/<id>', 'DELETE', item_path, token)
+
+
+def summarize(samples, elapsed):
+    """Reduce the raw samples to per route statistics"""
+    routes = {}
+    for route, sample in sorted(samples.items()):
+        latencies = sample['latencies']
+        routes[route] = {
+            'requests': len(latencies),
+            'statuses': sample['statuses'],
+            'rps': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_per_request': (sum(sample['queries']) / float(len(sample['queries'])))
+                                   if sample['queries'] else None,
+        }
+    return routes
+
+
+def compare(results, baseline, threshold):
+    """Print the p95 change per route, returns the routes that regressed"""
+    regressions = []
+    print('\n{:<40} {:>12} {:>12} {:>8}'.format('route', 'baseline p95', 'p95', 'change'))
+    for route, stats in results['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before or not before['p95_ms']:
+            continue
+        change = stats['p95_ms'] / before['p95_ms'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(route)
+            flag = '  REGRESSION'
+        print('{:<40} {:>10.1f}ms {:>10.1f}ms {:>+7.0%}{}'.format(
+            route, before['p95_ms'], stats['p95_ms'], change, flag))
+    return regressions
+
+
+def main():
+    """Run the load test"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--database-url', help='overrides the config database')
+    parser.add_argument('--url', help='drive a running server instead of the app in process')
+    parser.add_argument('--seed-only', action='store_true',
+                        help='seed the database for a later run with --url and exit')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--lists', type=int, default=10)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against a previous results file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='p95 increase that counts as a regression')
+    args = parser.parse_args()
+
+    app = create_app(config_name=args.config)
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+
+    if args.url:
+        # the server's database is not ours to seed or drop
+        client, counter, backend = HTTPClient(args.url), None, None
+    else:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(args.users, max(args.lists, 1), args.items, hasher.hash(PASSWORD))
+            backend = db.engine.dialect.name
+        if args.seed_only:
+            return
+        client, counter = InProcessClient(app), QueryCounter()
+    try:
+        recorder = Recorder(client, counter)
+        workers = [threading.Thread(target=scenario, args=(recorder, worker, args))
+                   for worker in range(args.concurrency)]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+    finally:
+        if not args.url:
+            with app.app_context():
+                db.session.remove()
+                db.drop_all()
+
+    total = sum(len(sample['latencies']) for sample in recorder.samples.values())
+    results = {
+        'meta': {
+            'database': backend,
+            'target': args.url or 'in process',
+            'users': args.users,
+            'lists': args.lists,
+            'items': args.items,
+            'concurrency': args.concurrency,
+            'iterations': args.iterations,
+            'elapsed_seconds': elapsed,
+            'requests': total,
+            'rps': total / elapsed,
+        },
+        'routes': summarize(recorder.samples, elapsed),
+    }
+
+    print('{:<40} {:>6} {:>8} {:>8} {:>8} {:>8} {:>7}'.format(
+        'route', 'reqs', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+    for route, stats in sorted(results['routes'].items()):
+        queries = stats['queries_per_request']
+        print('{:<40} {:>6} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>7}'.format(
+            route, stats['requests'], stats['rps'], stats['p50_ms'],
+            stats['p95_ms'], stats['p99_ms'],
+            '-' if queries is None else '{:.1f}'.format(queries)))
+    print('total {} requests in {:.1f}s, {:.1f} req/s'.format(
+        total, elapsed, results['meta']['rps']))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            if compare(results, json.load(baseline), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+""" benchmarks/login_throughput.py
+
+Measures login throughput while many clients log in at once, and how long a
+cheap authenticated route takes while the logins are running.
+
+    python -m benchmarks.login_throughput --concurrency 16 --logins 400
+"""
+from __future__ import print_function
+import argparse
+import json
+import threading
+import time
+from app import create_app, db
+from app.models import User
+from benchmarks.utils import percentile
+
+
+def login_worker(app, credentials, count, latencies, statuses, lock):
+    """Log in count times and record each latency and status code"""
+    client = app.test_client()
+    for _ in range(count):
+        start = time.time()
+        res = client.post('/auth/login/', data=credentials)
+        elapsed = time.time() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+
+def probe_worker(app, token, stop, latencies):
+    """Hit the profile route until stopped, recording its latency"""
+    client = app.test_client()
+    headers = dict(Authorization="Bearer " + token)
+    while not stop.is_set():
+        start = time.time()
+        client.get('/user', headers=headers)
+        latencies.append(time.time() - start)
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--rounds', type=int,
+                        help='bcrypt work factor, defaults to the config value')
+    args = parser.parse_args()
+
+    app = create_app(config_name=args.config)
+    if args.rounds:
+        app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+        from app import hasher
+        hasher.init_app(app)
+    credentials = {'email': 'bench@gmail.com', 'password': 'password123'}
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    try:
+        with app.app_context():
+            User(**credentials).save()
+        token = json.loads(app.test_client().post(
+            '/auth/login/', data=credentials).data.decode())['access_token']
+
+        latencies, probes, statuses = [], [], {}
+        lock = threading.Lock()
+        stop = threading.Event()
+        probe = threading.Thread(target=probe_worker,
+                                 args=(app, token, stop, probes))
+        workers = [threading.Thread(
+            target=login_worker,
+            args=(app, credentials, args.logins // args.concurrency,
+                  latencies, statuses, lock))
+                   for _ in range(args.concurrency)]
+
+        start = time.time()
+        probe.start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+        stop.set()
+        probe.join()
+
+        print('bcrypt rounds   {}'.format(app.config['BCRYPT_LOG_ROUNDS']))
+        print('hash workers    {}'.format(app.config['PASSWORD_HASH_WORKERS']))
+        print('concurrency     {}'.format(args.concurrency))
+        print('logins/s        {:.1f}'.format(len(latencies) / elapsed))
+        print('status codes    {}'.format(statuses))
+        for name, samples in [('login', latencies), ('profile', probes)]:
+            print('{:<8} p50 {:8.1f} ms  p95 {:8.1f} ms  p99 {:8.1f} ms'.format(
+                name, percentile(samples, 50) * 1000,
+                percentile(samples, 95) * 1000, percentile(samples, 99) * 1000))
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+""" benchmarks/query_plans.py
+
+Seeds the database and prints the query plans of the owner scoped lookups
+with and without the composite indexes declared on the models.
+
+    python -m benchmarks.query_plans --users 50 --lists 20 --items 50
+"""
+from __future__ import print_function
+import argparse
+import timeit
+from app import create_app, db
+from app.models import Shoppinglist, Shoppingitem
+from benchmarks.utils import seed
+
+
+def lookups(user_id, sl_id):
+    """The queries issued by the shopping list and item routes"""
+    return [
+        ('list page', Shoppinglist.query.filter_by(
+            created_by=user_id).limit(4)),
+        ('list by id', Shoppinglist.query.filter_by(
+            id=sl_id, created_by=user_id)),
+        ('item page', Shoppingitem.query.filter_by(
+            created_by=user_id, in_shoppinglist=sl_id).limit(7)),
+        ('item by id', Shoppingitem.query.filter_by(
+            id=1, in_shoppinglist=sl_id, created_by=user_id)),
+    ]
+
+
+def explain(query):
+    """Return the database's plan for a query"""
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(
+        dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    return [' '.join(str(col) for col in row)
+            for row in db.engine.execute(prefix + sql)]
+
+
+def report(label, user_id, sl_id, repeat):
+    """Print the plan and mean execution time of every lookup"""
+    if db.engine.dialect.name == 'postgresql':
+        db.engine.execute('ANALYZE')
+    print('==== {} ===='.format(label))
+    for name, query in lookups(user_id, sl_id):
+        elapsed = timeit.timeit(query.all, number=repeat) / repeat
+        print('{:<12} {:8.3f} ms'.format(name, elapsed * 1000))
+        for line in explain(query):
+            print('    ' + line)
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--lists', type=int, default=20)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    app = create_app(config_name=args.config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            seed(args.users, args.lists, args.items)
+            # probe the last user, whose rows sit at the end of the heap
+            user_id = args.users
+            sl_id = args.users * args.lists
+            indexes = list(Shoppinglist.__table__.indexes) + \
+                list(Shoppingitem.__table__.indexes)
+
+            for index in indexes:
+                index.drop(db.engine)
+            report('without indexes', user_id, sl_id, args.repeat)
+
+            for index in indexes:
+                index.create(db.engine)
+            report('with indexes', user_id, sl_id, args.repeat)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
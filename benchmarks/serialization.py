@@ -0,0 +1,81 @@
+""" benchmarks/serialization.py
+
+Times serializing pages of shopping items: the hand built dicts passed to
+jsonify that the routes used to build, against the precompiled serializer
+with every JSON backend that is installed.
+
+    python -m benchmarks.serialization --items 1000 --rounds 200
+"""
+from __future__ import print_function
+import argparse
+import timeit
+from datetime import datetime
+from flask import jsonify
+from app import create_app
+from app.models import Shoppingitem
+from app.serializers import SHOPPINGITEM, AVAILABLE, BACKENDS, json_response, \
+    use_json_backend
+
+
+def make_items(count):
+    """Transient shopping items with every column filled in"""
+    now = datetime.utcnow()
+    items = []
+    for ino in range(count):
+        item = Shoppingitem(name='item {}'.format(ino), price=10.5, quantity=2.0,
+                            in_shoppinglist=1, created_by=1)
+        item.id = ino + 1
+        item.date_created = item.date_modified = now
+        items.append(item)
+    return items
+
+
+def jsonify_page(items):
+    """The page as the routes used to build it"""
+    return jsonify([{
+        "id": item.id,
+        "name": item.name,
+        "price": item.price,
+        "quantity": item.quantity,
+        "date_created": item.date_created,
+        "date_modified": item.date_modified,
+        "in_shoppinglist": item.in_shoppinglist,
+        "created_by": item.created_by
+    } for item in items])
+
+
+def serializer_page(items):
+    """The page through the shared serializer"""
+    return json_response(SHOPPINGITEM.dump_many(items))
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='production')
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app(config_name=args.config)
+    items = make_items(args.items)
+    cases = [('jsonify', jsonify_page)]
+    cases.extend(('serializer + ' + name, serializer_page)
+                 for name in sorted(BACKENDS) if AVAILABLE[name])
+
+    print('{} items per page, best of 3 x {} rounds'.format(args.items, args.rounds))
+    with app.test_request_context('/'):
+        baseline = None
+        for label, page in cases:
+            if label.startswith('serializer'):
+                use_json_backend(label.split(' + ')[1])
+            size = len(page(items).get_data())
+            best = min(timeit.repeat(lambda: page(items), number=args.rounds,
+                                     repeat=3)) / args.rounds
+            baseline = baseline or best
+            print('{:<22} {:8.2f} ms/page  {:6.1f}x  {:8d} bytes'.format(
+                label, best * 1000, baseline / best, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" benchmarks/utils.py
+
+Helpers shared by the benchmarks.
+"""
+from app import db
+from app.models import User, Shoppinglist, Shoppingitem
+
+
+def percentile(samples, pct):
+    """Return the pct percentile of a list of samples"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def seed(users, lists, items, password_hash='x'):
+    """Bulk insert users, their shopping lists and shopping items
+
+    User n is user{n}@bench.io and every user shares password_hash.
+    """
+    db.engine.execute(User.__table__.insert(), [
+        {'id': uid, 'email': 'user{}@bench.io'.format(uid), 'password': password_hash}
+        for uid in range(1, users + 1)])
+    list_rows = []
+    item_rows = []
+    for uid in range(1, users + 1):
+        for lno in range(lists):
+            sl_id = (uid - 1) * lists + lno + 1
+            list_rows.append({'id': sl_id, 'name': 'list {}'.format(sl_id),
+                              'created_by': uid})
+            for ino in range(items):
+                item_rows.append({'name': 'item {}'.format(ino), 'price': 10.0,
+                                  'quantity': 1.0, 'in_shoppinglist': sl_id,
+                                  'created_by': uid})
+    if list_rows:
+        db.engine.execute(Shoppinglist.__table__.insert(), list_rows)
+    if item_rows:
+        db.engine.execute(Shoppingitem.__table__.insert(), item_rows)
+    if db.engine.dialect.name == 'postgresql':
+        # ids were inserted explicitly, move the sequences past them
+        for table in ('users', 'shoppinglists'):
+            db.engine.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "(SELECT COALESCE(MAX(id), 1) FROM {0}))".format(table))
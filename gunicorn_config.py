@@ -0,0 +1,78 @@
+""" gunicorn_config.py
+
+Production server settings. Used by the Procfile:
+
+    gunicorn -c gunicorn_config.py run:app
+
+Send HUP to the master to gracefully restart the workers, or USR2 then TERM
+to the old master to roll out new code, since the app is preloaded.
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 5000))
+
+# Processes for CPU bound work such as bcrypt, threads to overlap database I/O
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Build the app once in the master and fork it into the workers
+preload_app = True
+
+# Keep client connections open between requests behind the load balancer
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers to bound memory growth, jittered so they don't restart together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = '-'
+errorlog = '-'
+
+# Per process read-your-writes markers can't see writes made through other
+# workers, a write on one worker would be followed by a read of a lagging
+# replica on another
+if workers > 1 and os.environ.get('DATABASE_REPLICA_URLS') and not (
+        os.environ.get('REPLICA_STICKY_URL') or os.environ.get('RESPONSE_CACHE_URL')):
+    os.environ.setdefault('REPLICA_READS_ENABLED', 'False')
+
+# Workers publish their metrics here so /metrics can sum every worker
+os.environ.setdefault('METRICS_DIR', '/tmp/shoppinglist-metrics')
+
+
+def on_starting(server):
+    """Start with an empty metrics directory"""
+    directory = os.environ['METRICS_DIR']
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master"""
+    from app import db
+    from run import app
+    with app.app_context():
+        db.engine.dispose()
+        # read replicas and shards
+        for bind in app.config.get('SQLALCHEMY_BINDS') or ():
+            db.get_engine(app, bind=bind).dispose()
+
+
+def worker_exit(server, worker):
+    """Deliver the mail a worker still has queued before it exits"""
+    from app import mail_queue
+    from run import app
+    left = mail_queue.drain(app.config['MAIL_DRAIN_TIMEOUT'])
+    if left:
+        server.log.warning('Worker %s exited with %s mails unsent', worker.pid, left)
+
+
+def child_exit(server, worker):
+    """Fold the counters of a worker that exited into the dead total"""
+    from app.metrics import metrics
+    metrics.mark_process_dead(worker.pid)
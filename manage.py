@@ -22,5 +22,127 @@ manager = Manager(app)
 # e.g python manage.py db init
 manager.add_command('db', MigrateCommand)
 
+
+@manager.option('path', help='CSV or NDJSON file to import')
+@manager.option('-e', '--email', dest='email', required=True,
+                help='user who will own the lists')
+@manager.option('-f', '--format', dest='import_format', default=None,
+                help='csv or ndjson, guessed from the file name by default')
+@manager.option('-s', '--start-row', dest='start_row', type=int, default=0,
+                help='skip rows a previous run already imported')
+def import_lists(path, email, import_format, start_row):
+    """Bulk import shopping lists and items for a user
+    e.g python manage.py import_lists -e user@mail.com lists.csv
+    """
+    from app.models import User
+    from app.importer import import_rows, read_rows
+    from app.shards import shards
+
+    def progress(report):
+        """Print the outcome of every chunk"""
+        print('rows {}-{}: {} lists, {} items, {} skipped, {} errors{}'.format(
+            report['first_row'], report['last_row'], report['lists_created'],
+            report['items_created'], report['skipped'], len(report['errors']),
+            ' (chunk rolled back)' if report.get('failed') else ''))
+        for error in report['errors']:
+            print('  row {}: {}'.format(error['row'], error['message']))
+
+    if import_format is None:
+        import_format = 'ndjson' if path.endswith(('.ndjson', '.json')) else 'csv'
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        print('No user with email {}'.format(email))
+        return 1
+    with open(path, 'rb') as source, shards.for_user(user.id):
+        result = import_rows(user.id, read_rows(source, import_format),
+                             app.config['IMPORT_CHUNK_SIZE'], start_row, progress)
+    print('imported {lists_created} lists and {items_created} items, skipped {skipped}, '
+          'read {rows} rows'.format(**result))
+    if result['errors']:
+        print('re-run with --start-row N from the first failed chunk to retry it')
+        return 1
+
+
+@manager.option('-w', '--watch', dest='watch', action='store_true', default=False,
+                help='keep purging every PURGE_INTERVAL seconds')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+                help='rows deleted per transaction, PURGE_BATCH_SIZE by default')
+@manager.option('-g', '--grace', dest='grace', type=int, default=None,
+                help='seconds a list stays deleted before it is purged')
+def purge(watch, batch_size, grace):
+    """Remove soft deleted shopping lists and their items in batches
+    e.g python manage.py purge --watch
+    """
+    from app.purge import purge_all, run
+
+    def progress(totals):
+        """Print the running totals after every batch"""
+        print('purged {lists} lists and {items} items'.format(**totals))
+
+    if batch_size is not None:
+        app.config['PURGE_BATCH_SIZE'] = batch_size
+    if grace is not None:
+        app.config['PURGE_GRACE_SECONDS'] = grace
+    if watch:
+        run(app.config['PURGE_INTERVAL'], progress)
+        return
+    totals = purge_all(app.config['PURGE_BATCH_SIZE'],
+                       app.config['PURGE_PAUSE_MS'] / 1000.0,
+                       app.config['PURGE_GRACE_SECONDS'], progress)
+    print('purged {lists} lists and {items} items'.format(**totals))
+
+
+@manager.command
+def init_shards():
+    """Create the shopping list and item tables on every shard and record users' shards
+    e.g python manage.py init_shards
+    """
+    from app.rebalance import init_shards as create_shards
+    from app.shards import shards
+
+    def progress(bind, created):
+        """Print what happened on every shard"""
+        print('{}: {}'.format(bind, 'created' if created else 'already set up'))
+
+    if not shards.enabled:
+        print('No shards configured, set DATABASE_SHARD_URLS')
+        return 1
+    placed, conflicts = create_shards(app, progress)
+    print('recorded the shard of {} users'.format(placed))
+    if conflicts:
+        print('lists of users {} are on several shards'.format(
+            ', '.join(str(user_id) for user_id in conflicts)))
+        return 1
+
+
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true', default=False,
+                help='only list the users that would move')
+def rebalance(dry_run):
+    """Move users to the shard the hash ring places them on
+    e.g python manage.py rebalance --dry-run
+    """
+    from app.rebalance import rebalance as move_users
+    from app.shards import shards
+
+    def progress(user_id, source, target, result):
+        """Print every misplaced user"""
+        if result is None:
+            outcome = 'would move' if dry_run else 'ids taken on target, left on source'
+        else:
+            outcome = 'moved {} lists and {} items'.format(*result)
+        print('user {}: {} -> {}, {}'.format(user_id, source, target, outcome))
+
+    if not shards.enabled:
+        print('No shards configured, set DATABASE_SHARD_URLS')
+        return 1
+    totals = move_users(app, dry_run, progress)
+    print('recorded the shard of {placed} users, moved {users} users, {lists} lists '
+          'and {items} items'.format(**totals))
+    if totals['conflicts']:
+        print('could not move users {}'.format(
+            ', '.join(str(user_id) for user_id in totals['conflicts'])))
+        return 1
+
+
 if __name__ == "__main__":
     manager.run()
@@ -0,0 +1,48 @@
+"""add case insensitive unique name indexes
+
+Revision ID: 2e2cd7155ced
+Revises: 7b783067f106
+Create Date: 2026-10-18 10:03:17.224906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e2cd7155ced'
+down_revision = '7b783067f106'
+branch_labels = None
+depends_on = None
+
+
+def duplicate_names(table, owner):
+    """Rows whose names only differ in case from another row of the same owner"""
+    return op.get_bind().execute(sa.text(
+        "SELECT id, {0}, name FROM {1} AS t WHERE EXISTS ("
+        "SELECT 1 FROM {1} AS o WHERE o.{0} = t.{0} AND lower(o.name) = lower(t.name) "
+        "AND o.id <> t.id) ORDER BY {0}, lower(name), id".format(owner, table))).fetchall()
+
+
+def upgrade():
+    problems = []
+    for table, owner in (('shoppinglists', 'created_by'),
+                         ('shoppingitems', 'in_shoppinglist')):
+        for row_id, owner_id, name in duplicate_names(table, owner):
+            problems.append('  {} id={} {}={} name={!r}'.format(
+                table, row_id, owner, owner_id, name))
+    if problems:
+        raise RuntimeError(
+            'Rename or delete these duplicates before upgrading, the unique name '
+            'indexes cannot be built while they exist:\n' + '\n'.join(problems))
+    op.create_index('uq_shoppinglists_created_by_lower_name', 'shoppinglists',
+                    ['created_by', sa.text('lower(name)')], unique=True)
+    op.create_index('uq_shoppingitems_in_shoppinglist_lower_name', 'shoppingitems',
+                    ['in_shoppinglist', sa.text('lower(name)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_shoppingitems_in_shoppinglist_lower_name',
+                  table_name='shoppingitems')
+    op.drop_index('uq_shoppinglists_created_by_lower_name',
+                  table_name='shoppinglists')
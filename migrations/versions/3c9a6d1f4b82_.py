@@ -0,0 +1,85 @@
+"""cascade deletes to shopping lists and items
+
+Revision ID: 3c9a6d1f4b82
+Revises: feaa18527ecb
+Create Date: 2026-10-18 15:22:48.610317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a6d1f4b82'
+down_revision = 'feaa18527ecb'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table), parents before children
+FOREIGN_KEYS = [
+    ('shoppinglists', 'created_by', 'users'),
+    ('shoppingitems', 'created_by', 'users'),
+    ('shoppingitems', 'in_shoppinglist', 'shoppinglists'),
+]
+# SQLite constraints have no names, batch mode gives them the names
+# PostgreSQL uses
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+# batch mode can't reflect expression indexes either, older releases turn
+# them into plain UNIQUE indexes on the column, so they are dropped before
+# the rebuild and created again after it
+EXPRESSION_INDEXES = {
+    'shoppinglists': ('uq_shoppinglists_created_by_lower_name', 'created_by'),
+    'shoppingitems': ('uq_shoppingitems_in_shoppinglist_lower_name', 'in_shoppinglist'),
+}
+FTS_TRIGGER_NAMES = ['{}_fts_ai', '{}_fts_ad', '{}_fts_au']
+FTS_TRIGGERS = [
+    "CREATE TRIGGER {0}_fts_ai AFTER INSERT ON {0} BEGIN "
+    "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+    "END",
+    "CREATE TRIGGER {0}_fts_ad AFTER DELETE ON {0} BEGIN "
+    "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "END",
+    "CREATE TRIGGER {0}_fts_au AFTER UPDATE OF name ON {0} BEGIN "
+    "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+    "END",
+]
+
+
+def replace_foreign_keys(foreign_keys, ondelete):
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    tables = sorted(set(table for table, _, _ in foreign_keys))
+    if sqlite:
+        # SQLite rebuilds each table, dropping the old copy must not trip
+        # or cascade through the foreign keys pointing at it
+        op.execute('PRAGMA foreign_keys=OFF')
+        # nothing the rebuild can't copy faithfully is left on the tables
+        for table in tables:
+            op.drop_index(EXPRESSION_INDEXES[table][0], table_name=table)
+            for trigger in FTS_TRIGGER_NAMES:
+                op.execute('DROP TRIGGER IF EXISTS ' + trigger.format(table))
+    for table, column, referred in foreign_keys:
+        name = '{}_{}_fkey'.format(table, column)
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch:
+            batch.drop_constraint(name, type_='foreignkey')
+            batch.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+    if sqlite:
+        # put back the unique name indexes and the triggers keeping the
+        # FTS5 indexes in sync
+        for table in tables:
+            name, column = EXPRESSION_INDEXES[table]
+            op.create_index(name, table, [column, sa.text('lower(name)')], unique=True)
+            for trigger in FTS_TRIGGERS:
+                op.execute(trigger.format(table))
+        op.execute('PRAGMA foreign_keys=ON')
+
+
+def upgrade():
+    replace_foreign_keys(FOREIGN_KEYS, 'CASCADE')
+
+
+def downgrade():
+    # children first, so no parent is rebuilt while deletes still cascade
+    replace_foreign_keys(list(reversed(FOREIGN_KEYS)), None)
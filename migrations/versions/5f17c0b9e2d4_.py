@@ -0,0 +1,33 @@
+"""record the shard of every user
+
+Revision ID: 5f17c0b9e2d4
+Revises: 8d41e2b7c5a0
+Create Date: 2026-10-18 21:12:40.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f17c0b9e2d4'
+down_revision = '8d41e2b7c5a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing users are placed by python manage.py init_shards or rebalance
+    op.add_column('users', sa.Column('shard', sa.String(length=64), nullable=True))
+    op.add_column('users', sa.Column('shard_moving', sa.Boolean(), nullable=False,
+                                     server_default=sa.false()))
+
+
+def downgrade():
+    for column in ('shard_moving', 'shard'):
+        if op.get_bind().dialect.name == 'sqlite':
+            # SQLite 3.35 drops columns in place, a batch rebuild would drop
+            # users and cascade to every list
+            op.execute('ALTER TABLE users DROP COLUMN {}'.format(column))
+        else:
+            op.drop_column('users', column)
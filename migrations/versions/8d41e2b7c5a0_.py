@@ -0,0 +1,53 @@
+"""soft delete shopping lists
+
+Revision ID: 8d41e2b7c5a0
+Revises: 3c9a6d1f4b82
+Create Date: 2026-10-18 17:08:12.374519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e2b7c5a0'
+down_revision = '3c9a6d1f4b82'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+DELETED = sa.text('deleted_at IS NOT NULL')
+
+
+def upgrade():
+    op.add_column('shoppinglists', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    # the owner lookups and name uniqueness only cover the live lists
+    op.drop_index('ix_shoppinglists_created_by_id', table_name='shoppinglists')
+    op.create_index('ix_shoppinglists_created_by_id', 'shoppinglists',
+                    ['created_by', 'id'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.drop_index('uq_shoppinglists_created_by_lower_name', table_name='shoppinglists')
+    op.create_index('uq_shoppinglists_created_by_lower_name', 'shoppinglists',
+                    ['created_by', sa.text('lower(name)')], unique=True,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    # the purge worker scans only the deleted lists
+    op.create_index('ix_shoppinglists_deleted_at', 'shoppinglists', ['deleted_at'],
+                    unique=False, postgresql_where=DELETED, sqlite_where=DELETED)
+
+
+def downgrade():
+    # lists still waiting for the purge are removed for good
+    op.execute('DELETE FROM shoppinglists WHERE deleted_at IS NOT NULL')
+    op.drop_index('ix_shoppinglists_deleted_at', table_name='shoppinglists')
+    op.drop_index('uq_shoppinglists_created_by_lower_name', table_name='shoppinglists')
+    op.create_index('uq_shoppinglists_created_by_lower_name', 'shoppinglists',
+                    ['created_by', sa.text('lower(name)')], unique=True)
+    op.drop_index('ix_shoppinglists_created_by_id', table_name='shoppinglists')
+    op.create_index('ix_shoppinglists_created_by_id', 'shoppinglists',
+                    ['created_by', 'id'], unique=False)
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite 3.35 drops columns in place, a batch rebuild would lose the
+        # expression index and FTS5 triggers
+        op.execute('ALTER TABLE shoppinglists DROP COLUMN deleted_at')
+    else:
+        op.drop_column('shoppinglists', 'deleted_at')
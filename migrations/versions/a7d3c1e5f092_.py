@@ -0,0 +1,30 @@
+"""count the writes of every user's lists and items
+
+Revision ID: a7d3c1e5f092
+Revises: 5f17c0b9e2d4
+Create Date: 2026-10-18 23:05:17.284611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3c1e5f092'
+down_revision = '5f17c0b9e2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('data_version', sa.Integer(), nullable=False,
+                                     server_default='0'))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite 3.35 drops columns in place, a batch rebuild would drop
+        # users and cascade to every list
+        op.execute('ALTER TABLE users DROP COLUMN data_version')
+    else:
+        op.drop_column('users', 'data_version')
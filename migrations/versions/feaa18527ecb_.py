@@ -0,0 +1,56 @@
+"""add name search indexes
+
+Revision ID: feaa18527ecb
+Revises: 2e2cd7155ced
+Create Date: 2026-10-18 11:41:05.932114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'feaa18527ecb'
+down_revision = '2e2cd7155ced'
+branch_labels = None
+depends_on = None
+
+TABLES = ['shoppinglists', 'shoppingitems']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table in TABLES:
+            op.execute("CREATE INDEX ix_{0}_name_trgm ON {0} "
+                       "USING gin (name gin_trgm_ops)".format(table))
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            op.execute("CREATE VIRTUAL TABLE {0}_fts USING fts5("
+                       "name, content='{0}', content_rowid='id')".format(table))
+            op.execute("CREATE TRIGGER {0}_fts_ai AFTER INSERT ON {0} BEGIN "
+                       "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+                       "END".format(table))
+            op.execute("CREATE TRIGGER {0}_fts_ad AFTER DELETE ON {0} BEGIN "
+                       "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+                       "VALUES ('delete', old.id, old.name); "
+                       "END".format(table))
+            op.execute("CREATE TRIGGER {0}_fts_au AFTER UPDATE OF name ON {0} BEGIN "
+                       "INSERT INTO {0}_fts({0}_fts, rowid, name) "
+                       "VALUES ('delete', old.id, old.name); "
+                       "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); "
+                       "END".format(table))
+            # index the rows that already exist
+            op.execute("INSERT INTO {0}_fts({0}_fts) VALUES ('rebuild')".format(table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in TABLES:
+            op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            for trigger in ['ai', 'ad', 'au']:
+                op.execute("DROP TRIGGER IF EXISTS {}_fts_{}".format(table, trigger))
+            op.execute("DROP TABLE IF EXISTS {}_fts".format(table))
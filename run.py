@@ -14,5 +14,7 @@ app = create_app(config_name)
 CORS(app)
 
 if __name__ == '__main__':
+    # Werkzeug's development server, production runs under gunicorn,
+    # see gunicorn_config.py
     port = int(os.environ.get('PORT', 5000))
     app.run('', port=port)
@@ -1,5 +1,7 @@
 """ /tests/test_authentication.py"""
 import json
+from app import hasher
+from app.passwords import PasswordHasherBusy
 from tests.basetest import BaseTest
 
 
@@ -132,6 +134,33 @@ class UserTestCases(BaseTest):
                                 data=user_details)
         self.assertIn("Successfully updated profile", str(res.data))
 
+    def test_profile_reflects_update(self):
+        """ Test the cached user is refreshed after a profile update"""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        # load the profile so the token is cached
+        self.client().get('/user', headers=headers)
+        self.client().put('/user', headers=headers,
+                          data={'email': "chris@gmail.com"})
+        res = self.client().get('/user', headers=headers)
+        self.assertIn("chris@gmail.com", str(res.data))
+
+    def test_update_profile_keeps_password(self):
+        """ Test updating only the email keeps the password"""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        self.client().put('/user',
+                          headers=dict(Authorization="Bearer " + access_token),
+                          data={'email': "chris@gmail.com"})
+        res = self.client().post('/auth/login/', data={
+            'email': "chris@gmail.com",
+            'password': self.user_details['password']
+        })
+        self.assertEqual(res.status_code, 200)
+
     def test_update_short_password(self):
         """ Test update user profile short password supplied"""
         user_details = {
@@ -205,6 +234,26 @@ class UserTestCases(BaseTest):
             '/user/reset/password/{}'.format(result['reset_token']), data=user_password)
         self.assertEqual(response.status_code, 200)
 
+    def test_reset_password_hasher_busy(self):
+        """ Test a saturated hasher asks the client to retry the reset"""
+        self.register_user()
+        res = self.client().post('/user/reset', data={'email': "test@gmail.com"})
+        result = json.loads(res.data.decode())
+
+        def busy(password):
+            """Reject like a hasher with every slot taken"""
+            raise PasswordHasherBusy('Password hashing is saturated')
+
+        hasher.hash = busy
+        try:
+            response = self.client().put(
+                '/user/reset/password/{}'.format(result['reset_token']),
+                data={'password': "testpassword"})
+        finally:
+            del hasher.hash
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
     def test_reset_with_short_password(self):
         """ Test reset password"""
         user_email = {
@@ -0,0 +1,123 @@
+""" test_batch.py """
+import json
+from tests.basetest import BaseTest
+
+
+class ShoppingItemsBatchTestCases(BaseTest):
+    """Test cases for the shopping item batch endpoint
+    """
+
+    def batch(self, operations, sl_id=1):
+        """Post a batch of operations"""
+        return self.client().post(
+            "/shoppinglists/{}/items/batch".format(sl_id),
+            headers=dict(Authorization="Bearer " + self.access_token),
+            data=json.dumps({'operations': operations}),
+            content_type='application/json')
+
+    def test_batch_create_update_delete(self):
+        """ Test API applies creates, updates and deletes together, POST"""
+        # create items
+        self.test_shoppingitem()
+        self.client().post("/shoppinglists/1/items",
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Milk', 'price': '60', 'quantity': '1'})
+        res = self.batch([
+            {'op': 'create', 'name': 'Sugar', 'price': 100, 'quantity': 2},
+            {'op': 'create', 'name': 'Rice', 'price': 150, 'quantity': 1},
+            {'op': 'update', 'id': 1, 'name': 'Brown bread'},
+            {'op': 'delete', 'id': 2}
+        ])
+        self.assertEqual(res.status_code, 200)
+        result = json.loads(res.data.decode())
+        self.assertEqual(sorted(item['name'] for item in result['created']),
+                         ['Rice', 'Sugar'])
+        self.assertEqual(result['updated'], [1])
+        self.assertEqual(result['deleted'], [2])
+        response = self.client().get("/shoppinglists/1/items",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        names = [item['name'] for item in json.loads(response.data.decode())['shopping_items']]
+        self.assertEqual(sorted(names), ['Brown bread', 'Rice', 'Sugar'])
+
+    def test_batch_reuses_deleted_name(self):
+        """ Test a name freed by a delete in the same batch can be reused, POST"""
+        self.test_shoppingitem()
+        res = self.batch([
+            {'op': 'delete', 'id': 1},
+            {'op': 'create', 'name': 'bread', 'price': 40, 'quantity': 1}
+        ])
+        self.assertEqual(res.status_code, 200)
+
+    def test_batch_swaps_names(self):
+        """ Test two items can swap names in one batch, POST"""
+        self.test_shoppingitem()
+        self.client().post("/shoppinglists/1/items",
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Milk', 'price': '60', 'quantity': '1'})
+        res = self.batch([
+            {'op': 'update', 'id': 1, 'name': 'Milk'},
+            {'op': 'update', 'id': 2, 'name': 'Bread', 'price': 70}
+        ])
+        self.assertEqual(res.status_code, 200)
+        response = self.client().get("/shoppinglists/1/items",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        items = json.loads(response.data.decode())['shopping_items']
+        self.assertEqual(sorted((item['id'], item['name']) for item in items),
+                         [(1, 'Milk'), (2, 'Bread')])
+
+    def test_batch_reports_every_error(self):
+        """ Test API validates the whole batch and writes nothing on error, POST"""
+        self.test_shoppingitem()
+        res = self.batch([
+            {'op': 'create', 'name': 'Sugar+', 'price': 100, 'quantity': 2},
+            {'op': 'create', 'name': 'Rice', 'price': 'one', 'quantity': 1},
+            {'op': 'create', 'name': 'Salt', 'price': 10, 'quantity': 1},
+            {'op': 'rename', 'id': 1}
+        ])
+        self.assertEqual(res.status_code, 400)
+        errors = json.loads(res.data.decode())['errors']
+        self.assertEqual([error['index'] for error in errors], [0, 1, 3])
+        response = self.client().get("/shoppinglists/1/items?q=Salt",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_duplicate_names(self):
+        """ Test API rejects names taken in the list or repeated in the batch, POST"""
+        self.test_shoppingitem()
+        res = self.batch([
+            {'op': 'create', 'name': 'BREAD', 'price': 100, 'quantity': 2},
+            {'op': 'create', 'name': 'Rice', 'price': 150, 'quantity': 1},
+            {'op': 'create', 'name': 'rice', 'price': 150, 'quantity': 1}
+        ])
+        self.assertEqual(res.status_code, 409)
+        errors = json.loads(res.data.decode())['errors']
+        self.assertEqual([error['index'] for error in errors], [0, 2])
+
+    def test_batch_repeated_item(self):
+        """ Test API rejects a batch touching the same item twice, POST"""
+        self.test_shoppingitem()
+        res = self.batch([
+            {'op': 'update', 'id': 1, 'name': 'Brown bread'},
+            {'op': 'delete', 'id': 1}
+        ])
+        self.assertEqual(res.status_code, 400)
+        errors = json.loads(res.data.decode())['errors']
+        self.assertEqual(errors, [{'index': 1, 'message': "Operation repeats item id 1"}])
+
+    def test_batch_unknown_item(self):
+        """ Test API rejects updates to items outside the list, POST"""
+        self.test_shoppinglist()
+        res = self.batch([{'op': 'update', 'id': 5, 'name': 'Sugar'}])
+        self.assertIn("No such item", str(res.data))
+
+    def test_batch_non_existing_list(self):
+        """ Test API rejects a batch for a non existing list, POST"""
+        self.test_shoppinglist()
+        res = self.batch([{'op': 'delete', 'id': 1}], sl_id=2)
+        self.assertEqual(res.status_code, 404)
+
+    def test_batch_without_operations(self):
+        """ Test API requires a list of operations, POST"""
+        self.test_shoppinglist()
+        res = self.batch([])
+        self.assertIn("Please provide a list of operations", str(res.data))
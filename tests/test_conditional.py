@@ -0,0 +1,93 @@
+""" /tests/test_conditional.py"""
+import json
+from tests.basetest import BaseTest
+
+
+class ConditionalGetTestCases(BaseTest):
+    """
+    Test GET responses carry ETag and Last-Modified headers
+    Test unchanged resources are answered with 304 Not Modified
+    Test edits within the same second still change the ETag
+    """
+
+    def get(self, path, **headers):
+        """GET a path as the test user"""
+        headers['Authorization'] = "Bearer " + self.access_token
+        return self.client().get(path, headers=headers)
+
+    def test_shoppinglist_not_modified(self):
+        """ Test API answers 304 for an unchanged shopping list, GET"""
+        self.test_shoppinglist()
+        res = self.get('/shoppinglists/1')
+        self.assertEqual(res.status_code, 200)
+        etag = res.headers['ETag']
+        last_modified = res.headers['Last-Modified']
+        self.assertTrue(etag.startswith('W/"'))
+        res = self.get('/shoppinglists/1', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+        res = self.get('/shoppinglists/1',
+                       **{'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 304)
+
+    def test_shoppinglist_modified(self):
+        """ Test API sends the new shopping list once it is edited, GET"""
+        self.test_shoppinglist()
+        etag = self.get('/shoppinglists/1').headers['ETag']
+        self.client().put('/shoppinglists/1',
+                          headers=dict(Authorization="Bearer " + self.access_token),
+                          data={'name': 'Back to work'})
+        res = self.get('/shoppinglists/1', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data.decode())['name'], 'Back to work')
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_shoppingitem_not_modified(self):
+        """ Test API answers 304 for an unchanged shopping item, GET"""
+        self.test_shoppingitem()
+        etag = self.get('/shoppinglists/1/items/1').headers['ETag']
+        res = self.get('/shoppinglists/1/items/1', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.client().put('/shoppinglists/1/items/1',
+                          headers=dict(Authorization="Bearer " + self.access_token),
+                          data={'quantity': '3'})
+        res = self.get('/shoppinglists/1/items/1', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+
+    def test_listings_not_modified(self):
+        """ Test API answers 304 for unchanged pages until a row is added, GET"""
+        self.test_shoppingitem()
+        for path in ('/shoppinglists/', '/shoppinglists/?cursor=',
+                     '/shoppinglists/1/items', '/shoppinglists/1/items?cursor='):
+            etag = self.get(path).headers['ETag']
+            res = self.get(path, **{'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
+        etag = self.get('/shoppinglists/1/items').headers['ETag']
+        self.client().post('/shoppinglists/1/items',
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Milk', 'price': '20', 'quantity': '2'})
+        res = self.get('/shoppinglists/1/items', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(json.loads(res.data.decode())['shopping_items']), 2)
+
+    def test_listing_not_modified_after_delete(self):
+        """ Test API sends the page again once a row is deleted, GET"""
+        self.test_shoppingitem()
+        etag = self.get('/shoppinglists/1/items').headers['ETag']
+        self.client().delete('/shoppinglists/1/items/1',
+                             headers=dict(Authorization="Bearer " + self.access_token))
+        res = self.get('/shoppinglists/1/items', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+
+    def test_listing_modified_within_second(self):
+        """ Test an edit in the same second as the last response changes the ETag, GET"""
+        self.test_shoppingitem()
+        etag = self.get('/shoppinglists/1/items').headers['ETag']
+        # same count, same max id and most likely the same date_modified second
+        self.client().put('/shoppinglists/1/items/1',
+                          headers=dict(Authorization="Bearer " + self.access_token),
+                          data={'quantity': '3'})
+        res = self.get('/shoppinglists/1/items', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data.decode())['shopping_items'][0]['quantity'], 3)
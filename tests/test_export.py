@@ -0,0 +1,72 @@
+""" /tests/test_export.py"""
+import csv
+import io
+import json
+from tests.basetest import BaseTest
+
+
+class ExportTestCases(BaseTest):
+    """
+    Test every list and item of a user is streamed out
+    """
+
+    def export(self, export_format=None):
+        """Export as the test user"""
+        path = '/shoppinglists/export'
+        if export_format:
+            path += '?format=' + export_format
+        return self.client().get(path, headers=dict(Authorization="Bearer " + self.access_token))
+
+    def seed(self):
+        """Two lists, the first with two items"""
+        self.test_shoppingitem()
+        headers = dict(Authorization="Bearer " + self.access_token)
+        self.client().post('/shoppinglists/1/items', headers=headers,
+                           data={'name': 'Milk', 'price': '20', 'quantity': '3'})
+        self.client().post('/shoppinglists/', headers=headers, data={'name': 'Party'})
+
+    def test_export_ndjson(self):
+        """ Test API streams lists and items as NDJSON, GET"""
+        self.seed()
+        res = self.export()
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.headers['Content-Type'], 'application/x-ndjson')
+        self.assertIn('shoppinglists.ndjson', res.headers['Content-Disposition'])
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([(line['type'], line['id']) for line in lines], [
+            ('shoppinglist', 1), ('shoppingitem', 1), ('shoppingitem', 2),
+            ('shoppinglist', 2)])
+        self.assertEqual(lines[2]['name'], 'Milk')
+        self.assertEqual(lines[2]['in_shoppinglist'], 1)
+        self.assertTrue(lines[0]['date_created'].endswith(' GMT'))
+
+    def test_export_csv(self):
+        """ Test API streams a row per item as CSV, GET"""
+        self.seed()
+        res = self.export('csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('text/csv', res.headers['Content-Type'])
+        rows = list(csv.DictReader(io.StringIO(res.data.decode())))
+        self.assertEqual([(row['list_id'], row['item_name']) for row in rows], [
+            ('1', 'Bread'), ('1', 'Milk'), ('2', '')])
+        self.assertEqual(float(rows[1]['price']), 20.0)
+
+    def test_export_in_batches(self):
+        """ Test the export is written a batch at a time, GET"""
+        self.app.config['EXPORT_BATCH_SIZE'] = 1
+        self.seed()
+        res = self.export()
+        # a chunk per joined row
+        chunks = list(res.response)
+        self.assertEqual(len(chunks), 3)
+
+    def test_export_other_users(self):
+        """ Test API exports only the user's own rows, GET"""
+        self.seed()
+        other = {'email': 'other@gmail.com', 'password': 'password123'}
+        self.client().post('/auth/register/', data=other)
+        self.access_token = json.loads(self.client().post(
+            '/auth/login/', data=other).data.decode())['access_token']
+        self.assertEqual(self.export().data, b'')
+        self.assertEqual(self.export('xml').status_code, 400)
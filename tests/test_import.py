@@ -0,0 +1,119 @@
+""" /tests/test_import.py"""
+import io
+import json
+from app import db
+from app.importer import import_rows, read_rows
+from tests.basetest import BaseTest
+
+CSV = (b"list_name,item_name,price,quantity\n"
+       b"Groceries,Bread,50,1\n"
+       b"Groceries,Milk,20,3\n"
+       b"Party,,,\n"
+       b"Party,Soda,60,2\n")
+
+
+class ImportTestCases(BaseTest):
+    """
+    Test lists and items are imported in chunks
+    Test bad rows are reported and re-runs are safe
+    """
+
+    def import_file(self, body, query='', **kwargs):
+        """POST a file to the import endpoint as the test user"""
+        return self.client().post('/shoppinglists/import' + query, data=body,
+                                  headers=dict(Authorization="Bearer " + self.access_token),
+                                  **kwargs)
+
+    def get(self, path):
+        """GET a path as the test user"""
+        res = self.client().get(path, headers=dict(Authorization="Bearer " + self.access_token))
+        return json.loads(res.data.decode())
+
+    def test_import_csv(self):
+        """ Test API imports lists and items from a CSV body, POST"""
+        self.test_shoppinglist()
+        res = self.import_file(CSV, content_type='text/csv')
+        self.assertEqual(res.status_code, 200)
+        result = json.loads(res.data.decode())
+        self.assertEqual((result['rows'], result['lists_created'], result['items_created'],
+                          result['skipped'], result['errors']), (4, 2, 3, 0, []))
+        lists = self.get('/shoppinglists/?limit=10')['shopping_lists']
+        self.assertEqual([item['name'] for item in lists],
+                         ['Back to school', 'Groceries', 'Party'])
+        items = self.get('/shoppinglists/2/items')['shopping_items']
+        self.assertEqual([item['name'] for item in items], ['Bread', 'Milk'])
+
+    def test_import_upload_in_chunks(self):
+        """ Test API imports an uploaded file a chunk at a time, POST"""
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+        self.test_shoppinglist()
+        res = self.import_file({'file': (io.BytesIO(CSV), 'lists.csv')},
+                               content_type='multipart/form-data')
+        result = json.loads(res.data.decode())
+        self.assertEqual(result['items_created'], 3)
+        self.assertEqual(result['last_row'], 4)
+
+    def test_rerun_skips_existing(self):
+        """ Test importing the same file twice creates nothing new, POST"""
+        self.test_shoppinglist()
+        self.import_file(CSV, content_type='text/csv')
+        result = json.loads(self.import_file(CSV, content_type='text/csv').data.decode())
+        self.assertEqual((result['lists_created'], result['items_created'], result['skipped']),
+                         (0, 0, 4))
+
+    def test_row_errors_per_chunk(self):
+        """ Test invalid rows are reported by chunk and row, POST"""
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+        self.test_shoppinglist()
+        body = (b"list_name,item_name,price,quantity\n"
+                b"Groceries,Bread,50,1\n"
+                b"Groc@ries,Milk,20,3\n"
+                b"Groceries,Eggs,free,1\n"
+                b"Groceries,Jam,10,1\n")
+        result = json.loads(self.import_file(body, content_type='text/csv').data.decode())
+        self.assertEqual(result['items_created'], 2)
+        self.assertEqual([(chunk['first_row'], chunk['last_row']) for chunk in result['errors']],
+                         [(1, 2), (3, 4)])
+        self.assertEqual(result['errors'][0]['errors'],
+                         [{'row': 2, 'message': 'No special characters in name'}])
+        self.assertEqual(result['errors'][1]['errors'],
+                         [{'row': 3, 'message': 'Invalid price value'}])
+
+    def test_resume_from_row(self):
+        """ Test start_row skips rows an earlier run imported, POST"""
+        self.test_shoppinglist()
+        result = json.loads(self.import_file(
+            CSV, '?start_row=2', content_type='text/csv').data.decode())
+        # only the Party rows are left
+        self.assertEqual((result['lists_created'], result['items_created']), (1, 1))
+        self.assertEqual(self.import_file(
+            CSV, '?start_row=x', content_type='text/csv').status_code, 400)
+        self.assertEqual(self.import_file(
+            CSV, '?format=xml', content_type='text/csv').status_code, 400)
+
+    def test_import_export_round_trip(self):
+        """ Test an NDJSON export imports into another account, POST"""
+        self.test_shoppingitem()
+        exported = self.client().get('/shoppinglists/export', headers=dict(
+            Authorization="Bearer " + self.access_token)).data
+        other = {'email': 'other@gmail.com', 'password': 'password123'}
+        self.client().post('/auth/register/', data=other)
+        self.access_token = json.loads(self.client().post(
+            '/auth/login/', data=other).data.decode())['access_token']
+        result = json.loads(self.import_file(
+            exported, '?format=ndjson', content_type='application/x-ndjson').data.decode())
+        self.assertEqual((result['lists_created'], result['items_created']), (1, 1))
+        items = self.get('/shoppinglists/2/items')['shopping_items']
+        self.assertEqual(items[0]['name'], 'Bread')
+
+    def test_import_rows(self):
+        """ Test the import used by manage.py reports every chunk"""
+        self.test_shoppinglist()
+        reports = []
+        with self.app.app_context():
+            result = import_rows(1, read_rows(io.BytesIO(CSV), 'csv'), 3,
+                                 progress=reports.append)
+            db.session.remove()
+        self.assertEqual([(report['first_row'], report['last_row']) for report in reports],
+                         [(1, 3), (4, 4)])
+        self.assertEqual(result['items_created'], 3)
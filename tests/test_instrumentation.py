@@ -0,0 +1,85 @@
+""" /tests/test_instrumentation.py"""
+import re
+import json
+import logging
+from sqlalchemy.exc import DBAPIError
+from app import db
+from tests.basetest import BaseTest
+
+
+class RecordingHandler(logging.Handler):
+    """Keeps the messages logged through it"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class InstrumentationTestCases(BaseTest):
+    """
+    Test queries are reported in the Server-Timing header
+    Test a structured log line is written per request
+    Test slow queries are logged with their parameters
+    Test failed statements leave no timing state on the connection
+    """
+
+    def setUp(self):
+        super(InstrumentationTestCases, self).setUp()
+        self.handler = RecordingHandler()
+        self.app.logger.addHandler(self.handler)
+        self.app.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.app.logger.removeHandler(self.handler)
+        super(InstrumentationTestCases, self).tearDown()
+
+    def logged(self, event):
+        """Structured log lines of one event type"""
+        lines = [json.loads(message) for message in self.handler.messages
+                 if message.startswith('{')]
+        return [line for line in lines if line['event'] == event]
+
+    def test_server_timing_header(self):
+        """ Test the query count and time are returned in Server-Timing"""
+        self.test_shoppinglist()
+        res = self.client().get('/shoppinglists/1',
+                                headers=dict(Authorization="Bearer " + self.access_token))
+        timing = res.headers['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('app;dur=', timing)
+        self.assertTrue(re.search(r'desc="[1-9][0-9]* queries"', timing))
+
+    def test_request_log_line(self):
+        """ Test every request logs its endpoint and query totals"""
+        self.register_user()
+        requests = self.logged('request')
+        self.assertEqual(requests[-1]['endpoint'], 'dummy_register')
+        self.assertEqual(requests[-1]['status'], 201)
+        self.assertGreater(requests[-1]['db_queries'], 0)
+
+    def test_slow_query_logged(self):
+        """ Test statements over the threshold are logged with parameters"""
+        self.app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        self.app.config['SLOW_QUERY_LOG_PARAMETERS'] = True
+        self.register_user()
+        slow = self.logged('slow_query')
+        self.assertTrue(any('test@gmail.com' in line['parameters'] for line in slow))
+
+    def test_slow_query_parameters_off_by_default(self):
+        """ Test slow queries are logged without their parameters by default"""
+        self.app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        self.register_user()
+        slow = self.logged('slow_query')
+        self.assertTrue(slow)
+        self.assertTrue(all(line['parameters'] is None for line in slow))
+
+    def test_failed_statement_leaves_no_state(self):
+        """ Test a statement that raises does not leave its start time behind"""
+        with self.app.app_context():
+            with db.engine.connect() as connection:
+                self.assertRaises(DBAPIError, connection.execute, 'SELECT * FROM missing')
+                self.assertNotIn('query_start', connection.connection.info)
+                self.assertEqual(connection.execute('SELECT 1').scalar(), 1)
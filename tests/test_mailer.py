@@ -0,0 +1,163 @@
+""" /tests/test_mailer.py"""
+import os
+import subprocess
+import sys
+import threading
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+from flask_mail import Message
+from app import mail, mail_queue
+from app.mailer import MailQueue
+from tests.basetest import BaseTest
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib to deliver a message"""
+
+    def handle(self):
+        self.server.connections += 1
+        if self.server.fail_connections:
+            self.server.fail_connections -= 1
+            self.wfile.write(b'421 busy\r\n')
+            return
+        self.wfile.write(b'220 localhost\r\n')
+        for line in iter(self.rfile.readline, b''):
+            command = line[:4].upper()
+            if command == b'DATA':
+                self.wfile.write(b'354 go ahead\r\n')
+                body = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.messages.append(body)
+                self.wfile.write(b'250 OK\r\n')
+            elif command == b'RCPT' and self.server.refuse_recipients:
+                self.wfile.write(b'550 no such user\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Local SMTP server recording the messages it receives"""
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(
+            self, ('localhost', 0), SMTPHandler)
+        self.connections = 0
+        self.fail_connections = 0
+        self.refuse_recipients = False
+        self.messages = []
+
+
+class MailQueueTestCases(BaseTest):
+    """
+    Test reset token mail is sent in the background
+    Test queued messages share one SMTP connection
+    Test failed deliveries are retried
+    Test a broken mail setup drops the batch without killing the worker
+    Test refused mail is dropped without a retry
+    Test queued mail is delivered when the process exits
+    """
+
+    def setUp(self):
+        super(MailQueueTestCases, self).setUp()
+        self.server = SMTPStandIn()
+        threading.Thread(target=self.server.serve_forever).start()
+        self.app.config.update(
+            MAIL_SERVER='localhost', MAIL_PORT=self.server.server_address[1],
+            MAIL_USE_SSL=False, MAIL_SUPPRESS_SEND=False,
+            MAIL_DEFAULT_SENDER='noreply@shoppinglist.io',
+            MAIL_RETRY_BACKOFF=0.01, MAIL_DEBUG=False)
+        mail.init_app(self.app)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(MailQueueTestCases, self).tearDown()
+
+    def message(self, number):
+        """Build a test message"""
+        return Message(recipients=['test@gmail.com'], subject='Test',
+                       html='<p>Message {}</p>'.format(number))
+
+    def test_reset_token_mail_delivered(self):
+        """ Test the reset link is mailed after the response"""
+        self.register_user()
+        res = self.client().post('/user/reset', data={'email': "test@gmail.com"})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(mail_queue.flush(5))
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertIn(b'reset your password', self.server.messages[0])
+
+    def test_batch_shares_connection(self):
+        """ Test a batch of queued messages is sent over one connection"""
+        queue = MailQueue(mail)
+        with self.app.app_context():
+            # queue everything before the worker starts so it forms one batch
+            for number in range(3):
+                queue._pending += 1
+                queue._queue.put((self.app, self.message(number), 0))
+            queue.enqueue(self.message(3))
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(len(self.server.messages), 4)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_failed_delivery_retried(self):
+        """ Test a message is retried after the server turns it away"""
+        self.server.fail_connections = 2
+        queue = MailQueue(mail)
+        with self.app.app_context():
+            queue.enqueue(self.message(1))
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_unexpected_error_drops_batch(self):
+        """ Test the worker survives an error that is not worth retrying"""
+        queue = MailQueue(mail)
+
+        class BrokenMail(object):
+            """Mail instance with a setup error"""
+
+            def connect(self):
+                """Fail like a misconfigured backend"""
+                raise ValueError('bad mail settings')
+
+        queue.mail = BrokenMail()
+        with self.app.app_context():
+            queue.enqueue(self.message(1))
+            self.assertTrue(queue.flush(5))
+            queue.mail = mail
+            queue.enqueue(self.message(2))
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_refused_recipient_not_retried(self):
+        """ Test a permanent rejection drops the message at once"""
+        self.server.refuse_recipients = True
+        queue = MailQueue(mail)
+        with self.app.app_context():
+            queue.enqueue(self.message(1))
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(self.server.messages, [])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_queue_drained_at_exit(self):
+        """ Test a process that exits right after queueing mail still sends it"""
+        script = '\n'.join([
+            'from flask_mail import Message',
+            'from app import create_app, mail, mail_queue',
+            'app = create_app(config_name="testing")',
+            'app.config.update(MAIL_SERVER="localhost", MAIL_PORT={}, MAIL_USE_SSL=False,',
+            '                  MAIL_SUPPRESS_SEND=False, MAIL_DEFAULT_SENDER="n@s.io")',
+            'mail.init_app(app)',
+            'with app.app_context():',
+            '    mail_queue.enqueue(Message(recipients=["a@s.io"], subject="Bye", html="x"))',
+        ]).format(self.server.server_address[1])
+        env = dict(os.environ, MAIL_RETRY_BACKOFF='0.01')
+        subprocess.check_call([sys.executable, '-c', script], env=env,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(len(self.server.messages), 1)
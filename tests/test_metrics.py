@@ -0,0 +1,107 @@
+""" /tests/test_metrics.py"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from app.metrics import Metrics
+from tests.basetest import BaseTest
+
+
+class MetricsEndpointTestCases(BaseTest):
+    """
+    Test requests are counted and timed per endpoint
+    Test token failures and password hashing are measured
+    """
+
+    def metrics(self):
+        """Scrape the metrics endpoint"""
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('text/plain', res.headers['Content-Type'])
+        return res.data.decode()
+
+    def test_requests_counted_per_endpoint(self):
+        """ Test request counts and latency histograms are labelled by endpoint"""
+        self.register_user()
+        text = self.metrics()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_requests_total{endpoint="dummy_register",'
+                      'method="POST",status="201"}', text)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="dummy_register",'
+                      'method="POST",le="+Inf"}', text)
+        # the scrape itself is in flight
+        self.assertIn('http_requests_in_flight 1.0', text)
+
+    def test_token_failures_and_hashing(self):
+        """ Test rejected tokens and password hashing are measured"""
+        self.register_user()
+        self.client().get('/user', headers=dict(Authorization="Bearer invalid"))
+        text = self.metrics()
+        self.assertIn('jwt_decode_failures_total{reason="invalid"}', text)
+        self.assertIn('password_hash_duration_seconds_count{operation="hash"}', text)
+        self.assertIn('db_pool_checkouts_total', text)
+
+
+class MetricsAggregationTestCases(unittest.TestCase):
+    """
+    Test the metrics of every worker are summed
+    Test gauges of exited workers are dropped
+    Test the counts of exited threads are kept without keeping their shards
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.metrics = Metrics()
+        self.metrics.directory = self.directory
+        self.metrics.describe('jobs_total', 'counter', 'Jobs.')
+        self.metrics.describe('busy', 'gauge', 'Busy workers.')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_worker(self, pid):
+        """Publish the metrics of another worker"""
+        with open(os.path.join(self.directory, 'metrics_{}.json'.format(pid)), 'w') as output:
+            json.dump({'pid': pid, 'samples': [['jobs_total', [], 2], ['busy', [], 1]]}, output)
+
+    def test_workers_summed(self):
+        """ Test counters and gauges of live workers are added up"""
+        self.write_worker(os.getppid())
+        self.metrics.inc('jobs_total', value=3)
+        self.metrics.inc('busy')
+        text = self.metrics.render()
+        self.assertIn('jobs_total 5.0', text)
+        self.assertIn('busy 2.0', text)
+
+    def test_exited_worker_gauges_dropped(self):
+        """ Test an exited worker keeps its counters but not its gauges"""
+        self.write_worker(os.getppid())
+        self.metrics.mark_process_dead(os.getppid())
+        self.metrics.inc('jobs_total', value=3)
+        self.metrics.inc('busy')
+        text = self.metrics.render()
+        self.assertIn('jobs_total 5.0', text)
+        self.assertIn('busy 1.0', text)
+
+    def test_exited_worker_files_merged(self):
+        """ Test exited workers' counters are merged and their files removed"""
+        for _ in range(2):
+            # gunicorn recycling workers, even under the same pid
+            self.write_worker(os.getppid())
+            self.metrics.mark_process_dead(os.getppid())
+        self.assertEqual(sorted(os.listdir(self.directory)), ['metrics_dead.json'])
+        text = self.metrics.render()
+        self.assertIn('jobs_total 4.0', text)
+        self.assertNotIn('busy', text)
+
+    def test_exited_threads_folded(self):
+        """ Test shards of finished threads are merged and released"""
+        for _ in range(5):
+            thread = threading.Thread(target=self.metrics.inc, args=('jobs_total',))
+            thread.start()
+            thread.join()
+        self.metrics.inc('jobs_total')
+        self.assertEqual(len(self.metrics._shards), 1)
+        self.assertEqual(self.metrics.samples(), [['jobs_total', [], 6]])
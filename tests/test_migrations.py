@@ -0,0 +1,104 @@
+""" /tests/test_migrations.py"""
+import logging
+import os
+import unittest
+import flask_migrate
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from app import create_app, db
+from app.models import Shoppinglist, Shoppingitem
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'migrations')
+
+
+class MigrationTestCases(unittest.TestCase):
+    """
+    Test the migrations build the schema the app expects
+    Test they downgrade and upgrade again without losing indexes or triggers
+    """
+
+    def setUp(self):
+        self.app = create_app(config_name="testing")
+        self.app.config['RESPONSE_CACHE_ENABLED'] = False
+        flask_migrate.Migrate(self.app, db)
+        self.client = self.app.test_client
+        with self.app.app_context():
+            db.drop_all()
+
+    def tearDown(self):
+        self.migrate('downgrade', 'base')
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.execute('DROP TABLE IF EXISTS alembic_version')
+
+    def migrate(self, command, revision):
+        """Run a migration command, keeping the logging the tests set up"""
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        loggers = dict(logging.Logger.manager.loggerDict)
+        with self.app.app_context():
+            getattr(flask_migrate, command)(directory=MIGRATIONS, revision=revision)
+        root.handlers[:], root.level = handlers, level
+        for logger in loggers.values():
+            if isinstance(logger, logging.Logger):
+                logger.disabled = False
+
+    def request(self, method, path, token=None, **data):
+        """Send a request, as the given user when there is a token"""
+        headers = dict(Authorization="Bearer " + token) if token else {}
+        return getattr(self.client(), method)(path, headers=headers, data=data)
+
+    def assert_schema(self):
+        """The unique name indexes and the FTS triggers are all in place"""
+        with self.app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                return
+            names = [row[0] for row in db.engine.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")]
+        self.assertIn('uq_shoppinglists_created_by_lower_name', names)
+        self.assertIn('uq_shoppingitems_in_shoppinglist_lower_name', names)
+        for table in ('shoppinglists', 'shoppingitems'):
+            for trigger in ('ai', 'ad', 'au'):
+                self.assertIn('{}_fts_{}'.format(table, trigger), names)
+
+    def assert_names_unique_per_owner(self):
+        """A user holds several lists and items, but no two named alike"""
+        user = {'email': 'test@gmail.com', 'password': 'password123'}
+        self.request('post', '/auth/register/', **user)
+        token = self.request('post', '/auth/login/', **user).get_json()['access_token']
+        for name in ('Back to school', 'Groceries'):
+            res = self.request('post', '/shoppinglists/', token, name=name)
+            self.assertEqual(res.status_code, 201)
+        res = self.request('post', '/shoppinglists/', token, name='GROCERIES')
+        self.assertEqual(res.status_code, 302)
+        for name in ('Bread', 'Milk'):
+            res = self.request('post', '/shoppinglists/1/items', token,
+                               name=name, price='50', quantity='1')
+            self.assertEqual(res.status_code, 201)
+        res = self.request('get', '/shoppinglists/?q=groceries', token)
+        self.assertIn('Groceries', res.get_data(as_text=True))
+        # past the route's own check, the index still refuses the name
+        with self.app.app_context():
+            db.session.add(Shoppinglist('GROCERIES', 1))
+            self.assertRaises(IntegrityError, db.session.commit)
+            db.session.rollback()
+            db.session.add(Shoppingitem('MILK', '50', '1', 1, 1))
+            self.assertRaises(IntegrityError, db.session.commit)
+            db.session.rollback()
+
+    def test_upgrade(self):
+        """Test the upgraded schema keeps names unique and searchable"""
+        self.migrate('upgrade', 'head')
+        self.assert_schema()
+        self.assert_names_unique_per_owner()
+
+    def test_round_trip(self):
+        """Test downgrading to the start and upgrading again rebuilds it all"""
+        self.migrate('upgrade', 'head')
+        self.migrate('downgrade', 'base')
+        with self.app.app_context():
+            self.assertEqual(inspect(db.engine).get_table_names(), ['alembic_version'])
+        self.migrate('upgrade', 'head')
+        self.assert_schema()
+        self.assert_names_unique_per_owner()
@@ -0,0 +1,50 @@
+""" /tests/test_passwords.py"""
+import threading
+import unittest
+from flask import Flask
+from app.passwords import PasswordHasher, PasswordHasherBusy
+
+
+class PasswordHasherTestCases(unittest.TestCase):
+    """
+    Test hashing and verification
+    Test work factor is read from the config
+    Test a full queue is rejected
+    """
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.config.update(BCRYPT_LOG_ROUNDS=4, PASSWORD_HASH_WORKERS=1,
+                          PASSWORD_HASH_QUEUE=0)
+        self.hasher = PasswordHasher(app)
+
+    def test_hash_and_verify(self):
+        """ Test a hash verifies only its own password"""
+        pw_hash = self.hasher.hash('password123')
+        self.assertTrue(self.hasher.verify(pw_hash, 'password123'))
+        self.assertFalse(self.hasher.verify(pw_hash, 'password'))
+
+    def test_work_factor_from_config(self):
+        """ Test the configured work factor is used"""
+        self.assertIn('$04$', self.hasher.hash('password123'))
+
+    def test_full_queue_rejected(self):
+        """ Test hashing is rejected while every slot is taken"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            """Hold the only worker until released"""
+            started.set()
+            release.wait()
+
+        worker = threading.Thread(target=self.hasher._run, args=(block,))
+        worker.start()
+        started.wait()
+        try:
+            self.assertRaises(PasswordHasherBusy, self.hasher.hash, 'password123')
+        finally:
+            release.set()
+            worker.join()
+        # the slot is free again
+        self.assertTrue(self.hasher.hash('password123'))
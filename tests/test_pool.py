@@ -0,0 +1,74 @@
+""" /tests/test_pool.py"""
+import json
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+from app import db
+from app.pool import TimedQueuePool, pool_stats, pool_samples
+from tests.basetest import BaseTest
+
+
+class PoolTestCases(BaseTest):
+    """
+    Test pool options are read from the config
+    Test an external pooler disables the in-process pool
+    Test checkouts are measured
+    Test every engine reports its own checkouts
+    Test pool metrics endpoint
+    """
+
+    def engine_options(self, uri):
+        """Engine options the app would use for a database URI"""
+        options = {'pool_size': 4, 'max_overflow': 2, 'pool_timeout': 5}
+        db.apply_driver_hacks(self.app, make_url(uri), options)
+        return options
+
+    def test_pool_options(self):
+        """ Test a server database gets a timed pool with pre-ping"""
+        options = self.engine_options('postgresql://postgres@localhost/shop')
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['pool_size'], 4)
+
+    def test_external_pooler(self):
+        """ Test connections are not pooled behind PgBouncer"""
+        self.app.config['SQLALCHEMY_EXTERNAL_POOLER'] = True
+        options = self.engine_options('postgresql://postgres@localhost:6432/shop')
+        self.assertIs(options['poolclass'], NullPool)
+        self.assertNotIn('pool_size', options)
+
+    def test_checkout_measured(self):
+        """ Test every checkout from the pool is counted"""
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+        engine.connect().close()
+        engine.connect().close()
+        stats = pool_stats(engine)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['pool_class'], 'TimedQueuePool')
+        # the pool dispose() swaps in carries on counting
+        engine.dispose()
+        engine.connect().close()
+        self.assertEqual(pool_stats(engine)['checkouts'], 3)
+
+    def test_checkouts_per_engine(self):
+        """ Test each engine's checkouts are reported next to its own pool"""
+        primary = create_engine('sqlite://', poolclass=TimedQueuePool)
+        replica = create_engine('sqlite://', poolclass=TimedQueuePool, pool_size=2)
+        primary.connect().close()
+        connection = replica.connect()
+        samples = dict(((name, labels), value) for name, labels, value in
+                       pool_samples([('primary', primary), ('replica_0', replica)]))
+        connection.close()
+        self.assertEqual(samples[('db_pool_checkouts_total', (('bind', 'primary'),))], 1)
+        self.assertEqual(samples[('db_pool_checkouts_total', (('bind', 'replica_0'),))], 1)
+        self.assertEqual(samples[('db_pool_checked_out', (('bind', 'primary'),))], 0)
+        self.assertEqual(samples[('db_pool_checked_out', (('bind', 'replica_0'),))], 1)
+        self.assertEqual(samples[('db_pool_size', (('bind', 'replica_0'),))], 2)
+
+    def test_pool_metrics_endpoint(self):
+        """ Test the pool metrics are published"""
+        res = self.client().get('/metrics/pool')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("checkout_wait_seconds_max",
+                      json.dumps(json.loads(res.data.decode())['primary']))
@@ -0,0 +1,84 @@
+""" /tests/test_purge.py"""
+import json
+from datetime import datetime, timedelta
+from app import db
+from app.models import Shoppinglist, Shoppingitem
+from app.purge import purge
+from tests.basetest import BaseTest
+
+
+class PurgeTestCases(BaseTest):
+    """
+    Test deleted lists are hidden from every route at once
+    Test the purge removes deleted lists and their items in batches
+    """
+
+    def setUp(self):
+        super(PurgeTestCases, self).setUp()
+        self.app.config['RESPONSE_CACHE_ENABLED'] = False
+        self.app.config['SOFT_DELETE'] = True
+
+    def request(self, method, path, **data):
+        """Send a request as the test user"""
+        return getattr(self.client(), method)(
+            path, headers=dict(Authorization="Bearer " + self.access_token), data=data)
+
+    def delete_list_with_items(self, count=3):
+        """Create list 1 with count items and delete it"""
+        self.test_shoppinglist()
+        for number in range(count):
+            self.request('post', '/shoppinglists/1/items',
+                         name='Item {}'.format(number), price='10', quantity='1')
+        res = self.request('delete', '/shoppinglists/1')
+        self.assertEqual(res.status_code, 200)
+
+    def counts(self):
+        """Lists and items still stored, deleted or not"""
+        with self.app.app_context():
+            return Shoppinglist.query.count(), Shoppingitem.query.count()
+
+    def test_deleted_list_is_hidden(self):
+        """ Test a soft deleted list and its items are not found, DELETE"""
+        self.delete_list_with_items()
+        self.assertEqual(self.counts(), (1, 3))
+        for path in ('/shoppinglists/1', '/shoppinglists/1/items',
+                     '/shoppinglists/1/items?q=item', '/shoppinglists/1/items/1',
+                     '/shoppinglists/1/summary'):
+            self.assertEqual(self.request('get', path).status_code, 404, path)
+        self.assertEqual(self.request('put', '/shoppinglists/1/items/1',
+                                      name='Milk').status_code, 404)
+        self.assertEqual(self.request('post', '/shoppinglists/1/items', name='Milk',
+                                      price='10', quantity='1').status_code, 404)
+        listing = json.loads(self.request('get', '/shoppinglists/').data.decode())
+        self.assertNotIn('Back to school', json.dumps(listing))
+        exported = self.request('get', '/shoppinglists/export?format=csv').data.decode()
+        self.assertNotIn('Back to school', exported)
+
+    def test_deleted_name_can_be_reused(self):
+        """ Test the unique name index only covers live lists, POST"""
+        self.delete_list_with_items(count=0)
+        res = self.request('post', '/shoppinglists/', name='Back to school')
+        self.assertEqual(res.status_code, 201)
+
+    def test_purge_in_batches(self):
+        """ Test the purge removes items then lists a batch at a time"""
+        self.delete_list_with_items(count=5)
+        self.request('post', '/shoppinglists/', name='Groceries')
+        seen = []
+        with self.app.app_context():
+            totals = purge(2, progress=lambda totals: seen.append(dict(totals)))
+        self.assertEqual(totals, {'lists': 1, 'items': 5})
+        self.assertEqual([batch['items'] for batch in seen], [2, 4, 5, 5])
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_purge_waits_for_grace_period(self):
+        """ Test recently deleted lists are kept until the grace period ends"""
+        self.delete_list_with_items()
+        with self.app.app_context():
+            self.assertEqual(purge(100, grace=3600), {'lists': 0, 'items': 0})
+            # backdate the delete past the grace period
+            db.session.query(Shoppinglist).update(
+                {'deleted_at': datetime.utcnow() - timedelta(hours=2)},
+                synchronize_session=False)
+            db.session.commit()
+            self.assertEqual(purge(100, grace=3600), {'lists': 1, 'items': 3})
@@ -0,0 +1,113 @@
+""" /tests/test_replicas.py"""
+import os
+import json
+import tempfile
+from app import db
+from app.replicas import replicas, LocalBackend
+from tests.basetest import BaseTest
+
+
+class ReplicaTestCases(BaseTest):
+    """
+    Test GET requests read from the replica
+    Test writes and the reads right after them use the primary
+    Test a new user's first reads use the primary
+    Test pages read from a replica are not cached
+    Test reads stay on the primary when replica reads are disabled
+    """
+
+    def setUp(self):
+        super(ReplicaTestCases, self).setUp()
+        handle, self.replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.app.config['SQLALCHEMY_BINDS'] = {
+            'replica_0': 'sqlite:///' + self.replica_path}
+        replicas.backend = LocalBackend()
+        with self.app.app_context():
+            db.Model.metadata.create_all(db.get_engine(self.app, bind='replica_0'))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.get_engine(self.app, bind='replica_0').dispose()
+        os.remove(self.replica_path)
+        super(ReplicaTestCases, self).tearDown()
+
+    def get(self, path):
+        """GET a path as the test user"""
+        return self.client().get(
+            path, headers=dict(Authorization="Bearer " + self.access_token))
+
+    def replicate(self):
+        """Copy the primary's users and lists to the replica, as replication would"""
+        with self.app.app_context():
+            replica = db.get_engine(self.app, bind='replica_0')
+            for table in db.Model.metadata.sorted_tables:
+                if table.name in ('users', 'shoppinglists'):
+                    rows = [dict(row) for row in db.engine.execute(table.select())]
+                    replica.execute(table.delete())
+                    if rows:
+                        replica.execute(table.insert(), rows)
+
+    def test_read_after_write_uses_primary(self):
+        """ Test a user's reads stay on the primary right after their write, GET"""
+        res = self.test_shoppinglist()
+        self.assertEqual(res.status_code, 201)
+        # the replica has not caught up yet
+        self.assertEqual(self.get('/shoppinglists/1').status_code, 200)
+
+    def test_reads_after_register_use_primary(self):
+        """ Test the profile loads right after registering and logging in, GET"""
+        self.register_user()
+        res = self.login_user()
+        self.assertEqual(res.status_code, 200)
+        self.access_token = json.loads(res.data.decode())['access_token']
+        # the replica has not caught up with the new user yet
+        res = self.get('/user')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('test@gmail.com', res.data.decode())
+
+    def test_reads_use_replica(self):
+        """ Test GET requests read from the replica once the marker expires, GET"""
+        self.app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.test_shoppinglist()
+        # only on the primary
+        self.assertEqual(self.get('/shoppinglists/1').status_code, 404)
+        self.replicate()
+        res = self.get('/shoppinglists/1')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Back to school', res.data.decode())
+
+    def test_writes_use_primary(self):
+        """ Test writes land on the primary whatever the replica holds, PUT"""
+        self.app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.test_shoppinglist()
+        self.replicate()
+        res = self.client().put('/shoppinglists/1',
+                                headers=dict(Authorization="Bearer " + self.access_token),
+                                data={'name': 'Groceries'})
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            replica = db.get_engine(self.app, bind='replica_0')
+            self.assertEqual(db.engine.execute(
+                'SELECT name FROM shoppinglists').scalar(), 'Groceries')
+            self.assertEqual(replica.execute(
+                'SELECT name FROM shoppinglists').scalar(), 'Back to school')
+        self.assertIn('Back to school', self.get('/shoppinglists/1').data.decode())
+
+    def test_replica_pages_not_cached(self):
+        """ Test listings read from a replica never reach the response cache, GET"""
+        self.app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.test_shoppinglist()
+        self.replicate()
+        for _ in range(2):
+            res = self.get('/shoppinglists/')
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('X-Cache', res.headers)
+
+    def test_replica_reads_disabled(self):
+        """ Test every read uses the primary when replica reads are off, GET"""
+        self.app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.app.config['REPLICA_READS_ENABLED'] = False
+        self.test_shoppinglist()
+        # the replica is empty
+        self.assertEqual(self.get('/shoppinglists/1').status_code, 200)
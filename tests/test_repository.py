@@ -0,0 +1,82 @@
+""" /tests/test_repository.py"""
+import re
+import json
+from tests.basetest import BaseTest
+
+
+class RepositoryTestCases(BaseTest):
+    """
+    Test item listings check ownership and page in one query
+    Test item pages keep their links and 404s
+    Test items are only created in the user's own lists
+    """
+
+    def get(self, path, **headers):
+        """GET a path as the test user"""
+        headers['Authorization'] = "Bearer " + self.access_token
+        return self.client().get(path, headers=headers)
+
+    def add_item(self, name, sl_id=1):
+        """Create a shopping item"""
+        return self.client().post('/shoppinglists/{}/items'.format(sl_id),
+                                  headers=dict(Authorization="Bearer " + self.access_token),
+                                  data={'name': name, 'price': '10', 'quantity': '2'})
+
+    def queries(self, res):
+        """Statements a request ran, from its Server-Timing header"""
+        return int(re.search(r'desc="(\d+) queries"', res.headers['Server-Timing']).group(1))
+
+    def test_item_page_is_one_query(self):
+        """ Test an item page costs one statement besides the data version, GET"""
+        self.test_shoppingitem()
+        self.add_item('Milk')
+        self.get('/shoppinglists/1/items?limit=1')
+        for path in ('/shoppinglists/1/items?limit=1&page=2',
+                     '/shoppinglists/1/items?limit=1&cursor='):
+            res = self.get(path)
+            self.assertEqual(res.status_code, 200)
+            # the data version behind the ETag, then the page
+            self.assertEqual(self.queries(res), 2)
+
+    def test_item_pages(self):
+        """ Test page links and totals come from the same query, GET"""
+        self.test_shoppingitem()
+        self.add_item('Milk')
+        self.add_item('Eggs')
+        first = json.loads(self.get('/shoppinglists/1/items?limit=2').data.decode())
+        self.assertEqual([item['name'] for item in first['shopping_items']],
+                         ['Bread', 'Milk'])
+        self.assertEqual(first['next_page'], '/shoppinglists/1/items?limit=2&page=2')
+        self.assertEqual(first['previous_page'], 'None')
+        last = json.loads(self.get('/shoppinglists/1/items?limit=2&page=2').data.decode())
+        self.assertEqual([item['name'] for item in last['shopping_items']], ['Eggs'])
+        self.assertEqual(last['next_page'], 'None')
+        self.assertEqual(last['previous_page'], '/shoppinglists/1/items?limit=2&page=1')
+        self.assertEqual(self.get('/shoppinglists/1/items?limit=2&page=3').status_code, 404)
+
+    def test_empty_and_foreign_lists(self):
+        """ Test empty lists list no items and other lists are not found, GET"""
+        self.test_shoppinglist()
+        res = self.get('/shoppinglists/1/items')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data.decode())['shopping_items'],
+                         "You have no shopping items")
+        self.assertTrue(res.headers.get('ETag'))
+        for path in ('/shoppinglists/2/items', '/shoppinglists/2/items?cursor='):
+            res = self.get(path)
+            self.assertEqual(res.status_code, 404)
+            self.assertIn("No such shoppinglist", res.data.decode())
+
+    def test_create_in_foreign_list(self):
+        """ Test items are not created in lists the user does not own, POST"""
+        self.test_shoppinglist()
+        res = self.add_item('Milk', sl_id=2)
+        self.assertEqual(res.status_code, 404)
+        self.assertIn("No such shoppinglist", res.data.decode())
+        res = self.add_item('Milk')
+        self.assertEqual(res.status_code, 201)
+        created = json.loads(res.data.decode())
+        self.assertEqual(created['in_shoppinglist'], 1)
+        self.assertEqual(created['price'], 10.0)
+        self.assertTrue(created['date_created'].endswith('GMT'))
+        self.assertEqual(self.add_item('milk').status_code, 409)
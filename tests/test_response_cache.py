@@ -0,0 +1,140 @@
+""" /tests/test_response_cache.py"""
+import json
+import unittest
+from app import db
+from app.response_cache import RedisBackend, LocalBackend
+from tests.basetest import BaseTest
+
+
+class FakeRedis(object):
+    """In memory stand in for the parts of a Redis client the cache uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode('utf-8')
+        return True
+
+
+class ResponseCacheTestCases(BaseTest):
+    """
+    Test listing pages are served from the cache
+    Test every write of the owner retires their cached pages
+    Test writes made through another worker retire them too
+    """
+
+    def get(self, path, **headers):
+        """GET a path as the test user"""
+        headers['Authorization'] = "Bearer " + self.access_token
+        return self.client().get(path, headers=headers)
+
+    def test_listing_cached(self):
+        """ Test the second request of a page is a cache hit, GET"""
+        self.test_shoppingitem()
+        for path in ('/shoppinglists/?limit=2', '/shoppinglists/1/items?page=1'):
+            first = self.get(path)
+            self.assertEqual(first.headers['X-Cache'], 'MISS')
+            second = self.get(path)
+            self.assertEqual(second.headers['X-Cache'], 'HIT')
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(json.loads(second.data.decode()),
+                             json.loads(first.data.decode()))
+            self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+            # every query string is a page of its own
+            self.assertEqual(self.get(path + '&cursor=').headers['X-Cache'], 'MISS')
+
+    def test_cached_listing_not_modified(self):
+        """ Test a cache hit honours If-None-Match, GET"""
+        self.test_shoppingitem()
+        etag = self.get('/shoppinglists/1/items').headers['ETag']
+        res = self.get('/shoppinglists/1/items', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+    def test_writes_invalidate(self):
+        """ Test creating, editing and deleting rows retires cached pages, GET"""
+        self.test_shoppingitem()
+        headers = dict(Authorization="Bearer " + self.access_token)
+        self.get('/shoppinglists/')
+        self.get('/shoppinglists/1/items')
+        self.client().put('/shoppinglists/1', headers=headers, data={'name': 'Groceries'})
+        res = self.get('/shoppinglists/')
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(res.data.decode())['shopping_lists'][0]['name'],
+                         'Groceries')
+
+        self.client().post('/shoppinglists/1/items', headers=headers,
+                           data={'name': 'Milk', 'price': '20', 'quantity': '2'})
+        res = self.get('/shoppinglists/1/items')
+        self.assertEqual(len(json.loads(res.data.decode())['shopping_items']), 2)
+
+        self.client().post('/shoppinglists/1/items/batch', headers=headers,
+                           data=json.dumps({'operations': [{'op': 'delete', 'id': 2}]}),
+                           content_type='application/json')
+        res = self.get('/shoppinglists/1/items')
+        self.assertEqual(len(json.loads(res.data.decode())['shopping_items']), 1)
+
+        self.client().delete('/shoppinglists/1', headers=headers)
+        res = self.get('/shoppinglists/1/items')
+        self.assertEqual(res.status_code, 404)
+
+    def test_write_through_other_worker(self):
+        """ Test a write this process never saw still retires its page and ETag, GET"""
+        self.test_shoppinglist()
+        etag = self.get('/shoppinglists/').headers['ETag']
+        self.assertEqual(self.get('/shoppinglists/').headers['X-Cache'], 'HIT')
+        with self.app.app_context():
+            # another worker renames the list in the same second and counts the write
+            db.engine.execute("UPDATE shoppinglists SET name = 'Groceries'")
+            db.engine.execute('UPDATE users SET data_version = data_version + 1')
+        res = self.get('/shoppinglists/', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn('Groceries', res.data.decode())
+
+    def test_pages_per_user(self):
+        """ Test users never see each others cached pages, GET"""
+        self.test_shoppinglist()
+        self.get('/shoppinglists/')
+        other = {'email': 'other@gmail.com', 'password': 'password123'}
+        self.client().post('/auth/register/', data=other)
+        token = json.loads(self.client().post(
+            '/auth/login/', data=other).data.decode())['access_token']
+        res = self.client().get('/shoppinglists/',
+                                headers=dict(Authorization="Bearer " + token))
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(res.data.decode())['shopping_lists'],
+                         "You have no shopping lists")
+
+
+class BackendTestCases(unittest.TestCase):
+    """
+    Test both backends keep and expire pages
+    """
+
+    def check_backend(self, backend):
+        """Exercise the operations the cache relies on"""
+        backend.set('page:1', 'a')
+        backend.set('page:1', 'c')
+        self.assertEqual(backend.get('page:1'), 'c')
+        backend.set('page', '{}', 300)
+        self.assertEqual(backend.get('page'), '{}')
+        self.assertEqual(backend.get('missing'), None)
+
+    def test_local_backend(self):
+        """ Test the in-process backend"""
+        backend = LocalBackend(maxsize=2)
+        self.check_backend(backend)
+        backend.set('expired', 'x', ttl=-1)
+        self.assertEqual(backend.get('expired'), None)
+        backend.set('first', 'x')
+        backend.set('second', 'x')
+        self.assertEqual(backend.get('page:1'), None)
+
+    def test_redis_backend(self):
+        """ Test the Redis backend against a stand in client"""
+        self.check_backend(RedisBackend(FakeRedis()))
+
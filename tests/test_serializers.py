@@ -0,0 +1,106 @@
+""" /tests/test_serializers.py"""
+import json
+import unittest
+from datetime import datetime, timedelta, tzinfo
+from flask import Flask, json as flask_json
+from app import db, serializers
+from app.models import Shoppinglist, Shoppingitem
+from app.serializers import Serializer, SHOPPINGITEM, SHOPPINGLIST_SUMMARY, \
+    SHOPPINGITEM_SUMMARY, format_date
+from tests.basetest import BaseTest
+
+
+class EAT(tzinfo):
+    """UTC+3"""
+
+    def utcoffset(self, value):
+        return timedelta(hours=3)
+
+    def dst(self, value):
+        return timedelta(0)
+
+
+class Row(object):
+    """Stand in for a shopping item row"""
+    id = 7
+    name = 'Bread'
+    price = 50.0
+    quantity = 1.0
+    date_created = datetime(2017, 9, 16, 18, 0, 27)
+    date_modified = None
+    in_shoppinglist = 1
+    created_by = 2
+
+
+class SerializerTestCases(unittest.TestCase):
+    """
+    Test serialized rows match what jsonify produced
+    Test every installed backend encodes the same document
+    """
+
+    def test_dates_match_jsonify(self):
+        """ Test dates are formatted like Flask's JSON encoder"""
+        with Flask(__name__).app_context():
+            for value in (datetime(2017, 9, 16, 18, 0, 27), datetime(2020, 2, 29, 0, 0, 0)):
+                self.assertEqual(json.dumps(format_date(value)),
+                                 flask_json.dumps(value))
+        self.assertEqual(format_date(datetime(2017, 9, 16, 21, 0, 27, tzinfo=EAT())),
+                         'Sat, 16 Sep 2017 18:00:27 GMT')
+
+    def test_dump(self):
+        """ Test a row is dumped with every field"""
+        self.assertEqual(SHOPPINGITEM.dump(Row()), {
+            'id': 7, 'name': 'Bread', 'price': 50.0, 'quantity': 1.0,
+            'date_created': 'Sat, 16 Sep 2017 18:00:27 GMT', 'date_modified': None,
+            'in_shoppinglist': 1, 'created_by': 2})
+        self.assertEqual(Serializer(('id', 'name')).dump_many([Row(), Row()]),
+                         [{'id': 7, 'name': 'Bread'}] * 2)
+
+    def test_backends(self):
+        """ Test every installed backend writes compact JSON with sorted keys"""
+        data = {'b': [SHOPPINGITEM.dump(Row())], 'a': '/shoppinglists/?page=2'}
+        expected = json.dumps(data, sort_keys=True, separators=(',', ':')).encode()
+        for name in serializers.BACKENDS:
+            if serializers.AVAILABLE[name]:
+                self.assertEqual(serializers.BACKENDS[name](data), expected, name)
+
+    def test_unknown_backend(self):
+        """ Test asking for a backend that doesn't exist fails at startup"""
+        self.assertRaises(ValueError, serializers.use_json_backend, 'yaml')
+
+
+class SerializedResponseTestCases(BaseTest):
+    """
+    Test the routes respond with compact JSON
+    """
+
+    def test_compact_responses(self):
+        """ Test entity responses are compact and complete, GET"""
+        self.test_shoppingitem()
+        res = self.client().get('/shoppinglists/1/items/1',
+                                headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertEqual(res.headers['Content-Type'], 'application/json')
+        self.assertNotIn(b'\n', res.data)
+        result = json.loads(res.data.decode())
+        self.assertEqual(sorted(result), sorted(SHOPPINGITEM.fields))
+        self.assertEqual(result['price'], 50.0)
+        self.assertTrue(result['date_created'].endswith(' GMT'))
+
+
+class ProjectedListingTestCases(BaseTest):
+    """
+    Test listings select only the columns they show
+    """
+
+    def test_summaries_skip_entities(self):
+        """ Test summary queries return rows without loading entities"""
+        self.test_shoppingitem()
+        with self.app.app_context():
+            db.session.remove()
+            lists = Shoppinglist.get_all_summaries(1).all()
+            items = Shoppingitem.get_all_item_summaries(1, 1).all()
+            self.assertEqual(len(db.session.identity_map), 0)
+            self.assertEqual(SHOPPINGITEM_SUMMARY.dump_rows(items), [
+                {'id': 1, 'name': 'Bread', 'price': 50.0, 'quantity': 1.0}])
+            self.assertEqual(SHOPPINGLIST_SUMMARY.dump_rows(lists),
+                             SHOPPINGLIST_SUMMARY.dump_many(Shoppinglist.get_all(1)))
@@ -0,0 +1,238 @@
+""" /tests/test_shards.py"""
+import os
+import re
+import json
+import tempfile
+import unittest
+from app import db
+from app.rebalance import TABLES, init_shards, rebalance
+from app.shards import HashRing, shards
+from tests.basetest import BaseTest
+
+
+class HashRingTestCases(unittest.TestCase):
+    """
+    Test the ring places keys the same way every time
+    Test adding a node only moves keys to that node
+    """
+
+    def test_ring_is_deterministic(self):
+        """ Test two rings over the same nodes agree on every key"""
+        first = HashRing(['shard_0', 'shard_1', 'shard_2'])
+        second = HashRing(['shard_2', 'shard_0', 'shard_1'])
+        placed = [first.node(key) for key in range(1000)]
+        self.assertEqual(placed, [second.node(key) for key in range(1000)])
+        self.assertEqual(set(placed), set(['shard_0', 'shard_1', 'shard_2']))
+
+    def test_new_node_only_takes_keys(self):
+        """ Test keys only move to the added node"""
+        before = HashRing(['shard_0', 'shard_1'])
+        after = HashRing(['shard_0', 'shard_1', 'shard_2'])
+        moved = [key for key in range(1000) if before.node(key) != after.node(key)]
+        self.assertTrue(moved)
+        self.assertEqual(set(after.node(key) for key in moved), set(['shard_2']))
+        # roughly its share
+        self.assertLess(len(moved), 500)
+
+
+class ShardTestCases(BaseTest):
+    """
+    Test lists and items are stored on their owner's shard
+    Test the rebalance moves users to a new shard
+    Test users keep their lists until they are moved
+    Test the shard is cached with the access token
+    Test list reads go to the shard even with read replicas
+    Test searches use the shard's search backend
+    """
+
+    def setUp(self):
+        super(ShardTestCases, self).setUp()
+        self.shard_paths = []
+        self.app.config['RESPONSE_CACHE_ENABLED'] = False
+        self.app.config['SHARD_MOVE_FENCE_SECONDS'] = 0
+        self.add_shard()
+
+    def tearDown(self):
+        with self.app.app_context():
+            for bind in shards.ring.nodes:
+                db.get_engine(self.app, bind=bind).dispose()
+        for path in self.shard_paths:
+            os.remove(path)
+        shards.ring = None
+        super(ShardTestCases, self).tearDown()
+
+    def add_shard(self):
+        """Add an SQLite shard and create its tables"""
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.shard_paths.append(path)
+        binds = dict(self.app.config.get('SQLALCHEMY_BINDS') or {})
+        binds['shard_{}'.format(len(self.shard_paths) - 1)] = 'sqlite:///' + path
+        self.app.config['SQLALCHEMY_BINDS'] = binds
+        shards.init_app(self.app)
+        with self.app.app_context():
+            init_shards(self.app)
+
+    def request(self, method, path, **data):
+        """Send a request as the test user"""
+        return getattr(self.client(), method)(
+            path, headers=dict(Authorization="Bearer " + self.access_token), data=data)
+
+    def count(self, bind, table):
+        """Rows of a table on a shard"""
+        with self.app.app_context():
+            return db.get_engine(self.app, bind=bind).execute(
+                'SELECT count(*) FROM {}'.format(table)).scalar()
+
+    def test_writes_land_on_shard(self):
+        """ Test lists and items are stored on the shard and read back, POST"""
+        res = self.test_shoppingitem()
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.count('shard_0', 'shoppinglists'), 1)
+        self.assertEqual(self.count('shard_0', 'shoppingitems'), 1)
+        with self.app.app_context():
+            self.assertEqual(db.engine.execute(
+                'SELECT count(*) FROM shoppinglists').scalar(), 0)
+            # users stay in the primary
+            self.assertEqual(db.engine.execute('SELECT count(*) FROM users').scalar(), 1)
+        res = self.request('get', '/shoppinglists/1/items')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Bread', res.data.decode())
+        listing = json.loads(self.request('get', '/shoppinglists/').data.decode())
+        self.assertIn('Back to school', json.dumps(listing))
+
+    def test_query_needs_shard(self):
+        """ Test a list query outside a request must pick a shard"""
+        from app.models import Shoppinglist
+        with self.app.app_context():
+            self.assertRaises(RuntimeError, Shoppinglist.query.count)
+            with shards.using('shard_0'):
+                self.assertEqual(Shoppinglist.query.count(), 0)
+
+    def placement(self):
+        """The test user's recorded shard and moving flag"""
+        with self.app.app_context():
+            return tuple(db.engine.execute(
+                'SELECT shard, shard_moving FROM users WHERE id = 1').first())
+
+    def ring_moves_user(self):
+        """Add a shard and find a ring under which the test user belongs on it"""
+        self.test_shoppingitem()
+        self.add_shard()
+        while shards.shard_for(1) != 'shard_1':
+            self.app.config['SHARD_VNODES'] += 1
+            shards.init_app(self.app)
+
+    def assert_reads_items(self):
+        """Assert the test user still reads their item"""
+        res = self.request('get', '/shoppinglists/1/items')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Bread', res.data.decode())
+
+    def test_rebalance_moves_user(self):
+        """ Test the rebalance moves a user to the shard the ring now picks"""
+        self.ring_moves_user()
+        # the record, not the ring, routes the user until they are moved
+        self.assertEqual(self.placement(), ('shard_0', False))
+        self.assert_reads_items()
+        with self.app.app_context():
+            self.assertEqual(rebalance(self.app, dry_run=True)['users'], 0)
+            self.assertEqual(self.count('shard_0', 'shoppinglists'), 1)
+            totals = rebalance(self.app)
+        self.assertEqual(totals, {'users': 1, 'lists': 1, 'items': 1, 'placed': 0,
+                                  'conflicts': []})
+        self.assertEqual(self.placement(), ('shard_1', False))
+        self.assertEqual(self.count('shard_0', 'shoppinglists'), 0)
+        self.assertEqual(self.count('shard_1', 'shoppingitems'), 1)
+        self.assert_reads_items()
+
+    def test_rebalance_finishes_cut_short_run(self):
+        """ Test a rerun after a copy or a switch of shard was cut short converges"""
+        self.ring_moves_user()
+        with self.app.app_context():
+            source = db.get_engine(self.app, bind='shard_0')
+            target = db.get_engine(self.app, bind='shard_1')
+            for table in TABLES:
+                target.execute(table.insert(), [dict(row) for row in
+                                                source.execute(table.select())])
+            db.engine.execute('UPDATE users SET shard_moving = 1')
+            totals = rebalance(self.app)
+        self.assertEqual(totals['users'], 1)
+        self.assertEqual(self.count('shard_1', 'shoppinglists'), 1)
+        self.assertEqual(self.count('shard_1', 'shoppingitems'), 1)
+        self.assertEqual(self.count('shard_0', 'shoppingitems'), 0)
+        # switched to the target but the source rows were never deleted
+        with self.app.app_context():
+            for table in TABLES:
+                source.execute(table.insert(), [dict(row) for row in
+                                                target.execute(table.select())])
+            totals = rebalance(self.app)
+        self.assertEqual(totals['users'], 0)
+        self.assertEqual(self.count('shard_0', 'shoppinglists'), 0)
+        self.assertEqual(self.count('shard_1', 'shoppinglists'), 1)
+        self.assertEqual(self.placement(), ('shard_1', False))
+
+    def test_rebalance_ids_taken(self):
+        """ Test a user whose ids are taken on the target stays put"""
+        self.ring_moves_user()
+        with self.app.app_context():
+            db.get_engine(self.app, bind='shard_1').execute(
+                "INSERT INTO shoppinglists (id, name, created_by) VALUES (1, 'Taken', 2)")
+            totals = rebalance(self.app)
+            self.assertEqual(totals['conflicts'], [1])
+        self.assertEqual(self.placement(), ('shard_0', False))
+        self.assertEqual(self.count('shard_1', 'shoppinglists'), 1)
+        self.assert_reads_items()
+
+    def test_moving_user_writes_refused(self):
+        """ Test writes of a user being moved get a 503 while reads go on"""
+        self.test_shoppingitem()
+        with self.app.app_context():
+            db.engine.execute('UPDATE users SET shard_moving = 1')
+        # the rebalance waits this long for cached shards to expire
+        self.app.extensions['token_cache'].clear()
+        res = self.request('post', '/shoppinglists/', name='Groceries')
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '5')
+        self.assert_reads_items()
+
+    def test_shard_cached_with_token(self):
+        """ Test a cached token skips the shard lookup until the user is moved, GET"""
+        self.ring_moves_user()
+        res = self.request('get', '/shoppinglists/1/items')
+        # the data version behind the ETag, then the page
+        self.assertEqual(re.search(r'desc="(\d+) queries"',
+                                   res.headers['Server-Timing']).group(1), '2')
+        with self.app.app_context():
+            rebalance(self.app)
+        # the cached shard_0 was dropped with the move
+        self.assert_reads_items()
+
+    def test_list_reads_skip_replicas(self):
+        """ Test list and item reads go to the shard while the user is read from a replica, GET"""
+        self.test_shoppingitem()
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.shard_paths.append(path)
+        self.app.config['SQLALCHEMY_BINDS']['replica_0'] = 'sqlite:///' + path
+        with self.app.app_context():
+            # a replica of the primary, which holds the users but no lists
+            replica = db.get_engine(self.app, bind='replica_0')
+            db.Model.metadata.create_all(replica)
+            users = db.Model.metadata.tables['users']
+            replica.execute(users.insert(), [dict(row) for row in
+                                             db.engine.execute(users.select())])
+        self.app.config['REPLICA_STICKY_SECONDS'] = 0
+        self.app.extensions['token_cache'].clear()
+        self.assert_reads_items()
+
+    def test_search_uses_shard_backend(self):
+        """ Test a search picks the backend of the shard it runs on"""
+        from app.models import Shoppinglist
+        from app.search import ranked
+        with self.app.app_context():
+            db.get_engine(self.app, bind='shard_0').dialect.fts5_available = False
+            with shards.using('shard_0'):
+                statement = str(ranked(Shoppinglist.query, Shoppinglist, 'milk'))
+        self.assertNotIn('_fts', statement)
+        self.assertIn('LIKE', statement.upper())
@@ -1,4 +1,5 @@
 """ test_shoppingitems.py """
+import json
 from tests.basetest import BaseTest
 
 
@@ -66,6 +67,40 @@ class ShoppingItemsTestCases(BaseTest):
                                      headers=dict(Authorization="Bearer " + self.access_token))
         self.assertIn("item name does not exist", str(response.data))
 
+    def test_shoppingitem_search_paginated(self):
+        """ Test API limits search results to the requested page, GET"""
+        # create items
+        self.test_shoppingitem()
+        self.client().post("/shoppinglists/1/items",
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Brown bread', 'price': '60', 'quantity': '1'})
+        # Search item
+        response = self.client().get("/shoppinglists/1/items?q=bread&limit=1&page=2",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertEqual(len(json.loads(response.data.decode())), 1)
+        # Search past the last page
+        response = self.client().get("/shoppinglists/1/items?q=bread&limit=1&page=3",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertIn("item name does not exist", str(response.data))
+
+    def test_shoppingitem_cursor_pagination(self):
+        """ Test API can page through shopping items with a cursor, GET"""
+        # create items
+        self.test_shoppingitem()
+        self.client().post("/shoppinglists/1/items",
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Milk', 'price': '60', 'quantity': '1'})
+        response = self.client().get("/shoppinglists/1/items?limit=1&cursor=",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        result = json.loads(response.data.decode())
+        self.assertEqual(result['shopping_items'][0]['name'], 'Bread')
+        response = self.client().get(
+            "/shoppinglists/1/items?limit=1&cursor=" + result['next_cursor'],
+            headers=dict(Authorization="Bearer " + self.access_token))
+        result = json.loads(response.data.decode())
+        self.assertEqual(result['shopping_items'][0]['name'], 'Milk')
+        self.assertEqual(result['next_cursor'], 'None')
+
     def test_api_can_get_shoppingitems(self):
         """ Test API can get a shoppingitems, GET """
         # create an item
@@ -194,6 +229,21 @@ class ShoppingItemsTestCases(BaseTest):
                                  data=item)
         self.assertIn("sugar", str(res2.data))
 
+    def test_api_edit_to_existing_item_name(self):
+        """ Test API cannot rename an item to an existing item name """
+        # create an item
+        self.test_shoppingitem()
+        self.client().post("/shoppinglists/1/items",
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Sugar', 'price': '20', 'quantity': '1'})
+        # edit item
+        res2 = self.client().put("/shoppinglists/1/items/2",
+                                 headers=dict(
+                                     Authorization="Bearer " + self.access_token),
+                                 data={'name': 'bread'})
+        self.assertEqual(res2.status_code, 409)
+        self.assertIn("Item name already exists", str(res2.data))
+
     def test_api_can_edit_non_existing_item(self):
         """ Test API can edit a non existing item """
         item = {'name': 'sugar'}
@@ -66,6 +66,63 @@ class ShoppinglistTestCase(BaseTest):
                                      headers=dict(Authorization="Bearer " + self.access_token))
         self.assertIn("name does not exist", str(response.data))
 
+    def test_shoppinglist_search_is_ranked_and_paginated(self):
+        """ Test API returns the best search match first, one page at a time, GET"""
+        # create shopping lists
+        self.test_shoppinglist()
+        for name in ['Easter shopping', 'Back']:
+            self.client().post('/shoppinglists/',
+                               headers=dict(Authorization="Bearer " + self.access_token),
+                               data={'name': name})
+        # Search shopping list, first page
+        response = self.client().get("/shoppinglists/?q=back&limit=1",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        results = json.loads(response.data.decode())
+        self.assertEqual([result['name'] for result in results], ['Back'])
+        # Search shopping list, second page
+        response = self.client().get("/shoppinglists/?q=back&limit=1&page=2",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        results = json.loads(response.data.decode())
+        self.assertEqual([result['name'] for result in results], ['Back to school'])
+
+    def test_shoppinglist_search_wildcard(self):
+        """ Test API matches search wildcards literally, GET"""
+        # create a shoppinglist
+        self.test_shoppinglist()
+        response = self.client().get("/shoppinglists/?q=%25",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertEqual(response.status_code, 404)
+
+    def test_shoppinglist_cursor_pagination(self):
+        """ Test API can page through shopping lists with a cursor, GET"""
+        # create shopping lists
+        self.test_shoppinglist()
+        self.client().post('/shoppinglists/',
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Easter shopping'})
+        # first page
+        response = self.client().get("/shoppinglists/?limit=1&cursor=",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        result = json.loads(response.data.decode())
+        self.assertEqual(result['shopping_lists'][0]['name'], 'Back to school')
+        self.assertNotIn('next_page', result)
+        # second and last page
+        response = self.client().get(
+            "/shoppinglists/?limit=1&cursor=" + result['next_cursor'],
+            headers=dict(Authorization="Bearer " + self.access_token))
+        result = json.loads(response.data.decode())
+        self.assertEqual(result['shopping_lists'][0]['name'], 'Easter shopping')
+        self.assertEqual(result['next_cursor'], 'None')
+
+    def test_shoppinglist_invalid_cursor(self):
+        """ Test invalid cursor provided, GET"""
+        # create a shoppinglist
+        self.test_shoppinglist()
+        response = self.client().get("/shoppinglists/?cursor=bogus",
+                                     headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid cursor", str(response.data))
+
     def test_api_can_get_shoppinglists(self):
         """Test API can get all shoppinglist, GET """
         # create a shoppinglist
@@ -112,6 +169,32 @@ class ShoppinglistTestCase(BaseTest):
         response2 = self.test_shoppinglist()
         self.assertIn("List name already exists", str(response2.data))
 
+    def test_list_creation_twice_different_case(self):
+        """ Test API treats list names differing only in case as the same """
+        self.test_shoppinglist()
+        response = self.client().post('/shoppinglists/',
+                                      headers=dict(
+                                          Authorization="Bearer " + self.access_token),
+                                      data={'name': 'BACK TO SCHOOL'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("List name already exists", str(response.data))
+
+    def test_shoppinglist_edit_to_existing_name(self):
+        """Test API gives an error when renaming to an existing list name, PUT"""
+        self.test_shoppinglist()
+        self.client().post('/shoppinglists/',
+                           headers=dict(Authorization="Bearer " + self.access_token),
+                           data={'name': 'Easter shopping'})
+        response = self.client().put(
+            '/shoppinglists/2', headers=dict(Authorization="Bearer " + self.access_token),
+            data={'name': 'back to school'})
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("List name already exists", str(response.data))
+        # the list keeps its name
+        res = self.client().get('/shoppinglists/2',
+                                headers=dict(Authorization="Bearer " + self.access_token))
+        self.assertIn('Easter shopping', str(res.data))
+
     def test_api_can_get_list_by_id(self):
         """Test API can get a single shoppinglist by using it's id, GET"""
 
@@ -174,3 +257,18 @@ class ShoppinglistTestCase(BaseTest):
         result = self.client().get('/shoppinglists/1',
                                    headers=dict(Authorization="Bearer " + access_token))
         self.assertEqual(result.status_code, 404)
+
+    def test_shoppinglist_deletion_cascades_to_items(self):
+        """ Test the database deletes a list's items without loading them, DELETE"""
+        self.test_shoppingitem()
+        headers = dict(Authorization="Bearer " + self.access_token)
+        self.client().post('/shoppinglists/1/items', headers=headers,
+                           data={'name': 'Milk', 'price': '20', 'quantity': '1'})
+        result = self.client().delete('/shoppinglists/1', headers=headers)
+        self.assertEqual(result.status_code, 200)
+        # the list lookup, its DELETE and the count of the write, no item is
+        # selected or deleted by id
+        self.assertIn('desc="3 queries"', result.headers['Server-Timing'])
+        with self.app.app_context():
+            from app.models import Shoppingitem
+            self.assertEqual(Shoppingitem.query.count(), 0)
@@ -0,0 +1,77 @@
+""" /tests/test_summary.py"""
+import json
+from tests.basetest import BaseTest
+
+
+class SummaryTestCases(BaseTest):
+    """
+    Test item totals of shopping lists
+    """
+
+    def get(self, path, **headers):
+        """GET a path as the test user"""
+        headers['Authorization'] = "Bearer " + self.access_token
+        return self.client().get(path, headers=headers)
+
+    def add_item(self, name, price, quantity, sl_id=1):
+        """Create a shopping item"""
+        return self.client().post('/shoppinglists/{}/items'.format(sl_id),
+                                  headers=dict(Authorization="Bearer " + self.access_token),
+                                  data={'name': name, 'price': price, 'quantity': quantity})
+
+    def test_list_summary(self):
+        """ Test API sums the items of a shopping list, GET"""
+        self.test_shoppingitem()
+        self.add_item('Milk', '20', '3')
+        res = self.get('/shoppinglists/1/summary')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data.decode()), {
+            'id': 1, 'name': 'Back to school', 'item_count': 2,
+            'total_quantity': 4.0, 'total_cost': 110.0})
+
+    def test_empty_and_missing_list(self):
+        """ Test API summarizes empty lists and rejects other lists, GET"""
+        self.test_shoppinglist()
+        result = json.loads(self.get('/shoppinglists/1/summary').data.decode())
+        self.assertEqual(result['item_count'], 0)
+        self.assertEqual(result['total_cost'], 0.0)
+        self.assertEqual(self.get('/shoppinglists/2/summary').status_code, 404)
+
+    def test_listing_include_summary(self):
+        """ Test API adds totals to listed shopping lists on request, GET"""
+        self.test_shoppingitem()
+        headers = dict(Authorization="Bearer " + self.access_token)
+        self.client().post('/shoppinglists/', headers=headers, data={'name': 'Party'})
+        self.add_item('Soda', '60', '2', sl_id=2)
+        plain = json.loads(self.get('/shoppinglists/').data.decode())
+        self.assertNotIn('summary', plain['shopping_lists'][0])
+        for path in ('/shoppinglists/?include=summary',
+                     '/shoppinglists/?include=summary&cursor=',
+                     '/shoppinglists/?include=summary&q=party'):
+            result = json.loads(self.get(path).data.decode())
+            lists = result if isinstance(result, list) else result['shopping_lists']
+            summaries = dict((item['id'], item['summary']) for item in lists)
+            self.assertEqual(summaries[2], {'item_count': 1, 'total_quantity': 2.0,
+                                            'total_cost': 120.0})
+            if 1 in summaries:
+                self.assertEqual(summaries[1]['total_cost'], 50.0)
+
+    def test_summary_listing_revalidated_on_item_writes(self):
+        """ Test item writes change the ETag of listings with totals, GET"""
+        self.test_shoppingitem()
+        etag = self.get('/shoppinglists/?include=summary').headers['ETag']
+        self.add_item('Milk', '20', '3')
+        res = self.get('/shoppinglists/?include=summary', **{'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        summary = json.loads(res.data.decode())['shopping_lists'][0]['summary']
+        self.assertEqual(summary['item_count'], 2)
+
+    def test_summary_listing_not_modified(self):
+        """ Test unchanged listings with totals are answered with 304, GET"""
+        self.test_shoppingitem()
+        for path in ('/shoppinglists/?include=summary',
+                     '/shoppinglists/?include=summary&cursor='):
+            res = self.get(path)
+            self.assertNotIn('Last-Modified', res.headers)
+            res = self.get(path, **{'If-None-Match': res.headers['ETag']})
+            self.assertEqual(res.status_code, 304)
@@ -0,0 +1,49 @@
+""" /tests/test_token_cache.py"""
+import time
+import unittest
+from app.token_cache import TokenCache, Principal
+
+
+class TokenCacheTestCases(unittest.TestCase):
+    """
+    Test cached tokens are returned
+    Test entries expire with their token
+    Test least recently used tokens are evicted
+    Test a user's tokens are invalidated
+    """
+
+    def setUp(self):
+        self.cache = TokenCache(maxsize=2, ttl=60)
+        self.claims = {'sub': 1, 'exp': time.time() + 600}
+        self.principal = Principal(id=1, email='test@gmail.com')
+
+    def test_get_cached_token(self):
+        """ Test a cached token returns its claims and principal"""
+        self.cache.set('token', self.claims, self.principal)
+        self.assertEqual(self.cache.get('token'), (self.claims, self.principal))
+        self.assertIsNone(self.cache.get('other'))
+
+    def test_entry_expires_with_token(self):
+        """ Test an entry does not outlive its token's exp claim"""
+        self.claims['exp'] = time.time() - 1
+        self.cache.set('token', self.claims, self.principal)
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_least_recently_used_evicted(self):
+        """ Test the least recently used token is evicted when full"""
+        self.cache.set('first', self.claims, self.principal)
+        self.cache.set('second', self.claims, self.principal)
+        # touch the first token so the second is the oldest
+        self.cache.get('first')
+        self.cache.set('third', self.claims, self.principal)
+        self.assertIsNotNone(self.cache.get('first'))
+        self.assertIsNone(self.cache.get('second'))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_invalidate_user(self):
+        """ Test every token of a user is dropped"""
+        self.cache.set('first', self.claims, self.principal)
+        self.cache.set('second', self.claims, Principal(id=2, email='a@b.com'))
+        self.cache.invalidate_user(1)
+        self.assertIsNone(self.cache.get('first'))
+        self.assertIsNotNone(self.cache.get('second'))